@@ -0,0 +1,177 @@
+"""
+Benchmark remote COG reads with GDAL's defaults against `gis_utils.io_profile.REMOTE_IO_PROFILE` and the disk
+block cache of `gis_utils.block_cache`.
+
+A synthetic COG is served by a local HTTP server that supports range requests, counts every request and adds a
+fixed delay to each one to stand in for the round trip to S3. Each configuration runs in a fresh process (so no
+GDAL cache is shared) and does what the DEM and SLGA readers do: open the COG, read a window at full resolution
+and read a larger window decimated from an overview. The "cache" runs all read the same URL through one cache
+directory: the first run is cold, the following ones are what a warm container sees.
+
+Usage:
+    python benchmarks/bench_remote_io.py [--size 8192] [--latency-ms 20] [--repeat 3] [--verbose]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Static file handler with single range support, request counting and a fixed per-request delay."""
+
+    latency = 0.0
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _record(self, sent):
+        with self.lock:
+            self.requests.append((self.command, self.path, self.headers.get("Range"), sent))
+
+    def do_HEAD(self):
+        time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self._record(0)
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self._record(0)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self._record(0)
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        byte_range = self.headers.get("Range")
+        if byte_range:
+            first, last = byte_range.split("=")[1].split(",")[0].split("-")
+            start, end = int(first), min(size - 1, int(last) if last else size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        with open(path, "rb") as f:
+            f.seek(start)
+            self.wfile.write(f.read(end - start + 1))
+        self._record(end - start + 1)
+
+
+def make_cog(workdir, size):
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[0:size, 0:size]
+    data = (rows + cols + rng.normal(0, 5, (size, size))).astype("float32")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": size,
+        "height": size,
+        "crs": "EPSG:4326",
+        "transform": from_origin(116.0, -29.0, 1 / 3600, 1 / 3600),
+        "nodata": -9999,
+    }
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dataset:
+            dataset.write(data, 1)
+        with memfile.open() as dataset:
+            cog_translate(dataset, os.path.join(workdir, "dem.tif"), cog_profiles.get("deflate"), quiet=True)
+
+
+def _run(name, url, size, cache_dir, queue):
+    from gis_utils.block_cache import BlockCache, open_raster
+    from gis_utils.io_profile import remote_io
+
+    env = rasterio.Env(AWS_NO_SIGN_REQUEST="YES") if name == "defaults" else remote_io()
+    start = time.perf_counter()
+    with env:
+        with open_raster(url, BlockCache(cache_dir), use_cache=name == "cache") as src:
+            opened = time.perf_counter() - start
+            src.read(1, window=Window(size // 4, size // 4, 1024, 1024))
+            src.read(1, window=Window(0, 0, size // 2, size // 2), out_shape=(512, 512))
+    queue.put((opened, time.perf_counter() - start))
+
+
+def run_isolated(name, url, size, cache_dir):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, url, size, cache_dir, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"{name} run failed with exit code {proc.exitcode}")
+    return queue.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--verbose", action="store_true", help="list every request")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_remote_io_")
+    cache_dir = tempfile.mkdtemp(prefix="bench_block_cache_")
+    RangeRequestHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), lambda *a, **kw: RangeRequestHandler(*a, directory=workdir, **kw)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        make_cog(workdir, args.size)
+        print(f"COG {args.size}x{args.size} float32, {args.latency_ms:g} ms per request")
+        for name in ("defaults", "profile", "cache"):
+            for run in range(args.repeat):
+                RangeRequestHandler.requests.clear()
+                # a new directory per run, so no cache is reused, except by the block cache runs. Not a query
+                # string: GDAL skips the directory listing for URLs with one, which real S3 object URLs don't have
+                run_dir = name if name == "cache" else f"{name}{run}"
+                if not os.path.exists(os.path.join(workdir, run_dir)):
+                    os.makedirs(os.path.join(workdir, run_dir))
+                    os.link(os.path.join(workdir, "dem.tif"), os.path.join(workdir, run_dir, "dem.tif"))
+                url = f"http://127.0.0.1:{server.server_port}/{run_dir}/dem.tif"
+                opened, elapsed = run_isolated(name, url, args.size, cache_dir)
+                requests = RangeRequestHandler.requests
+                sent = sum(r[3] for r in requests) / 1024 / 1024
+                print(
+                    f"{name:>9} run {run}: {len(requests):3d} requests {sent:6.2f} MB  "
+                    f"open {opened * 1000:6.0f} ms  total {elapsed * 1000:6.0f} ms"
+                )
+                if args.verbose:
+                    for command, path, byte_range, _ in requests:
+                        print(f"    {command} {path} {byte_range or ''}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
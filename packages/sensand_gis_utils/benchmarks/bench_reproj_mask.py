@@ -0,0 +1,155 @@
+"""
+Benchmark `reproj_mask` against the single-pass `reproj_mask_windowed` engine.
+
+A synthetic EPSG:4326 raster is written to a temporary directory and masked to a polygon covering part of it
+with both functions, reprojecting to `--crs` (EPSG:3857 by default, EPSG:4326 keeps the source CRS). Each run happens in a fresh process so that wall time and peak resident memory are measured
+independently, and the two `_masked.tiff` outputs are compared pixel for pixel (the polygon edges run
+through pixel corners, where the two may only differ on the boundary).
+
+Usage:
+    python benchmarks/bench_reproj_mask.py [--size 4000] [--dtype uint16] [--resample] [--chunks 512] [--crs EPSG:4326]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon, box
+
+
+def make_inputs(workdir, size, dtype):
+    """Write the synthetic raster and return the geometry used to mask it."""
+    rng = np.random.default_rng(42)
+    nodata = 65535 if dtype == "uint16" else np.nan
+    data = rng.integers(0, 5000, size=(1, size, size)).astype(dtype)
+    data[:, : size // 20, :] = nodata
+
+    res = 1 / 3600  # 1 arcsecond, as served by the DEM and SLGA WCS endpoints
+    transform = from_origin(116.0, -29.0, res, res)
+    profile = {
+        "driver": "GTiff",
+        "dtype": dtype,
+        "count": 1,
+        "width": size,
+        "height": size,
+        "crs": "EPSG:4326",
+        "transform": transform,
+        "nodata": nodata,
+        "tiled": True,
+    }
+    with rasterio.open(os.path.join(workdir, "bench.tiff"), "w", **profile) as dst:
+        dst.write(data)
+
+    extent = size * res
+    polygon = Polygon(
+        [
+            (116.0 + 0.10 * extent, -29.0 - 0.05 * extent),
+            (116.0 + 0.55 * extent, -29.0 - 0.20 * extent),
+            (116.0 + 0.60 * extent, -29.0 - 0.70 * extent),
+            (116.0 + 0.20 * extent, -29.0 - 0.55 * extent),
+        ]
+    )
+    return gpd.GeoDataFrame(geometry=[polygon], crs="EPSG:4326")
+
+
+def _run(name, workdir, geom, crs, resample, chunks, queue):
+    from geodata_fetch.utils import reproj_mask, reproj_mask_windowed
+
+    outdir = os.path.join(workdir, name)
+    os.makedirs(outdir, exist_ok=True)
+    start = time.perf_counter()
+    if name == "reproj_mask":
+        reproj_mask("bench.tiff", workdir, geom, crs, outdir, resample=resample)
+    else:
+        reproj_mask_windowed(
+            "bench.tiff", workdir, geom, crs, outdir, resample=resample, chunks=chunks
+        )
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((elapsed, peak_mb))
+
+
+def run_isolated(name, workdir, geom, crs, resample, chunks):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run, args=(name, workdir, geom, crs, resample, chunks, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"{name} run failed with exit code {proc.exitcode}")
+    return queue.get()
+
+
+def compare(path_a, path_b, geom):
+    """
+    Compare the outputs, returning the number of differing pixels. Only pixels the geometry boundary passes
+    through exactly may differ, where all_touched rounds differently in a window than on the whole grid, which
+    can also add or drop an edge row or column of such pixels.
+    """
+    with rasterio.open(path_a) as a, rasterio.open(path_b) as b:
+        assert a.crs == b.crs, f"crs differs: {a.crs} != {b.crs}"
+        assert abs(a.height - b.height) <= 1 and abs(a.width - b.width) <= 1, (
+            f"shape differs: {a.shape} != {b.shape}"
+        )
+        assert a.transform.almost_equals(b.transform), f"transform differs: {a.transform} != {b.transform}"
+        height, width = max(a.height, b.height), max(a.width, b.width)
+        # an edge row or column only one output has is compared against NaN
+        data_a, data_b = (
+            np.pad(
+                src.read().astype("float32"),
+                ((0, 0), (0, height - src.height), (0, width - src.width)),
+                constant_values=np.nan,
+            )
+            for src in (a, b)
+        )
+        transform = a.transform
+        boundary = geom.to_crs(a.crs).boundary.unary_union
+    differ = ~((data_a == data_b) | (np.isnan(data_a) & np.isnan(data_b))).all(axis=0)
+    for row, col in np.argwhere(differ):
+        pixel = box(*(transform @ (col, row + 1)), *(transform @ (col + 1, row)))
+        assert pixel.distance(boundary) < 1e-6 * abs(transform.a), f"pixel {row}, {col} differs"
+    return int(differ.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=4000)
+    parser.add_argument("--dtype", default="uint16", choices=["uint16", "float32"])
+    parser.add_argument("--resample", action="store_true")
+    parser.add_argument("--chunks", type=int, default=None)
+    parser.add_argument("--crs", default="EPSG:3857")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_reproj_mask_")
+    try:
+        geom = make_inputs(workdir, args.size, args.dtype)
+        print(
+            f"raster {args.size}x{args.size} {args.dtype} to {args.crs}, "
+            f"resample={args.resample}, chunks={args.chunks}"
+        )
+        for name in ("reproj_mask", "reproj_mask_windowed"):
+            elapsed, peak_mb = run_isolated(name, workdir, geom, args.crs, args.resample, args.chunks)
+            print(f"{name:>22}: {elapsed:7.2f} s  peak RSS {peak_mb:8.1f} MB")
+        differ = compare(
+            os.path.join(workdir, "reproj_mask", "bench_masked.tiff"),
+            os.path.join(workdir, "reproj_mask_windowed", "bench_masked.tiff"),
+            geom,
+        )
+        if differ:
+            print(f"outputs identical except {differ} pixels on the geometry boundary")
+        else:
+            print("outputs identical")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
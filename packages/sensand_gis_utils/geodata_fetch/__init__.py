@@ -1,8 +1,11 @@
 from . import (
+    cube,
     getdata_dem,
     getdata_radiometric,
     getdata_slga,
     harvest,
+    manifest,
+    multi_harvest,
     settingshandler,
     utils,
 )
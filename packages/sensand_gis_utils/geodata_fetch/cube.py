@@ -0,0 +1,250 @@
+"""
+Aligned multi-layer raster cube.
+
+Harvested layers come at different resolutions, extents and CRSs. The functions in this script align them to one
+common grid and write them into a single chunked multi-band store, so downstream modelling can open the cube lazily
+instead of reloading, reprojecting and resampling every tiff in each session.
+
+- `cube_grid` finds the common grid: the target CRS, the finest resolution of the layers (unless one is given) and
+  the union of their extents.
+- `build_cube` warps each layer block by block onto that grid and writes it as one band of a tiled GeoTIFF or as
+  one slice of a Zarr array. Only one block of one layer is held in memory at a time for GeoTIFF output.
+- `open_cube` opens a cube lazily as a dask-backed `xarray.DataArray` with the layer names as the `band` coordinate.
+
+Bands are stored as float32 with a common nodata value. The source file and the original nodata of each layer are
+kept in the band tags (GeoTIFF) or the array attributes (Zarr). Zarr output needs the optional `zarr` package.
+"""
+
+import logging
+import os
+
+import numpy as np
+import rasterio
+import rioxarray
+import xarray as xr
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform, transform_bounds
+
+logger = logging.getLogger()
+
+CUBE_NODATA = -9999.0
+
+
+def cube_grid(paths, target_crs=None, resolution=None):
+    """
+    Common grid for a set of rasters.
+
+    Args:
+        paths (list): Raster file paths.
+        target_crs (str, optional): CRS of the grid. Defaults to the CRS of the first raster.
+        resolution (float, optional): Pixel size in target CRS units. Defaults to the finest resolution of the
+            rasters once reprojected to `target_crs`.
+
+    Returns:
+        tuple: (crs, transform, width, height) of the grid.
+    """
+    bounds = []
+    resolutions = []
+    crs = None
+    for path in paths:
+        with rasterio.open(path) as src:
+            if crs is None:
+                crs = rasterio.crs.CRS.from_user_input(target_crs or src.crs)
+            transform, _, _ = calculate_default_transform(
+                src.crs, crs, src.width, src.height, *src.bounds
+            )
+            resolutions.append(min(abs(transform.a), abs(transform.e)))
+            bounds.append(transform_bounds(src.crs, crs, *src.bounds, densify_pts=21))
+
+    if crs is None:
+        raise ValueError("No rasters given to build the cube grid")
+
+    res = resolution or min(resolutions)
+    left = min(b[0] for b in bounds)
+    bottom = min(b[1] for b in bounds)
+    right = max(b[2] for b in bounds)
+    top = max(b[3] for b in bounds)
+    # snap the grid to multiples of the resolution so cubes of the same area line up, extents already on a
+    # multiple within floating point error stay put instead of gaining a row or column
+    left = np.floor(left / res + 1e-6) * res
+    top = np.ceil(top / res - 1e-6) * res
+    width = int(np.ceil((right - left) / res - 1e-6))
+    height = int(np.ceil((top - bottom) / res - 1e-6))
+    return crs, from_origin(left, top, res, res), width, height
+
+
+def band_name(path, property_name=None):
+    """Layer name of a harvested file, e.g. `DEM_SRTM_1_Second_Hydro_Enforced` for `DEM_SRTM_1_Second_Hydro_Enforced_farm_masked.tiff`."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = name.removesuffix("_masked")
+    if property_name:
+        name = name.removesuffix(f"_{property_name}")
+    return name
+
+
+def _warped(src, crs, transform, width, height, resampling):
+    return WarpedVRT(
+        src,
+        crs=crs,
+        transform=transform,
+        width=width,
+        height=height,
+        resampling=resampling,
+        nodata=CUBE_NODATA,
+        dtype="float32",
+    )
+
+
+def _write_geotiff(paths, names, output_path, grid, resampling, blocksize):
+    crs, transform, width, height = grid
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": len(paths),
+        "width": width,
+        "height": height,
+        "crs": crs,
+        "transform": transform,
+        "nodata": CUBE_NODATA,
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+        "compress": "deflate",
+        "predictor": 3,
+        "interleave": "band",
+        "BIGTIFF": "IF_SAFER",
+    }
+    with rasterio.open(output_path, "w", **profile) as dst:
+        for band, (path, name) in enumerate(zip(paths, names), start=1):
+            with rasterio.open(path) as src, _warped(
+                src, crs, transform, width, height, resampling
+            ) as vrt:
+                for _, window in dst.block_windows(band):
+                    dst.write(vrt.read(1, window=window), band, window=window)
+                dst.set_band_description(band, name)
+                dst.update_tags(
+                    band,
+                    source=os.path.basename(path),
+                    source_nodata=str(src.nodata),
+                )
+            logger.info(f"Added {name} to cube {output_path}")
+
+
+def _write_zarr(paths, names, output_path, grid, resampling, blocksize):
+    try:
+        import zarr  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "Writing a Zarr cube requires the zarr package, install it with `pip install zarr`"
+        ) from e
+
+    crs, transform, width, height = grid
+    sources = []
+    layers = []
+    try:
+        for path in paths:
+            src = rasterio.open(path)
+            vrt = _warped(src, crs, transform, width, height, resampling)
+            sources.extend([vrt, src])
+            layer = rioxarray.open_rasterio(
+                vrt, chunks={"band": 1, "x": blocksize, "y": blocksize}, lock=True
+            )
+            layers.append(layer.isel(band=0, drop=True))
+
+        cube = xr.concat(layers, dim="band").assign_coords(band=names)
+        cube.name = "cube"
+        cube.attrs = {
+            "sources": [os.path.basename(path) for path in paths],
+            "source_nodata": [str(src.nodata) for src in sources[1::2]],
+        }
+        cube = cube.rio.write_crs(crs).rio.write_nodata(CUBE_NODATA, encoded=True)
+        cube.to_dataset().to_zarr(output_path, mode="w", consolidated=True)
+    finally:
+        for dataset in sources:
+            dataset.close()
+
+
+def build_cube(
+    paths,
+    output_path,
+    target_crs=None,
+    resolution=None,
+    band_names=None,
+    resampling="bilinear",
+    blocksize=512,
+):
+    """
+    Align rasters to a common grid and write them into one multi-band store.
+
+    Args:
+        paths (list): Raster file paths, one band each (only the first band of each file is used).
+        output_path (str): Output path, a `.zarr` path writes a Zarr store, anything else a tiled GeoTIFF.
+        target_crs (str, optional): CRS of the cube. Defaults to the CRS of the first raster.
+        resolution (float, optional): Pixel size of the cube. Defaults to the finest resolution of the rasters.
+        band_names (list, optional): Name of each band. Defaults to the file names.
+        resampling (str, optional): Resampling method name from `rasterio.enums.Resampling`. Defaults to "bilinear".
+        blocksize (int, optional): Tile/chunk size in pixels. Defaults to 512.
+
+    Returns:
+        str: The output path.
+    """
+    paths = list(paths)
+    names = list(band_names) if band_names is not None else [band_name(p) for p in paths]
+    if len(names) != len(paths):
+        raise ValueError(f"Got {len(names)} band names for {len(paths)} rasters")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Band names must be unique, got {names}")
+
+    grid = cube_grid(paths, target_crs, resolution)
+    resampling = Resampling[resampling]
+    print(
+        f"Building cube of {len(paths)} layers on a {grid[2]}x{grid[3]} grid in {grid[0]}"
+    )
+    if output_path.rstrip("/").endswith(".zarr"):
+        _write_zarr(paths, names, output_path, grid, resampling, blocksize)
+    else:
+        _write_geotiff(paths, names, output_path, grid, resampling, blocksize)
+    return output_path
+
+
+def cube_band_names(output_path):
+    """Band names of an existing cube, or None if it does not exist or can't be read."""
+    if not os.path.exists(output_path):
+        return None
+    try:
+        if output_path.rstrip("/").endswith(".zarr"):
+            with xr.open_zarr(output_path) as ds:
+                return [str(name) for name in ds["cube"].band.values]
+        with rasterio.open(output_path) as src:
+            return list(src.descriptions)
+    except Exception as e:
+        logger.error(f"Error reading cube {output_path}: {e}")
+        return None
+
+
+def open_cube(path, chunks=True):
+    """
+    Open a cube lazily.
+
+    Args:
+        path (str): Path of a cube written by `build_cube`.
+        chunks (bool or dict, optional): Dask chunks, True uses the on-disk tiles. Defaults to True.
+
+    Returns:
+        xarray.DataArray: (band, y, x) array with the layer names as the `band` coordinate and nodata masked as NaN.
+    """
+    if path.rstrip("/").endswith(".zarr"):
+        ds = xr.open_zarr(
+            path, chunks={} if chunks is True else chunks, decode_coords="all"
+        )
+        return ds["cube"]
+
+    cube = rioxarray.open_rasterio(path, chunks=chunks, masked=True)
+    names = cube.attrs.get("long_name")
+    if isinstance(names, str):
+        names = [names]
+    if names:
+        cube = cube.assign_coords(band=list(names))
+    return cube
@@ -1,15 +1,21 @@
 import json
 import logging
+import math
 import os
+import threading
 from importlib import resources
 
+import dask
 import rioxarray
 from odc.stac import configure_rio, stac_load
 from owslib.wcs import WebCoverageService
-from pystac_client import Client
 from rasterio.io import MemoryFile
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
 
 from geodata_fetch.utils import retry_decorator
+from gis_utils.io_profile import io_profile
+from gis_utils.stac import search_stac
 
 logger = logging.getLogger()
 # try this but remove if it doesn't work well with datadog:
@@ -18,8 +24,8 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
-configure_rio(cloud_defaults=True, aws={"aws_unsigned": True})
-os.environ["AWS_NO_SIGN_REQUEST"] = "YES"
+# the shared remote read profile, also installed on dask workers by configure_rio
+configure_rio(cloud_defaults=True, aws={"aws_unsigned": True}, **io_profile())
 
 
 class _BaseHarvest:
@@ -186,16 +192,56 @@ class dem_harvest(_BaseHarvest):
             return None
 
 
+def _chunk_size_for_memory(memory_limit_mb, num_workers, itemsize=4):
+    """
+    Square dask chunk size (pixels per side) that keeps `num_workers` chunks in flight within `memory_limit_mb`.
+    Each in-flight chunk is budgeted at 4x its size to cover the source read buffers and the reprojection output.
+    Sizes are multiples of 512 so chunk edges line up with the GeoTIFF tiles.
+    """
+    budget = memory_limit_mb * 1024 * 1024 / (num_workers * 4 * itemsize)
+    side = int(math.sqrt(budget)) // 512 * 512
+    return min(max(side, 512), 8192)
+
+
 class dem_harvest_global(_BaseHarvest):
     def __init__(self):
         super().__init__("stac_global_dem_default_config.json")
 
-    def get_global_stac_dem(self, property_name, layernames, bbox, outpath):
+    def get_global_stac_dem(
+        self,
+        property_name,
+        layernames,
+        bbox,
+        outpath,
+        memory_limit_mb=1024,
+        num_workers=None,
+    ):
+        """
+        Fetches the Copernicus 30m global DEM for the bounding box and writes it as a COG.
+
+        The mosaic is loaded lazily in dask chunks and streamed to a tiled GeoTIFF by a threaded scheduler
+        with at most `num_workers` chunks in flight, so the full mosaic is never held in memory.
+        COG overviews are then built from the tiled GeoTIFF on disk.
+
+        Args:
+            property_name (str): The name of the property.
+            layernames (str or list): The name(s) of the layer(s) to fetch, only "DEM Global" is supported.
+            bbox (tuple): The bounding box coordinates (xmin, ymin, xmax, ymax).
+            outpath (str): The output path to save the fetched layers.
+            memory_limit_mb (int, optional): Approximate memory budget for the pixel data. Defaults to 1024.
+            num_workers (int, optional): Number of chunks processed concurrently. Defaults to min(4, cpu count).
+
+        Returns:
+            list: A list of file paths of the written COGs, or None on error.
+        """
         if not isinstance(layernames, list):
             layernames = [layernames]
         try:
             os.makedirs(outpath, exist_ok=True)
 
+            num_workers = num_workers or min(4, os.cpu_count() or 1)
+            chunk_size = _chunk_size_for_memory(memory_limit_mb, num_workers)
+
             fnames_out = []
             for layername in layernames:
                 if layername == "DEM Global":
@@ -207,35 +253,53 @@ class dem_harvest_global(_BaseHarvest):
                     )
 
                     outfname = os.path.join(outpath, fname_out)
+                    tiled_fname = outfname.replace(".tiff", "_tiled.tmp.tiff")
                     """
                     There are some oddities with handling CRS here. The stac items need to be passed to stac_load_xarray as a SPATIAL reference system (3857) but our final stored data expects a  CARTESIAN system (4326). So, we need to do a reproject after downloading the data.
                     """
                     resolution = 30
                     collections = ["cop-dem-glo-30"]
 
-                    """
-                    not sure if importing gis_utils stac was causing a problem, so I've hardcoded in here for now.
-                    """
-                    catalog = Client.open(self.source_url)
-                    query = catalog.search(collections=collections, bbox=bbox)
-                    items = list(query.items())
+                    # memoised per bbox, so repeated requests for the same area skip Earth Search
+                    items = search_stac(self.source_url, bbox, collections)
 
                     stac_load_xarray = stac_load(
                         items,
                         crs="epsg:3857",
                         resolution=resolution,
                         bbox=bbox,
-                        chunksize=(1024, 1024),
+                        chunks={"x": chunk_size, "y": chunk_size},
                     )  # only squeeze if you KNOW there is only one time dimension
-                    # print("checkpoint before memory load of dem")
                     stac_load_xarray = stac_load_xarray.squeeze()
-                    stac_load_xarray = stac_load_xarray.load()
                     xarray_data = stac_load_xarray.data
 
-                    final_raster = xarray_data.rio.to_raster(
-                        outfname, driver="COG"
-                    )
-                    fnames_out.append(final_raster)
+                    try:
+                        # stream the dask chunks into a tiled GeoTIFF, never materialising the whole mosaic
+                        with dask.config.set(
+                            scheduler="threads", num_workers=num_workers
+                        ):
+                            xarray_data.rio.to_raster(
+                                tiled_fname,
+                                tiled=True,
+                                blockxsize=512,
+                                blockysize=512,
+                                compress="deflate",
+                                lock=threading.Lock(),
+                            )
+
+                        # build the COG and its overviews from the tiled file on disk
+                        cog_translate(
+                            tiled_fname,
+                            outfname,
+                            cog_profiles.get("deflate"),
+                            in_memory=False,
+                            config={"GDAL_CACHEMAX": int(memory_limit_mb)},
+                            quiet=True,
+                        )
+                    finally:
+                        if os.path.exists(tiled_fname):
+                            os.remove(tiled_fname)
+                    fnames_out.append(outfname)
             return fnames_out
         except Exception as e:
             logger.error(
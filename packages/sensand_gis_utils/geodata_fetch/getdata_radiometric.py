@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from importlib import resources
 
@@ -40,10 +41,16 @@ Ditto EPSG.
 """
 
 
-def get_radiometric_layers(property_name, layernames, bbox, outpath):
+def get_radiometric_layers(
+    property_name, layernames, bbox, outpath, max_workers=4, overwrite=False
+):
     """
     Wrapper function for downloading radiometric data layers and save geotiffs from WCS layer.
 
+    The GSKY capabilities document is fetched and parsed once, the time position of every
+    requested layer is resolved from that single document, and the coverages are then
+    downloaded concurrently.
+
     Parameters
     ----------
     outpath: str
@@ -52,6 +59,10 @@ def get_radiometric_layers(property_name, layernames, bbox, outpath):
         layer identifiers
     bbox : list
         layer bounding box
+    max_workers : int
+        maximum number of concurrent coverage downloads (Default: 4)
+    overwrite : bool
+        download layers whose file already exists again (Default: False)
 
     These are now being read from the dict, not passed as ahrd-coded values:
     resolution, url, crs
@@ -72,12 +83,30 @@ def get_radiometric_layers(property_name, layernames, bbox, outpath):
     if type(layernames) != list:
         layernames = [layernames]
 
-    # Loop over all layers
-    fnames_out = []
+    os.makedirs(outpath, exist_ok=True)
+
+    # One capabilities request for all layers
+    try:
+        wcs = WebCoverageService(url, version="1.0.0", timeout=300)
+    except Exception as e:
+        logger.error(f"Error fetching RadMap wcs capabilities: {e}")
+        return []
+
+    layer_requests = []
     for layername in layernames:
+        try:
+            # There is only one time available per layer
+            date = get_times(url, layername, wcs=wcs)[0]
+        except Exception as e:
+            logger.error(f"No time position found for RadMap layer {layername}: {e}")
+            continue
         outfname = os.path.join(
             outpath, "radiometric_" + layername + "_" + property_name + ".tiff"
         )
+        layer_requests.append((outfname, layername, date))
+
+    def _download(request):
+        outfname, layername, date = request
         ok = get_radiometric_image(
             outfname=outfname,
             layername=layername,
@@ -85,14 +114,37 @@ def get_radiometric_layers(property_name, layernames, bbox, outpath):
             url=url,
             resolution=resolution,
             crs=crs,
+            wcs=wcs,
+            date=date,
+            overwrite=overwrite,
         )
-        if ok:
-            fnames_out.append(outfname)
+        return outfname if ok else None
+
+    if not layer_requests:
+        return []
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(layer_requests))
+    ) as pool:
+        # map returns results in the order the layers were requested
+        results = list(pool.map(_download, layer_requests))
+
+    fnames_out = [outfname for outfname in results if outfname]
     return fnames_out
 
 
 @retry_decorator()
-def get_radiometric_image(outfname, layername, bbox, url, resolution, crs):
+def get_radiometric_image(
+    outfname,
+    layername,
+    bbox,
+    url,
+    resolution,
+    crs,
+    wcs=None,
+    date=None,
+    overwrite=False,
+):
     """
     Download radiometric data layer and save geotiff from WCS layer.
 
@@ -107,6 +159,13 @@ def get_radiometric_image(outfname, layername, bbox, url, resolution, crs):
     resolution : int
     url : str
     crs: str
+    wcs: owslib.wcs.WebCoverageService, optional
+        already initialised service, avoids another capabilities request
+    date: str, optional
+        time position of the layer, looked up from the capabilities if not given
+    overwrite: bool, optional
+        download the layer even if outfname exists, e.g. when it was requested
+        with other settings (Default: False)
 
     Return
     ------
@@ -122,16 +181,16 @@ def get_radiometric_image(outfname, layername, bbox, url, resolution, crs):
     nwidth = int(width / resolution * 3600)
     nheight = int(height / resolution * 3600)
 
-    # Get date
-    times = get_times(url, layername)
-    # There is only one time available per layer
-    date = times[0]
     # Get data
-    if os.path.exists(outfname):
+    if os.path.exists(outfname) and not overwrite:
         logger.info(f"{layername}.tiff already exists, skipping download")
     else:
         try:
-            wcs = WebCoverageService(url, version="1.0.0", timeout=300)
+            if wcs is None:
+                wcs = WebCoverageService(url, version="1.0.0", timeout=300)
+            if date is None:
+                # There is only one time available per layer
+                date = get_times(url, layername, wcs=wcs)[0]
             data = wcs.getCoverage(
                 identifier=layername,
                 time=[date],
@@ -153,7 +212,7 @@ def get_radiometric_image(outfname, layername, bbox, url, resolution, crs):
     return True
 
 
-def get_times(url, layername, year=None):
+def get_times(url, layername, year=None, wcs=None):
     """
     Return available dates for layer.
 
@@ -162,13 +221,15 @@ def get_times(url, layername, year=None):
     url: str, layer url
     layername: str, name of layer id
     year: int or str, year of interest (if None, times for all available years are returned)
+    wcs: owslib.wcs.WebCoverageService, already parsed capabilities to reuse (if None, capabilities are fetched from url)
 
     Return
     ------
     list of dates
     """
 
-    wcs = WebCoverageService(url, version="1.0.0", timeout=300)
+    if wcs is None:
+        wcs = WebCoverageService(url, version="1.0.0", timeout=300)
     times = wcs[layername].timepositions
     if year is None:
         return times
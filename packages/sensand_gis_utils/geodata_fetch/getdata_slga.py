@@ -1,8 +1,13 @@
 import json
 import logging
 import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from importlib import resources
 
+import numpy as np
+import rasterio
 from owslib.wcs import WebCoverageService
 
 from geodata_fetch.utils import retry_decorator
@@ -66,6 +71,9 @@ class slga_harvest:
         outfname : str
             output file name
 
+        Returns
+        -------
+        True if the layer was downloaded and saved, False otherwise.
         """
         resolution = (
             resolution if resolution is not None else self.resolution_arcsec
@@ -92,6 +100,7 @@ class slga_harvest:
                 print(
                     f"WCS data downloaded and saved as {os.path.basename(outfname)}"
                 )
+            return True
 
         except Exception as e:
             if hasattr(e, "response") and e.response is not None:
@@ -115,6 +124,7 @@ class slga_harvest:
                     f"An exception occurred when accessing {url}: {str(e)}",
                     exc_info=True,
                 )
+            return False
 
     def get_slga_layers(
         self,
@@ -129,6 +139,7 @@ class slga_harvest:
     ):
         """
         Download layers from SLGA and saves as geotif.
+        With get_ci, each file has three bands: the estimate and the 5 and 95 percentiles.
 
         Parameters
         ----------
@@ -138,6 +149,7 @@ class slga_harvest:
         depth_min : minimum depth (Default: 0 cm). If depth_min and depth_max are lists, then must have same length as layernames
         depth_max : maximum depth (Default: 200 cm, maximum depth of SLGA data)
         outpath : output path
+        get_ci : download the 5 and 95 percentiles with the estimate (Default: False)
 
         Returns
         -------
@@ -186,9 +198,7 @@ class slga_harvest:
                     depth_upper,
                 ) = depth2identifier(depth_min[idx], depth_max[idx])
 
-                # if confidence intervals not requested, do this:
                 for i in range(len(identifiers)):
-                    identifier = identifiers[i]
                     layer_depth_name = (
                         f"SLGA_{layername}_{depth_lower[i]}-{depth_upper[i]}cm"
                     )
@@ -196,59 +206,284 @@ class slga_harvest:
                     fname_out = os.path.join(
                         outpath, f"{layer_depth_name}_{property_name}.tiff"
                     )
-                    # download data
-                    dl = self.getwcs_slga(
-                        layer_url,
-                        identifier,
-                        self.crs,
-                        bbox,
-                        resolution_deg,
-                        fname_out,
-                    )
-                    if dl:
-                        fnames_out.append(fname_out)
-                # if confidence intervals requested, do this instead:
-                if get_ci:
-                    for i in range(len(identifiers)):
-                        # set identifiers for the 5 and 95% CI's
-                        identifier_5 = identifiers_ci_5pc[i]
-                        identifier_95 = identifiers_ci_95pc[i]
-
-                        layer_depth_name = f"SLGA_{layername}_{depth_lower[i]}-{depth_upper[i]}cm"
-                        fname_out_5 = os.path.join(
-                            outpath,
-                            f"{layer_depth_name}_{property_name}_5percentile.tiff",
-                        )
-
-                        fname_out_95 = os.path.join(
-                            outpath,
-                            f"{layer_depth_name}_{property_name}_95percentile.tiff",
-                        )
-                        # download data
-                        dl_5 = self.getwcs_slga(
+                    # if confidence intervals requested, the estimate and the 5 and 95% CI's go into one 3 band file
+                    if get_ci:
+                        dl = self.getwcs_slga_ci(
                             layer_url,
-                            identifier_5,
-                            self.crs,
+                            {
+                                "estimate": identifiers[i],
+                                "percentile_5": identifiers_ci_5pc[i],
+                                "percentile_95": identifiers_ci_95pc[i],
+                            },
                             bbox,
                             resolution_deg,
                             fname_out,
                         )
-                        dl_95 = self.getwcs_slga(
+                    else:
+                        dl = self.getwcs_slga(
                             layer_url,
-                            identifier_95,
+                            identifiers[i],
                             self.crs,
                             bbox,
                             resolution_deg,
                             fname_out,
                         )
-                        if dl_5 and dl_95:
-                            fnames_out.append(fname_out_5, fname_out_95)
+                    if dl:
+                        fnames_out.append(fname_out)
 
             return fnames_out
         except Exception as e:
             logger.error(f"Failed to get SLGA layers: {e}", exc_info=True)
             return None
 
+    def getwcs_slga_ci(self, url, band_identifiers, bbox, resolution, outfname):
+        """
+        Download several identifiers of one SLGA layer concurrently and save them as one multi-band geotif.
+
+        Parameters
+        ----------
+        url : str
+            the SLGA attribute endpoint
+        band_identifiers : dict
+            band description -> layer identifier, e.g. {"estimate": "1", "percentile_5": "3", "percentile_95": "2"}
+        bbox : list
+            layer bounding box
+        resolution : float
+            layer resolution in degrees
+        outfname : str
+            output file name
+
+        Returns
+        -------
+        True if every band was downloaded and saved, False otherwise.
+        """
+        outpath = os.path.dirname(outfname) or "."
+        with tempfile.TemporaryDirectory(dir=outpath) as tmpdir:
+            files = {
+                band: os.path.join(tmpdir, f"{band}.tiff") for band in band_identifiers
+            }
+            with ThreadPoolExecutor(max_workers=len(files)) as pool:
+                downloads = [
+                    pool.submit(
+                        self.getwcs_slga,
+                        url,
+                        identifier,
+                        self.crs,
+                        bbox,
+                        resolution,
+                        files[band],
+                    )
+                    for band, identifier in band_identifiers.items()
+                ]
+                if not all(download.result() for download in downloads):
+                    logger.error(f"Failed to download all bands of {outfname}")
+                    return False
+            try:
+                stack, profile = _read_stack(list(files.values()))
+                _write_bands(outfname, dict(zip(files, stack)), profile)
+            except Exception as e:
+                logger.error(f"Failed to combine bands of {outfname}: {e}", exc_info=True)
+                return False
+        print(f"WCS data downloaded and saved as {os.path.basename(outfname)}")
+        return True
+
+    def get_slga_depth_weighted(
+        self,
+        property_name,
+        layername,
+        bbox,
+        outpath,
+        depth_min,
+        depth_max,
+        resolution=3,
+        get_ci=False,
+    ):
+        """
+        Download every SLGA depth interval overlapping depth_min to depth_max and save their thickness-weighted
+        mean as a single geotif.
+
+        Each interval is weighted by the thickness of its overlap with the requested range, e.g. 0-30cm weights
+        0-5cm, 5-15cm and 15-30cm by 5, 10 and 15. Pixels that are nodata in any interval are nodata in the output.
+        The intervals are downloaded to a temporary directory and removed once combined.
+
+        Parameters
+        ----------
+        property_name : property name used in the output file name
+        layername : SLGA layer name e.g. Clay
+        bbox : bounding box [min, miny, maxx, maxy]
+        outpath : output path
+        depth_min : top of the depth range [cm]
+        depth_max : bottom of the depth range [cm]
+        resolution : resolution in arcsec (Default: 3 arcsec ~ 90m)
+        get_ci : also write the weighted 5 and 95 percentiles as bands 2 and 3 (Default: False). These are the
+            weighted means of the interval percentiles, an approximation of the percentiles of the weighted mean.
+
+        Returns
+        -------
+        fname_out : output file name, or None if the download or aggregation failed
+        """
+        intervals = overlapping_intervals(depth_min, depth_max)
+        if not intervals:
+            logger.error(f"No SLGA depth intervals overlap {depth_min}-{depth_max}cm")
+            return None
+
+        resolution = (
+            resolution if resolution is not None else self.resolution_arcsec
+        )
+        resolution_deg = resolution / 3600.0
+        layer_url = self.layers_url[layername]
+        os.makedirs(outpath, exist_ok=True)
+        fname_out = os.path.join(
+            outpath,
+            f"SLGA_{layername}_{depth_min}-{depth_max}cm_weighted_{property_name}.tiff",
+        )
+
+        # band name -> offset of the interval identifier, see depth2identifier
+        bands = {"mean": 1}
+        if get_ci:
+            bands.update({"percentile_5": 3, "percentile_95": 2})
+
+        with tempfile.TemporaryDirectory(dir=outpath) as tmpdir:
+            band_files = {
+                band: [
+                    os.path.join(tmpdir, f"{band}_{lower}-{upper}cm.tiff")
+                    for _, lower, upper, _ in intervals
+                ]
+                for band in bands
+            }
+            # every interval of every band is a separate WCS request, download them concurrently
+            with ThreadPoolExecutor(max_workers=len(intervals)) as pool:
+                downloads = {
+                    (band, lower, upper): pool.submit(
+                        self.getwcs_slga,
+                        layer_url,
+                        str(3 * index + offset),
+                        self.crs,
+                        bbox,
+                        resolution_deg,
+                        fname,
+                    )
+                    for band, offset in bands.items()
+                    for (index, lower, upper, _), fname in zip(intervals, band_files[band])
+                }
+                failed = [key for key, download in downloads.items() if not download.result()]
+            if failed:
+                for band, lower, upper in failed:
+                    logger.error(f"Failed to download {layername} {lower}-{upper}cm ({band})")
+                return None
+
+            weights = np.array([thickness for *_, thickness in intervals])
+            try:
+                profile = None
+                results = []
+                for band, files in band_files.items():
+                    stack, band_profile = _read_stack(files)
+                    profile = profile or band_profile
+                    results.append(depth_weighted_mean(stack, weights))
+            except Exception as e:
+                logger.error(
+                    f"Failed to aggregate {layername} {depth_min}-{depth_max}cm: {e}",
+                    exc_info=True,
+                )
+                return None
+
+        _write_bands(
+            fname_out,
+            dict(zip(bands, results)),
+            profile,
+            depth_intervals=",".join(f"{lo}-{up}cm" for _, lo, up, _ in intervals),
+            weights=",".join(str(w) for w in weights),
+        )
+        print(f"Depth weighted {layername} saved as {os.path.basename(fname_out)}")
+        return fname_out
+
+
+SLGA_DEPTH_INTERVALS = [0, 5, 15, 30, 60, 100, 200]
+SLGA_DEPTH_OPTIONS = [
+    "0-5cm",
+    "5-15cm",
+    "15-30cm",
+    "30-60cm",
+    "60-100cm",
+    "100-200cm",
+]
+
+
+def overlapping_intervals(depth_min, depth_max):
+    """
+    SLGA standard depth intervals overlapping depth_min to depth_max.
+
+    Returns
+    -------
+    list of (interval index, interval top, interval bottom, overlap thickness) tuples
+    """
+    intervals = []
+    for i in range(len(SLGA_DEPTH_INTERVALS) - 1):
+        lower, upper = SLGA_DEPTH_INTERVALS[i], SLGA_DEPTH_INTERVALS[i + 1]
+        overlap = min(upper, depth_max) - max(lower, depth_min)
+        if overlap > 0:
+            intervals.append((i, lower, upper, overlap))
+    return intervals
+
+
+def parse_depth_range(depth):
+    """
+    Parse a depth string such as "0-30cm" into (depth_min, depth_max), or None if it is not a depth range.
+    """
+    match = re.fullmatch(r"(\d+)-(\d+)cm", depth)
+    if match is None:
+        return None
+    depth_min, depth_max = int(match.group(1)), int(match.group(2))
+    if depth_min >= depth_max:
+        return None
+    return depth_min, depth_max
+
+
+def _read_stack(files):
+    """Read single band rasters on the same grid into a masked (n, height, width) float32 stack."""
+    layers = []
+    profile = None
+    for fname in files:
+        with rasterio.open(fname) as src:
+            if profile is None:
+                profile = src.profile.copy()
+            elif (src.width, src.height, src.transform) != (
+                profile["width"],
+                profile["height"],
+                profile["transform"],
+            ):
+                raise ValueError(f"{fname} is not on the same grid as {files[0]}")
+            layers.append(src.read(1, masked=True).astype("float32"))
+    return np.ma.stack(layers), profile
+
+
+def _write_bands(fname_out, bands, profile, **tags):
+    """
+    Write masked arrays as the described bands of one float32 geotif. The bands share one nodata mask: a pixel
+    masked in any band is nodata in all of them.
+    """
+    mask = np.any([np.ma.getmaskarray(band) for band in bands.values()], axis=0)
+    profile = profile.copy()
+    profile.update({"count": len(bands), "dtype": "float32", "nodata": np.nan})
+    with rasterio.open(fname_out, "w", **profile) as dst:
+        for i, (name, band) in enumerate(bands.items(), start=1):
+            data = np.ma.masked_array(band, mask=mask).filled(np.nan)
+            dst.write(data.astype("float32"), i)
+            dst.set_band_description(i, name)
+        if tags:
+            dst.update_tags(**tags)
+
+
+def depth_weighted_mean(stack, weights):
+    """
+    Thickness-weighted mean of a masked (n, height, width) stack in one vectorised pass.
+    Pixels masked in any layer are masked in the result.
+    """
+    weights = np.asarray(weights, dtype="float64")
+    mask = np.ma.getmaskarray(stack).any(axis=0)
+    mean = np.tensordot(weights, stack.filled(0), axes=1) / weights.sum()
+    return np.ma.masked_array(mean, mask=mask)
+
 
 def depth2identifier(depth_min, depth_max):
     """
@@ -270,7 +505,7 @@ def depth2identifier(depth_min, depth_max):
     """
 
     try:
-        depth_intervals = [0, 5, 15, 30, 60, 100, 200]
+        depth_intervals = SLGA_DEPTH_INTERVALS
         identifiers = []
         identifiers_ci_5pc = []
         identifiers_ci_95pc = []
@@ -311,15 +546,8 @@ def identifier2depthbounds(depths):
     min depth
     max depth
     """
-    depth_options = [
-        "0-5cm",
-        "5-15cm",
-        "15-30cm",
-        "30-60cm",
-        "60-100cm",
-        "100-200cm",
-    ]
-    depth_intervals = [0, 5, 15, 30, 60, 100, 200]
+    depth_options = SLGA_DEPTH_OPTIONS
+    depth_intervals = SLGA_DEPTH_INTERVALS
     try:
         # Check first if entries valid
         for depth in depths:
@@ -19,21 +19,41 @@ The `run` method is responsible for executing the data fetching process. It perf
 2. Sets the coordinates based on the latitude and longitude specified in the settings.
 3. Counts the number of sources to download from and lists the source names.
 4. Fetches data from the SLGA, DEM, and Radiometric sources based on the target sources specified in the settings.
-5. Applies masking to the downloaded files if the data mask flag is True.
+5. Skips layers that the harvest manifest in `outpath` records as already fetched with the same settings (unless `incremental` is False), and records the new outputs.
+6. Applies masking to the downloaded files if the data mask flag is True. Masking runs in a process pool sized by the optional `mask_workers` setting, with each worker limited to `mask_memory_mb` of raster memory.
+7. If the optional `cube` setting is "tiff" or "zarr", aligns the (masked) layers to a common grid and writes them into one multi-band `<property_name>_cube.tiff` or `<property_name>_cube.zarr`, see `geodata_fetch.cube`. `cube_resolution` optionally sets the cube pixel size.
 
 To use this script, create an instance of the `DataHarvester` class and call the `run` method with the path to the configuration file and the input geometry as parameters.
 """
 
+import copy
 import logging
+import math
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# from geodata_fetch import getdata_radiometric  # getdata_dem
+import geopandas as gpd
+import rasterio
+
+from geodata_fetch.cube import band_name, build_cube, cube_band_names
 from geodata_fetch.getdata_dem import (  # updated call to dem using class
     dem_harvest,
     dem_harvest_global,
 )
-from geodata_fetch.getdata_slga import identifier2depthbounds, slga_harvest
-from geodata_fetch.utils import load_settings, reproj_mask
+from geodata_fetch.getdata_radiometric import get_radiometric_layers
+from geodata_fetch.getdata_slga import (
+    SLGA_DEPTH_OPTIONS,
+    identifier2depthbounds,
+    parse_depth_range,
+    slga_harvest,
+)
+from geodata_fetch.manifest import (
+    HarvestManifest,
+    geometry_checksum,
+    merge_target,
+)
+from geodata_fetch.utils import load_settings, reproj_mask_windowed
 
 logger = logging.getLogger()
 # try this but remove if it doesn't work well with datadog:
@@ -54,10 +74,108 @@ class Settings:
         self.add_buffer = getattr(config, "add_buffer", False)
         self.data_mask = getattr(config, "data_mask", False)
         self.target_res = getattr(config, "target_res", False)
+        self.mask_workers = getattr(config, "mask_workers", None)
+        self.mask_memory_mb = getattr(config, "mask_memory_mb", None)
+        self.memory_limit_mb = getattr(config, "memory_limit_mb", 1024)
+        self.incremental = getattr(config, "incremental", True)
+        self.cube = getattr(config, "cube", False)
+        self.cube_resolution = getattr(config, "cube_resolution", None)
+        self.slga_ci = getattr(config, "slga_ci", False)
         self.lat = None
         self.long = None
 
 
+# Geometry used by the masking workers, deserialised once per worker process by _init_mask_worker.
+_worker_geom = None
+_worker_gdal_env = None
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# tiffs written from the downloads, every other tiff in `outpath` is a download
+DERIVED_SUFFIXES = (
+    "_masked.tiff",
+    "_colored.tiff",
+    "_cog.tiff",
+    "_cog.public.tiff",
+    "_cube.tiff",
+)
+
+
+def list_downloads(outpath):
+    """The downloaded tiffs in `outpath`, without the masked, coloured, COG and cube files made from them."""
+    return [
+        f
+        for f in os.listdir(outpath)
+        if f.endswith(".tiff") and not f.endswith(DERIVED_SUFFIXES)
+    ]
+
+
+def _chunks_for_budget(memory_mb):
+    """
+    Block size (rows, cols) that keeps a masking block within the worker memory budget.
+    Half of the budget is the GDAL block cache (see `_init_mask_worker`), the blocks get the other half.
+    A block holds the float32 pixels plus the upsampled copy and the mask, so allow ~16 bytes per pixel.
+    """
+    if memory_mb is None:
+        return None
+    side = int(math.sqrt(memory_mb / 2 * 1024 * 1024 / 16))
+    side = max(256, side // 256 * 256)
+    return (side, side)
+
+
+def _limit_blas_threads(threads):
+    """
+    Resize the BLAS/OpenMP pools numpy already started, when threadpoolctl is
+    installed.
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(threads)
+
+
+def _init_mask_worker(geom_wkb, geom_crs, memory_mb, threads=None):
+    """
+    Process pool initializer. Restores the geometry from WKB once for the lifetime of the worker
+    and pins GDAL to a single thread so that N workers use N cores rather than N * cores.
+
+    With `threads` the OpenMP/BLAS thread pools of the worker are limited as well: the variables are set in the
+    worker's own environment for the libraries that start their pools later, and the pools numpy started when
+    the worker imported this module are resized. Only pool workers pass `threads`, masking in the parent process
+    leaves its environment alone.
+    """
+    global _worker_geom, _worker_gdal_env
+
+    if threads is not None:
+        os.environ.update({var: str(threads) for var in _THREAD_ENV_VARS})
+        _limit_blas_threads(threads)
+    _worker_gdal_env = {"GDAL_NUM_THREADS": 1}
+    if memory_mb is not None:
+        # leave half of the budget for the numpy blocks, the rest is GDAL block cache
+        _worker_gdal_env["GDAL_CACHEMAX"] = max(16, int(memory_mb // 2))
+    _worker_geom = gpd.GeoSeries.from_wkb(geom_wkb, crs=geom_crs)
+
+
+def _mask_worker(tif, outpath, out_crscode, resample, chunks):
+    """Mask a single tiff inside a pool worker, returning (tif, output path or None, error or None)."""
+    try:
+        with rasterio.Env(**_worker_gdal_env):
+            masked = reproj_mask_windowed(
+                filename=tif,
+                input_filepath=outpath,
+                bbox=_worker_geom,
+                out_crscode=out_crscode,
+                output_filepath=outpath,
+                resample=resample,
+                chunks=chunks,
+                raise_errors=True,
+            )
+        return tif, masked, None
+    except Exception as e:
+        return tif, None, f"{type(e).__name__}: {e}"
+
+
 class data_source_interface:
     def fetch_data(self, settings):
         """Interface method to be overridden by concrete data source handlers."""
@@ -76,6 +194,9 @@ class data_source_factory:
         elif source_type == "SLGA":
             print("source type is SLGA")
             return SLGA_data_source()
+        elif source_type == "Radiometric":
+            print("source type is Radiometric")
+            return Radiometric_data_source()
         else:
             raise ValueError(f"Unknown data source: {source_type}")
 
@@ -110,6 +231,7 @@ class glob_DEM_data_source(data_source_interface):
                 layernames=settings.target_sources["DEM Global"],
                 bbox=settings.target_bbox,
                 outpath=settings.outpath,
+                memory_limit_mb=settings.memory_limit_mb,
             )
             return glob_dem_data
         except Exception as e:
@@ -123,33 +245,92 @@ class SLGA_data_source(data_source_interface):
 
     def fetch_data(self, settings):
         try:
+            layernames = []
             depth_min = []
             depth_max = []
-            for layername in settings.target_sources["SLGA"].keys():
-                depth_bounds = settings.target_sources["SLGA"][layername]
-                dmin, dmax = identifier2depthbounds(depth_bounds)
-                depth_min.append(dmin)
-                depth_max.append(dmax)
+            # depths that are not standard SLGA intervals, e.g. "0-30cm", are fetched as a depth weighted mean
+            weighted = []
+            for layername, depths in settings.target_sources["SLGA"].items():
+                depths = depths if isinstance(depths, list) else [depths]
+                standard = [d for d in depths if d in SLGA_DEPTH_OPTIONS]
+                weighted += [
+                    (layername, parse_depth_range(d))
+                    for d in depths
+                    if d not in SLGA_DEPTH_OPTIONS
+                ]
+                if standard:
+                    dmin, dmax = identifier2depthbounds(standard)
+                    layernames.append(layername)
+                    depth_min.append(dmin)
+                    depth_max.append(dmax)
+
+            files_slga = []
+            if layernames:
+                files_slga += (
+                    self.slga_harvester.get_slga_layers(
+                        property_name=settings.property_name,
+                        layernames=layernames,
+                        bbox=settings.target_bbox,
+                        outpath=settings.outpath,
+                        depth_min=depth_min,
+                        depth_max=depth_max,
+                        get_ci=settings.slga_ci,
+                    )
+                    or []
+                )
+            for layername, depth_range in weighted:
+                if depth_range is None:
+                    logger.error(f"Invalid SLGA depth range for {layername}")
+                    continue
+                fname = self.slga_harvester.get_slga_depth_weighted(
+                    property_name=settings.property_name,
+                    layername=layername,
+                    bbox=settings.target_bbox,
+                    outpath=settings.outpath,
+                    depth_min=depth_range[0],
+                    depth_max=depth_range[1],
+                    get_ci=settings.slga_ci,
+                )
+                if fname:
+                    files_slga.append(fname)
+            return files_slga
+        except Exception as e:
+            print(f"Error fetching SLGA data: {e}", exc_info=True)
+            return []
 
-            files_slga = self.slga_harvester.get_slga_layers(
+
+class Radiometric_data_source(data_source_interface):
+    def fetch_data(self, settings):
+        try:
+            radiometric_data = get_radiometric_layers(
                 property_name=settings.property_name,
-                layernames=list(settings.target_sources["SLGA"].keys()),
+                layernames=settings.target_sources["Radiometric"],
                 bbox=settings.target_bbox,
                 outpath=settings.outpath,
-                depth_min=depth_min,
-                depth_max=depth_max,
-                get_ci=False,  # Example flag, should be configured via settings if possible
+                # incremental runs only fetch missing or stale layers, an
+                # existing file was requested with other settings
+                overwrite=settings.incremental,
             )
-            return files_slga
+            return radiometric_data
         except Exception as e:
-            print(f"Error fetching SLGA data: {e}", exc_info=True)
+            logger.error(f"Error fetching Radiometric data: {e}", exc_info=True)
             return []
 
 
 class DataHarvester:
     def __init__(self, path_to_config, input_geom):
         config = load_settings(path_to_config)
-        self.settings = Settings(config)
+        self._setup(Settings(config), input_geom)
+
+    @classmethod
+    def from_settings(cls, settings, input_geom):
+        """Create a harvester from an existing `Settings` object rather than a config file."""
+        harvester = cls.__new__(cls)
+        harvester._setup(settings, input_geom)
+        return harvester
+
+    def _setup(self, settings, input_geom):
+        self.settings = settings
         self.input_geom = input_geom
 
         self.data_sources = {
@@ -163,44 +344,186 @@ class DataHarvester:
                 0.002, join_style=2, resolution=15
             )
 
+        manifest = (
+            HarvestManifest(self.settings.outpath)
+            if self.settings.incremental
+            else None
+        )
+
         for source_name, source in self.data_sources.items():
             try:
                 print(f"processing {source_name}:")
-                source.fetch_data(self.settings)
+                if manifest is None:
+                    source.fetch_data(self.settings)
+                    continue
+
+                stale = manifest.stale_units(
+                    source_name,
+                    self.settings.target_sources[source_name],
+                    self.settings,
+                )
+                if not stale:
+                    print(f"{source_name} is up to date, skipping download")
+                    continue
+
+                # only request the layers that are missing or stale
+                settings = copy.copy(self.settings)
+                settings.target_sources = dict(self.settings.target_sources)
+                settings.target_sources[source_name] = merge_target(stale)
+                files = source.fetch_data(settings)
+                manifest.record_outputs(source_name, stale, files, self.settings)
             except Exception as e:
-                print(f"error fetching {source_name}: {e}", exc_info=True)
+                logger.error(f"error fetching {source_name}: {e}", exc_info=True)
+
+        if manifest is not None:
+            manifest.save()
 
         if self.settings.data_mask:
-            self.mask_data()
+            self.mask_data(manifest)
+
+        if self.settings.cube:
+            self.build_cube()
+
+    def cube_path(self):
+        extension = "zarr" if self.settings.cube == "zarr" else "tiff"
+        return os.path.join(
+            self.settings.outpath, f"{self.settings.property_name}_cube.{extension}"
+        )
 
-    def mask_data(self):
+    def build_cube(self):
+        """
+        Align the harvested layers to a common grid and write them into one multi-band cube.
+
+        Masked layers are used when `data_mask` is set, otherwise the downloaded tiffs. The cube is only rebuilt
+        when it is missing, its layers changed or one of the layers is newer than it.
+
+        Returns:
+            str: Path of the cube, or None if there was nothing to build or building failed.
+        """
+        suffix = "_masked.tiff" if self.settings.data_mask else ".tiff"
+        excluded = tuple(s for s in DERIVED_SUFFIXES if s != "_masked.tiff")
         try:
-            tif_files = [
+            layers = sorted(
                 f
                 for f in os.listdir(self.settings.outpath)
-                if f.endswith(".tiff")
-                and not f.endswith(
-                    (
-                        "_masked.tiff",
-                        "_colored.tiff",
-                        "_cog.tiff",
-                        "_cog.public.tiff",
-                    )
-                )
-            ]
+                if f.endswith(suffix)
+                and not f.endswith(excluded)
+                and (self.settings.data_mask or not f.endswith("_masked.tiff"))
+            )
+        except Exception as e:
+            logger.error(f"Error listing layers for the cube: {e}", exc_info=True)
+            return None
+        if not layers:
+            return None
+
+        paths = [os.path.join(self.settings.outpath, f) for f in layers]
+        names = [band_name(f, self.settings.property_name) for f in layers]
+        cube_path = self.cube_path()
+        if cube_band_names(cube_path) == names and all(
+            os.path.getmtime(p) <= os.path.getmtime(cube_path) for p in paths
+        ):
+            print(f"{os.path.basename(cube_path)} is up to date")
+            return cube_path
+
+        try:
+            return build_cube(
+                paths,
+                cube_path,
+                target_crs=self.settings.target_crs,
+                resolution=self.settings.cube_resolution,
+                band_names=names,
+                resampling="bilinear" if self.settings.resample else "nearest",
+            )
+        except Exception as e:
+            logger.error(f"Error building cube {cube_path}: {e}", exc_info=True)
+            return None
+
+    def mask_data(self, manifest=None):
+        """
+        Mask every downloaded tiff in `outpath` to the input geometry.
+
+        If a `HarvestManifest` is given, tiffs whose `_masked.tiff` was already made from the same download,
+        geometry, target CRS and resample option are skipped, and new masks are recorded in the manifest.
+
+        Files are masked in a process pool of `mask_workers` processes (defaults to one per CPU, capped at the
+        number of files). The geometry is serialised once and handed to each worker when it starts, and
+        `mask_memory_mb` bounds the memory each worker uses for raster blocks and the GDAL cache.
+
+        Returns:
+            dict: {"masked": {tif: masked_path}, "failed": {tif: error message}}
+        """
+        results = {"masked": {}, "failed": {}}
+        try:
+            tif_files = list_downloads(self.settings.outpath)
         except Exception as e:
             logger.error(f"Error listing tiff files: {e}", exc_info=True)
+            return results
 
-        for tif in tif_files:
-            try:
-                print(f"Masking {tif}")
-                reproj_mask(
-                    filename=tif,
-                    input_filepath=self.settings.outpath,
-                    bbox=self.input_geom,
-                    out_crscode=self.settings.target_crs,
-                    output_filepath=self.settings.outpath,
-                    resample=self.settings.resample,
+        geom = self.input_geom
+        mask_options = {
+            "geometry": geometry_checksum(geom),
+            "target_crs": str(self.settings.target_crs),
+            "resample": bool(self.settings.resample),
+        }
+        if manifest is not None:
+            tif_files = [
+                tif
+                for tif in tif_files
+                if not manifest.derived_is_current(
+                    tif, tif.replace(".tiff", "_masked.tiff"), **mask_options
                 )
-            except Exception as e:
-                logger.error(f"Error masking {tif}: {e}", exc_info=True)
+            ]
+
+        if not tif_files:
+            return results
+
+        geom_crs = geom.crs.to_wkt() if geom.crs is not None else None
+        geom_wkb = list(geom.geometry.to_wkb())
+        memory_mb = self.settings.mask_memory_mb
+        chunks = _chunks_for_budget(memory_mb)
+        workers = self.settings.mask_workers or os.cpu_count() or 1
+        workers = max(1, min(int(workers), len(tif_files)))
+
+        args = [
+            (
+                tif,
+                self.settings.outpath,
+                self.settings.target_crs,
+                self.settings.resample,
+                chunks,
+            )
+            for tif in tif_files
+        ]
+
+        if workers == 1:
+            _init_mask_worker(geom_wkb, geom_crs, memory_mb)
+            outcomes = (_mask_worker(*arg) for arg in args)
+        else:
+            print(f"Masking {len(tif_files)} files with {workers} workers")
+            # spawn rather than fork, GDAL state is not safe to share with a forked child
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_mask_worker,
+                initargs=(geom_wkb, geom_crs, memory_mb, 1),
+            )
+            futures = [pool.submit(_mask_worker, *arg) for arg in args]
+            outcomes = (future.result() for future in as_completed(futures))
+
+        try:
+            for tif, masked, error in outcomes:
+                if error is None:
+                    print(f"Masked {tif}")
+                    results["masked"][tif] = masked
+                    if manifest is not None:
+                        manifest.record_derived(tif, masked, **mask_options)
+                else:
+                    logger.error(f"Error masking {tif}: {error}")
+                    results["failed"][tif] = error
+        finally:
+            if workers > 1:
+                pool.shutdown()
+            if manifest is not None:
+                manifest.save()
+
+        return results
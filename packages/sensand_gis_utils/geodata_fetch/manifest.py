@@ -0,0 +1,247 @@
+"""
+Incremental harvest manifest.
+
+The `HarvestManifest` class records what a `DataHarvester` run wrote into `outpath`, so that a re-run only fetches
+and masks what is missing or stale. The manifest is stored as `harvest_manifest.json` inside `outpath`.
+
+Each entry is one requested unit of data, e.g. `SLGA/Clay/0-5cm` or `Radiometric/radmap2019_grid_k_conc_filtered_awags_rad_2019`, and records:
+- `source`, `layer`, `depth`: what was requested.
+- `bbox`, `resolution`, `crs`: the harvest settings the data was requested with, and `ci` for SLGA, whether the
+  confidence interval bands were requested.
+- `source_version`: a hash of the data source config in the `data` package, so endpoint or product changes invalidate outputs.
+- `files`: the downloaded files and their sha256 checksums.
+- `derived`: files derived from the downloads (e.g. `_masked.tiff`) with their checksum, the checksum of the file they were derived from and the geometry/CRS/resample options used.
+
+An entry is current when the recorded request matches the new one and every file still exists with the recorded checksum.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+from importlib import resources
+
+logger = logging.getLogger()
+
+MANIFEST_FILENAME = "harvest_manifest.json"
+MANIFEST_VERSION = 1
+
+# data package config backing each data source, used to version the outputs
+SOURCE_CONFIGS = {
+    "DEM": "australia_dem_default_config.json",
+    "DEM Global": "stac_global_dem_default_config.json",
+    "SLGA": "slga_soil_default_config.json",
+    "Radiometric": "radiometric_default_config.json",
+}
+
+
+def file_checksum(path, block_size=1024 * 1024):
+    """Return the sha256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def geometry_checksum(geom):
+    """Return a sha256 hex digest identifying a GeoSeries/GeoDataFrame geometry and its CRS."""
+    digest = hashlib.sha256()
+    for wkb in geom.geometry.to_wkb():
+        digest.update(wkb)
+    digest.update(str(geom.crs).encode())
+    return digest.hexdigest()
+
+
+def source_version(source_name):
+    """Return a short hash of the data source config, or None if the source has no config."""
+    config_filename = SOURCE_CONFIGS.get(source_name)
+    if config_filename is None:
+        return None
+    try:
+        with resources.open_binary("data", config_filename) as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except Exception as e:
+        logger.error(f"Error reading {config_filename} for manifest: {e}")
+        return None
+
+
+def split_target(target):
+    """
+    Split the `target_sources` value of a source into (layer, depth) units.
+    SLGA targets are {layer: [depths]}, other sources are a layer name or a list of layer names.
+    """
+    if isinstance(target, dict):
+        return [
+            (layer, depth)
+            for layer, depths in target.items()
+            for depth in (depths if isinstance(depths, list) else [depths])
+        ]
+    if not isinstance(target, list):
+        target = [target]
+    return [(layer, None) for layer in target]
+
+
+def merge_target(units):
+    """Inverse of `split_target`, builds the `target_sources` value for a subset of units."""
+    if any(depth is not None for _, depth in units):
+        target = {}
+        for layer, depth in units:
+            target.setdefault(layer, []).append(depth)
+        return target
+    return [layer for layer, _ in units]
+
+
+def unit_key(source_name, layer, depth=None):
+    return "/".join(str(part) for part in (source_name, layer, depth) if part is not None)
+
+
+def _matches_unit(filename, layer, depth):
+    """
+    True if `filename` is an output of the (layer, depth) unit. Outputs are named `<layer>_...`
+    (e.g. `DEM_SRTM_...`) or `<source>_<layer>[_<depth>]_...` (e.g. `SLGA_Clay_0-5cm_...`), so the layer and depth
+    have to be whole `_` separated parts at the start of the name or right after the source. A layer or depth that
+    is only part of another one, or of the property name at the end, does not match.
+    """
+    parts = os.path.splitext(os.path.basename(filename))[0].split("_")
+    expected = layer.replace(" ", "_").split("_") + ([str(depth)] if depth is not None else [])
+    return any(parts[start : start + len(expected)] == expected for start in (0, 1))
+
+
+class HarvestManifest:
+    def __init__(self, outpath):
+        self.outpath = outpath
+        self.path = os.path.join(outpath, MANIFEST_FILENAME)
+        self.entries = {}
+        self._checksums = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest.get("outputs", {})
+        except Exception as e:
+            logger.error(
+                f"Error reading harvest manifest {self.path}, starting a new one: {e}"
+            )
+            self.entries = {}
+
+    def save(self):
+        os.makedirs(self.outpath, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "outputs": self.entries},
+                f,
+                indent=2,
+            )
+
+    def _checksum(self, filename):
+        # files are checksummed at most once per run
+        if filename not in self._checksums:
+            self._checksums[filename] = file_checksum(
+                os.path.join(self.outpath, filename)
+            )
+        return self._checksums[filename]
+
+    def _file_is_current(self, filename, checksum):
+        if not os.path.exists(os.path.join(self.outpath, filename)):
+            return False
+        return self._checksum(filename) == checksum
+
+    @staticmethod
+    def request(source_name, layer, depth, settings):
+        """The parameters that identify a unit of data, compared between runs."""
+        request = {
+            "source": source_name,
+            "layer": layer,
+            "depth": depth,
+            "bbox": [float(v) for v in settings.target_bbox],
+            "resolution": settings.target_res,
+            "crs": settings.target_crs,
+            "source_version": source_version(source_name),
+        }
+        if source_name == "SLGA":
+            # with the confidence intervals the same file has the 5 and 95 percentile bands as well
+            request["ci"] = bool(getattr(settings, "slga_ci", False))
+        return request
+
+    def is_current(self, source_name, layer, depth, settings):
+        entry = self.entries.get(unit_key(source_name, layer, depth))
+        if entry is None or not entry.get("files"):
+            return False
+        request = self.request(source_name, layer, depth, settings)
+        if any(entry.get(key) != value for key, value in request.items()):
+            return False
+        return all(
+            self._file_is_current(filename, checksum)
+            for filename, checksum in entry["files"].items()
+        )
+
+    def stale_units(self, source_name, target, settings):
+        """Return the (layer, depth) units of a source target that need to be (re)fetched."""
+        return [
+            (layer, depth)
+            for layer, depth in split_target(target)
+            if not self.is_current(source_name, layer, depth, settings)
+        ]
+
+    def record_outputs(self, source_name, units, files, settings):
+        """Record the files fetched for `units`, each file is attributed to the unit named in its filename."""
+        files = [f for f in files or [] if f and os.path.exists(f)]
+        for layer, depth in units:
+            unit_files = [f for f in files if _matches_unit(f, layer, depth)]
+            if not unit_files and len(units) == 1:
+                unit_files = files
+            if not unit_files:
+                logger.error(
+                    f"No output recorded for {unit_key(source_name, layer, depth)}"
+                )
+                continue
+            entry = self.request(source_name, layer, depth, settings)
+            entry["files"] = {}
+            entry["derived"] = {}
+            for f in unit_files:
+                filename = os.path.basename(f)
+                self._checksums.pop(filename, None)
+                entry["files"][filename] = self._checksum(filename)
+            self.entries[unit_key(source_name, layer, depth)] = entry
+
+    def _entry_for_file(self, filename):
+        for entry in self.entries.values():
+            if filename in entry.get("files", {}):
+                return entry
+        return None
+
+    def derived_is_current(self, filename, derived_filename, **options):
+        """
+        True if `derived_filename` was made from the current version of `filename` with the same options
+        (e.g. geometry checksum, target_crs, resample).
+        """
+        entry = self._entry_for_file(filename)
+        if entry is None:
+            return False
+        derived = entry.get("derived", {}).get(derived_filename)
+        if derived is None:
+            return False
+        if derived.get("from_checksum") != entry["files"][filename]:
+            return False
+        if derived.get("options") != options:
+            return False
+        return self._file_is_current(derived_filename, derived.get("checksum"))
+
+    def record_derived(self, filename, derived_path, **options):
+        entry = self._entry_for_file(filename)
+        if entry is None or derived_path is None:
+            return
+        derived_filename = os.path.basename(derived_path)
+        self._checksums.pop(derived_filename, None)
+        entry.setdefault("derived", {})[derived_filename] = {
+            "from_checksum": entry["files"][filename],
+            "checksum": self._checksum(derived_filename),
+            "options": copy.deepcopy(options),
+        }
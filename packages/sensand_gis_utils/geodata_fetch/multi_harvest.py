@@ -0,0 +1,226 @@
+"""
+This script contains the `MultiGeometryHarvester` class for harvesting many neighbouring properties at once.
+
+Harvesting each property with its own `DataHarvester` downloads the same coverage again for every property that
+overlaps or sits next to another one. Instead, `MultiGeometryHarvester`:
+1. Clusters the input geometries spatially. Geometries closer than `cluster_distance` are grouped, as long as the
+   cluster envelope stays within `max_cluster_extent` (both in degrees) and is no larger than the envelopes it replaces.
+2. Runs a `DataHarvester` once per cluster over the cluster's union envelope, so every layer is fetched once per cluster.
+3. Clips and masks every layer per geometry from the local cluster copy, writing `<outpath>/<property name>/<layer>_<property name>_masked.tiff`.
+4. Reports the bytes downloaded against an estimate of what fetching each geometry separately would have downloaded.
+
+To use it, create a `MultiGeometryHarvester` with the usual harvest config file and a GeoDataFrame of geometries,
+then call `run`. The `property_name` of the config is used as the prefix of the cluster names.
+"""
+
+import copy
+import logging
+import os
+
+import numpy as np
+import rasterio
+from shapely import STRtree, box
+
+from geodata_fetch.harvest import DataHarvester, Settings, list_downloads
+from geodata_fetch.utils import load_settings, reproj_mask_windowed
+
+logger = logging.getLogger()
+
+
+def _area(bounds):
+    return (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+
+
+def cluster_geometries(
+    geoms, cluster_distance=0.01, max_cluster_extent=0.5, max_area_ratio=1.0
+):
+    """
+    Group geometries whose envelopes are within `cluster_distance` of each other.
+
+    Two clusters are only merged when the merged envelope is no larger than `max_area_ratio` times the sum of their
+    envelopes, so clustering never downloads more than fetching the clusters separately (with the default ratio).
+
+    Args:
+        geoms (geopandas.GeoSeries): Geometries in EPSG:4326.
+        cluster_distance (float, optional): Maximum gap in degrees between envelopes of the same cluster. Defaults to 0.01.
+        max_cluster_extent (float, optional): Maximum width/height in degrees of a cluster envelope, stops a chain of
+            neighbours turning into one huge download. Defaults to 0.5.
+        max_area_ratio (float, optional): Maximum ratio of merged envelope area to the summed areas of the two
+            envelopes being merged. Values above 1 trade extra pixels for fewer requests. Defaults to 1.0.
+
+    Returns:
+        list: A list of clusters, each a list of positional indices into `geoms`.
+    """
+    bounds = np.asarray(geoms.bounds)
+    parent = list(range(len(bounds)))
+    cluster_bounds = {i: bounds[i].copy() for i in range(len(bounds))}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    envelopes = [box(*b).buffer(cluster_distance / 2, join_style=2) for b in bounds]
+    tree = STRtree(envelopes)
+    pairs = tree.query(envelopes, predicate="intersects")
+
+    # merge the closest neighbours first so the extent cap keeps the tightest clusters
+    gaps = [
+        box(*bounds[i]).distance(box(*bounds[j])) for i, j in zip(*pairs)
+    ]
+    for _, i, j in sorted(zip(gaps, *pairs)):
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        merged = np.concatenate(
+            [
+                np.minimum(cluster_bounds[root_i][:2], cluster_bounds[root_j][:2]),
+                np.maximum(cluster_bounds[root_i][2:], cluster_bounds[root_j][2:]),
+            ]
+        )
+        if max(merged[2] - merged[0], merged[3] - merged[1]) > max_cluster_extent:
+            continue
+        separate_area = _area(cluster_bounds[root_i]) + _area(cluster_bounds[root_j])
+        if _area(merged) > max_area_ratio * separate_area:
+            continue
+        parent[root_j] = root_i
+        cluster_bounds[root_i] = merged
+
+    clusters = {}
+    for i in range(len(bounds)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+
+def _payload_bytes(path, bounds_list):
+    """
+    Uncompressed pixel bytes of a raster, and of the windows covering each of `bounds_list` (same CRS as the raster).
+    """
+    with rasterio.open(path) as src:
+        pixel_bytes = src.count * np.dtype(src.dtypes[0]).itemsize
+        total = src.width * src.height * pixel_bytes
+        naive = 0
+        for bounds in bounds_list:
+            window = rasterio.windows.from_bounds(*bounds, transform=src.transform)
+            window = window.round_offsets(op="floor").round_lengths(op="ceil")
+            window = window.intersection(
+                rasterio.windows.Window(0, 0, src.width, src.height)
+            )
+            naive += int(window.width) * int(window.height) * pixel_bytes
+    return total, naive
+
+
+class MultiGeometryHarvester:
+    def __init__(
+        self,
+        path_to_config,
+        input_geoms,
+        name_column=None,
+        cluster_distance=0.01,
+        max_cluster_extent=0.5,
+        max_area_ratio=1.0,
+    ):
+        config = load_settings(path_to_config)
+        self.settings = Settings(config)
+        self.input_geoms = input_geoms.to_crs("EPSG:4326").reset_index(drop=True)
+        if name_column is not None:
+            self.names = [str(name) for name in self.input_geoms[name_column]]
+        else:
+            self.names = [
+                f"{self.settings.property_name}_{i}"
+                for i in range(len(self.input_geoms))
+            ]
+        self.cluster_distance = cluster_distance
+        self.max_cluster_extent = max_cluster_extent
+        self.max_area_ratio = max_area_ratio
+        self.report = {}
+
+    def _cluster_settings(self, cluster_name, bounds):
+        settings = copy.copy(self.settings)
+        settings.property_name = cluster_name
+        settings.target_bbox = [float(v) for v in bounds]
+        settings.outpath = os.path.join(self.settings.outpath, "clusters", cluster_name)
+        # masking happens per geometry, not on the cluster envelope
+        settings.data_mask = False
+        return settings
+
+    def run(self):
+        """
+        Harvest every cluster once and mask each geometry from its cluster's files.
+
+        Returns:
+            dict: Per-property masked files and the download report, with `downloaded_bytes`, `naive_bytes` and
+            `saved_bytes` as uncompressed pixel payload summed over all fetched layers.
+        """
+        geoms = self.input_geoms.geometry
+        if self.settings.add_buffer:
+            geoms = geoms.buffer(0.002, join_style=2, resolution=15)
+
+        clusters = cluster_geometries(
+            geoms,
+            self.cluster_distance,
+            self.max_cluster_extent,
+            self.max_area_ratio,
+        )
+        print(f"{len(geoms)} geometries grouped into {len(clusters)} clusters")
+
+        outputs = {name: [] for name in self.names}
+        downloaded_bytes = 0
+        naive_bytes = 0
+        for idx, members in enumerate(clusters):
+            cluster_name = f"{self.settings.property_name}_cluster{idx}"
+            cluster_geoms = geoms.iloc[members]
+            settings = self._cluster_settings(cluster_name, cluster_geoms.total_bounds)
+            print(f"processing {cluster_name} ({len(members)} geometries)")
+
+            harvester = DataHarvester.from_settings(settings, cluster_geoms)
+            harvester.run()
+
+            if not os.path.isdir(settings.outpath):
+                logger.error(f"No data harvested for {cluster_name}")
+                continue
+            for tif in list_downloads(settings.outpath):
+                tif_path = os.path.join(settings.outpath, tif)
+                try:
+                    with rasterio.open(tif_path) as src:
+                        member_bounds = [
+                            geoms.iloc[[m]].to_crs(src.crs).total_bounds
+                            for m in members
+                        ]
+                    total, naive = _payload_bytes(tif_path, member_bounds)
+                    downloaded_bytes += total
+                    naive_bytes += naive
+                except Exception as e:
+                    logger.error(f"Error measuring {tif}: {e}", exc_info=True)
+
+                for m in members:
+                    name = self.names[m]
+                    property_outpath = os.path.join(self.settings.outpath, name)
+                    os.makedirs(property_outpath, exist_ok=True)
+                    masked = reproj_mask_windowed(
+                        filename=tif,
+                        input_filepath=settings.outpath,
+                        bbox=geoms.iloc[[m]],
+                        out_crscode=self.settings.target_crs,
+                        output_filepath=property_outpath,
+                        resample=self.settings.resample,
+                        output_filename=tif.replace(cluster_name, name).replace(
+                            ".tiff", "_masked.tiff"
+                        ),
+                    )
+                    if masked is not None:
+                        outputs[name].append(masked)
+
+        self.report = {
+            "geometries": len(geoms),
+            "clusters": len(clusters),
+            "downloaded_bytes": downloaded_bytes,
+            "naive_bytes": naive_bytes,
+            "saved_bytes": naive_bytes - downloaded_bytes,
+        }
+        print(
+            f"Downloaded {downloaded_bytes / 1e6:.1f} MB of pixels, "
+            f"{naive_bytes / 1e6:.1f} MB estimated when fetching each geometry separately"
+        )
+        return {"outputs": outputs, "report": self.report}
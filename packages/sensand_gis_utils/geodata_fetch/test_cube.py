@@ -0,0 +1,120 @@
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from geodata_fetch.cube import CUBE_NODATA, band_name, build_cube, cube_band_names, cube_grid, open_cube
+
+
+def write_layer(path, data, transform, nodata, crs="EPSG:4326"):
+    profile = {
+        "driver": "GTiff",
+        "dtype": data.dtype.name,
+        "count": 1,
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+@pytest.fixture
+def layers(tmp_path):
+    # float32 with NaN nodata at 0.001 degrees
+    clay = np.arange(40 * 50, dtype="float32").reshape(40, 50)
+    clay[:5, :5] = np.nan
+    clay_path = write_layer(
+        tmp_path / "SLGA_Clay_0-5cm_farm_masked.tiff", clay, from_origin(116.0, -29.0, 0.001, 0.001), np.nan
+    )
+    # int16 with a -32768 nodata at 0.002 degrees, extending 0.01 degrees further east
+    dem = np.full((20, 30), 250, dtype="int16")
+    dem[-2:, -2:] = -32768
+    dem_path = write_layer(
+        tmp_path / "DEM_SRTM_1_Second_Hydro_Enforced_farm_masked.tiff",
+        dem,
+        from_origin(116.0, -29.0, 0.002, 0.002),
+        -32768,
+    )
+    return [clay_path, dem_path]
+
+
+def test_band_name():
+    assert band_name("/out/SLGA_Clay_0-5cm_farm_masked.tiff", "farm") == "SLGA_Clay_0-5cm"
+    assert band_name("SLGA_Clay_0-5cm_farm.tiff") == "SLGA_Clay_0-5cm_farm"
+
+
+def test_cube_grid(layers):
+    crs, transform, width, height = cube_grid(layers)
+    assert crs == "EPSG:4326"
+    # the finest resolution over the union of the extents
+    assert transform.a == pytest.approx(0.001) and transform.e == pytest.approx(-0.001)
+    assert (transform.c, transform.f) == pytest.approx((116.0, -29.0))
+    assert (width, height) == (60, 40)
+
+    _, transform, width, height = cube_grid(layers, resolution=0.004)
+    assert (width, height) == (15, 10)
+
+    crs, transform, width, height = cube_grid(layers, target_crs="EPSG:3857")
+    assert crs == "EPSG:3857"
+    # square pixels of the finest layer, in metres
+    assert transform.a == -transform.e and 100 < transform.a < 130
+
+    with pytest.raises(ValueError):
+        cube_grid([])
+
+
+def test_build_and_open_geotiff_cube(tmp_path, layers):
+    path = build_cube(layers, str(tmp_path / "farm_cube.tiff"), band_names=["clay", "dem"], resampling="nearest")
+
+    assert cube_band_names(path) == ["clay", "dem"]
+    with rasterio.open(path) as src:
+        assert (src.count, src.width, src.height, src.nodata) == (2, 60, 40, CUBE_NODATA)
+        assert src.tags(1) == {"source": "SLGA_Clay_0-5cm_farm_masked.tiff", "source_nodata": "nan"}
+        assert src.tags(2)["source_nodata"] == "-32768.0"
+        clay, dem = src.read()
+    # NaN and -32768 nodata both become the cube nodata, as do pixels outside a layer
+    assert (clay[:5, :5] == CUBE_NODATA).all() and (clay[:, 50:] == CUBE_NODATA).all()
+    assert clay[10, 10] == 10 * 50 + 10
+    assert (dem[-4:, -4:] == CUBE_NODATA).all()
+    assert dem[0, 0] == 250
+
+    cube = open_cube(path)
+    assert list(cube.band.values) == ["clay", "dem"]
+    assert cube.shape == (2, 40, 60)
+    values = cube.sel(band="clay").values
+    assert np.isnan(values[:5, :5]).all() and values[10, 10] == clay[10, 10]
+
+
+def test_build_cube_names_from_files(tmp_path, layers):
+    path = build_cube(layers, str(tmp_path / "cube.tiff"))
+    assert cube_band_names(path) == [band_name(layer) for layer in layers]
+    with pytest.raises(ValueError):
+        build_cube(layers, str(tmp_path / "cube.tiff"), band_names=["same", "same"])
+    with pytest.raises(ValueError):
+        build_cube(layers, str(tmp_path / "cube.tiff"), band_names=["clay"])
+
+
+def test_zarr_cube_needs_zarr(tmp_path, layers, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zarr", None)
+    with pytest.raises(ImportError, match="pip install zarr"):
+        build_cube(layers, str(tmp_path / "farm_cube.zarr"))
+
+
+def test_build_and_open_zarr_cube(tmp_path, layers):
+    pytest.importorskip("zarr")
+    path = build_cube(layers, str(tmp_path / "farm_cube.zarr"), band_names=["clay", "dem"], resampling="nearest")
+
+    assert cube_band_names(path) == ["clay", "dem"]
+    cube = open_cube(path)
+    assert list(cube.band.values) == ["clay", "dem"]
+    assert cube.shape == (2, 40, 60)
+    assert cube.attrs["source_nodata"] == ["nan", "-32768.0"]
+    clay, dem = cube.values
+    assert np.isnan(clay[:5, :5]).all() and clay[10, 10] == 10 * 50 + 10
+    assert np.isnan(dem[-4:, -4:]).all() and dem[0, 0] == 250
@@ -0,0 +1,140 @@
+from datetime import datetime
+
+import numpy as np
+import pystac
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rio_cogeo.cogeo import cog_validate
+
+from geodata_fetch import getdata_dem
+from geodata_fetch.getdata_dem import (
+    _chunk_size_for_memory,
+    dem_harvest_global,
+)
+
+# 0.01 x 0.01 degree DEM tile at 1 arc second, like a Copernicus GLO-30 item
+BBOX = [116.0, -29.01, 116.01, -29.0]
+RES = 1 / 3600
+
+
+def test_chunk_size_for_memory():
+    # 4 chunks in flight at 4x their float32 size in 1 GB
+    assert _chunk_size_for_memory(1024, 4) == 4096
+    assert _chunk_size_for_memory(64, 4) == 1024
+    # multiples of 512, between 512 and 8192
+    assert _chunk_size_for_memory(100, 4) == 1024
+    assert _chunk_size_for_memory(1, 4) == 512
+    assert _chunk_size_for_memory(100_000, 1) == 8192
+
+
+@pytest.fixture
+def stac_item(tmp_path):
+    """A local STAC item with one DEM asset covering the bbox and more."""
+    shape = (72, 72)
+    transform = from_origin(BBOX[0] - 0.005, BBOX[3] + 0.005, RES, RES)
+    path = str(tmp_path / "Copernicus_DSM_COG_10.tif")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": shape[1],
+        "height": shape[0],
+        "crs": "EPSG:4326",
+        "transform": transform,
+        "nodata": -9999.0,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.add.outer(np.arange(72), np.arange(72)), 1)
+
+    west, south, east, north = rasterio.transform.array_bounds(
+        *shape, transform
+    )
+    item = pystac.Item(
+        id="Copernicus_DSM_COG_10",
+        geometry={
+            "type": "Polygon",
+            "coordinates": [
+                [
+                    [west, south],
+                    [east, south],
+                    [east, north],
+                    [west, north],
+                    [west, south],
+                ]
+            ],
+        },
+        bbox=[west, south, east, north],
+        datetime=datetime(2021, 4, 22),
+        properties={
+            "proj:epsg": 4326,
+            "proj:shape": list(shape),
+            "proj:transform": list(transform)[:6],
+        },
+        collection="cop-dem-glo-30",
+    )
+    item.add_asset(
+        "data",
+        pystac.Asset(href=path, media_type=pystac.MediaType.COG),
+    )
+    return item
+
+
+@pytest.fixture
+def stac_load(monkeypatch, stac_item):
+    """Serve the local item instead of Earth Search, recording stac_load."""
+    calls = []
+    load = getdata_dem.stac_load
+
+    def recording_stac_load(items, **kwargs):
+        calls.append(kwargs)
+        return load(items, **kwargs)
+
+    monkeypatch.setattr(
+        getdata_dem, "search_stac", lambda url, bbox, collections: [stac_item]
+    )
+    monkeypatch.setattr(getdata_dem, "stac_load", recording_stac_load)
+    return calls
+
+
+def test_get_global_stac_dem_streams_to_a_cog(tmp_path, stac_load):
+    outpath = tmp_path / "out"
+    fnames = dem_harvest_global().get_global_stac_dem(
+        "farm",
+        "DEM Global",
+        BBOX,
+        str(outpath),
+        memory_limit_mb=64,
+        num_workers=4,
+    )
+
+    expected = str(outpath / "DEM_Global_COP_30_GLO_farm.tiff")
+    assert fnames == [expected]
+    # the mosaic is loaded lazily in chunks sized from the memory budget
+    assert stac_load[0]["chunks"] == {"x": 1024, "y": 1024}
+    # the tiled temporary file is removed
+    assert [p.name for p in outpath.iterdir()] == [
+        "DEM_Global_COP_30_GLO_farm.tiff"
+    ]
+    assert cog_validate(expected)[0]
+    with rasterio.open(expected) as src:
+        assert src.crs.to_epsg() == 3857
+        assert src.res == pytest.approx((30, 30))
+        data = src.read(1, masked=True)
+    # values come from the local asset, 0 to 142 across its grid
+    assert 0 <= data.min() and data.max() <= 142 and data.count() > 0
+
+
+def test_get_global_stac_dem_removes_the_temp_file_on_error(
+    tmp_path, stac_load, monkeypatch
+):
+    def failing_cog_translate(*args, **kwargs):
+        raise RuntimeError("no space left")
+
+    monkeypatch.setattr(getdata_dem, "cog_translate", failing_cog_translate)
+    outpath = tmp_path / "out"
+    fnames = dem_harvest_global().get_global_stac_dem(
+        "farm", ["DEM Global"], BBOX, str(outpath)
+    )
+    assert fnames is None
+    assert list(outpath.iterdir()) == []
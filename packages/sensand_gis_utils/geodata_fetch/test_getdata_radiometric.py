@@ -0,0 +1,143 @@
+import io
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+from shapely.geometry import box
+
+from geodata_fetch import getdata_radiometric
+from geodata_fetch.getdata_radiometric import get_radiometric_layers
+from geodata_fetch.harvest import (
+    DataHarvester,
+    Radiometric_data_source,
+    Settings,
+    data_source_factory,
+)
+
+BBOX = [116.0, -29.01, 116.01, -29.0]
+LAYER = "radmap2019_grid_k_conc_filtered_awags_rad_2019"
+LAYERS = [
+    LAYER,
+    "radmap2019_grid_th_conc_filtered_awags_rad_2019",
+    "radmap2019_grid_u_conc_filtered_awags_rad_2019",
+]
+
+
+class FakeWCS:
+    """
+    WebCoverageService serving tiles of the requested bbox whose pixels are the
+    west edge of the bbox, recording every service and coverage request.
+    """
+
+    instances = []
+    calls = []
+
+    def __init__(self, url, version, timeout):
+        FakeWCS.instances.append(url)
+
+    def __getitem__(self, layername):
+        if layername not in LAYERS:
+            raise KeyError(layername)
+        return SimpleNamespace(timepositions=["2019-01-01T00:00:00.000Z"])
+
+    def getCoverage(self, identifier, time, bbox, format, crs, width, height):
+        FakeWCS.calls.append((identifier, list(bbox)))
+        profile = {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": 1,
+            "width": width,
+            "height": height,
+            "crs": crs,
+            "transform": from_bounds(*bbox, width, height),
+        }
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as dst:
+                dst.write(np.full((1, height, width), bbox[0], "float32"))
+            return io.BytesIO(memfile.read())
+
+
+@pytest.fixture
+def wcs(monkeypatch):
+    FakeWCS.instances = []
+    FakeWCS.calls = []
+    monkeypatch.setattr(getdata_radiometric, "WebCoverageService", FakeWCS)
+    return FakeWCS
+
+
+def test_layers_share_one_service(tmp_path, wcs):
+    fnames = get_radiometric_layers(
+        "farm", LAYERS + ["unknown"], BBOX, str(tmp_path), max_workers=3
+    )
+
+    # one capabilities request for every layer and their time positions
+    assert len(wcs.instances) == 1
+    assert sorted(identifier for identifier, _ in wcs.calls) == sorted(LAYERS)
+    # every known layer is written, in the requested order
+    assert fnames == [
+        str(tmp_path / f"radiometric_{layer}_farm.tiff") for layer in LAYERS
+    ]
+    for fname in fnames:
+        with rasterio.open(fname) as src:
+            assert src.bounds.left == pytest.approx(BBOX[0])
+            # 0.01 degrees at 3.6 arc seconds
+            assert src.shape == (10, 10)
+
+
+def test_harvester_builds_the_radiometric_source(tmp_path, wcs):
+    assert isinstance(
+        data_source_factory.get_data_source("Radiometric"),
+        Radiometric_data_source,
+    )
+    config = SimpleNamespace(
+        target_sources={"Radiometric": LAYERS},
+        target_bbox=BBOX,
+        property_name="farm",
+        outpath=str(tmp_path),
+        target_crs="EPSG:4326",
+    )
+    geom = gpd.GeoDataFrame(geometry=[box(*BBOX)], crs="EPSG:4326")
+    harvester = DataHarvester.from_settings(Settings(config), geom)
+    assert isinstance(
+        harvester.data_sources["Radiometric"], Radiometric_data_source
+    )
+
+    harvester.run()
+    assert len(wcs.instances) == 1
+    for layer in LAYERS:
+        assert (tmp_path / f"radiometric_{layer}_farm.tiff").exists()
+
+
+def test_changed_bbox_fetches_the_layer_again(tmp_path, wcs):
+    config = SimpleNamespace(
+        target_sources={"Radiometric": [LAYER]},
+        target_bbox=BBOX,
+        property_name="farm",
+        outpath=str(tmp_path),
+        target_crs="EPSG:4326",
+    )
+    geom = gpd.GeoDataFrame(geometry=[box(*BBOX)], crs="EPSG:4326")
+    outfile = tmp_path / f"radiometric_{LAYER}_farm.tiff"
+
+    DataHarvester.from_settings(Settings(config), geom).run()
+    assert len(wcs.calls) == 1
+
+    # the same request again is up to date
+    DataHarvester.from_settings(Settings(config), geom).run()
+    assert len(wcs.calls) == 1
+
+    # the existing file was requested for the old bbox, it is replaced
+    config.target_bbox = [116.005, -29.01, 116.015, -29.0]
+    DataHarvester.from_settings(Settings(config), geom).run()
+    assert wcs.calls[-1] == (LAYER, config.target_bbox)
+    with rasterio.open(outfile) as src:
+        assert src.bounds.left == pytest.approx(116.005)
+        assert (src.read(1) == np.float32(116.005)).all()
+
+    # and the manifest records the new request as current
+    DataHarvester.from_settings(Settings(config), geom).run()
+    assert len(wcs.calls) == 2
@@ -0,0 +1,158 @@
+import io
+import os
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from geodata_fetch import getdata_slga
+from geodata_fetch.getdata_slga import depth_weighted_mean, overlapping_intervals, slga_harvest
+from geodata_fetch.harvest import DataHarvester, Settings
+
+BBOX = [116.0, -29.01, 116.01, -29.0]
+
+
+class FakeWCS:
+    """WebCoverageService serving 4x4 tiles whose pixels are the identifier, recording every request."""
+
+    calls = []
+
+    def __init__(self, url, version, timeout):
+        self.url = url
+
+    def getCoverage(self, identifier, **kwargs):
+        FakeWCS.calls.append((self.url, identifier))
+        data = np.full((1, 4, 4), float(identifier), dtype="float32")
+        data[0, 0, 0] = -9999
+        profile = {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": 1,
+            "width": 4,
+            "height": 4,
+            "crs": "EPSG:4326",
+            "transform": from_origin(BBOX[0], BBOX[3], 0.0025, 0.0025),
+            "nodata": -9999,
+        }
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as dst:
+                dst.write(data)
+            return io.BytesIO(memfile.read())
+
+
+@pytest.fixture
+def wcs(monkeypatch):
+    FakeWCS.calls = []
+    monkeypatch.setattr(getdata_slga, "WebCoverageService", FakeWCS)
+    return FakeWCS
+
+
+def test_getwcs_slga_ci_writes_one_band_per_identifier(tmp_path, wcs):
+    outfname = str(tmp_path / "clay.tiff")
+    bands = {"estimate": "1", "percentile_5": "3", "percentile_95": "2"}
+    assert slga_harvest().getwcs_slga_ci("https://example.com/clay", bands, BBOX, 0.0025, outfname)
+
+    assert sorted(identifier for _, identifier in wcs.calls) == ["1", "2", "3"]
+    with rasterio.open(outfname) as src:
+        assert src.descriptions == ("estimate", "percentile_5", "percentile_95")
+        data = src.read()
+    np.testing.assert_array_equal(data[:, 1, 1], [1, 3, 2])
+    # the source nodata is NaN in every band
+    assert np.isnan(data[:, 0, 0]).all()
+    # the band downloads are removed
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["clay.tiff"]
+
+
+def test_getwcs_slga_ci_fails_when_a_band_fails(tmp_path, wcs, monkeypatch):
+    harvester = slga_harvest()
+    download = harvester.getwcs_slga
+
+    def failing_percentile_5(url, identifier, *args):
+        return identifier != "3" and download(url, identifier, *args)
+
+    monkeypatch.setattr(harvester, "getwcs_slga", failing_percentile_5)
+    outfname = str(tmp_path / "clay.tiff")
+    bands = {"estimate": "1", "percentile_5": "3", "percentile_95": "2"}
+    assert not harvester.getwcs_slga_ci("https://example.com/clay", bands, BBOX, 0.0025, outfname)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_overlapping_intervals_are_weighted_by_overlap():
+    assert overlapping_intervals(0, 30) == [(0, 0, 5, 5), (1, 5, 15, 10), (2, 15, 30, 15)]
+    # partial overlaps only count the part inside the range
+    assert overlapping_intervals(10, 45) == [(1, 5, 15, 5), (2, 15, 30, 15), (3, 30, 60, 15)]
+    assert overlapping_intervals(60, 100) == [(4, 60, 100, 40)]
+    assert overlapping_intervals(200, 300) == []
+
+
+def test_depth_weighted_mean():
+    stack = np.ma.masked_array(
+        [[[1.0, 1.0]], [[4.0, 4.0]], [[7.0, 7.0]]],
+        mask=[[[False, False]], [[False, True]], [[False, False]]],
+    )
+    mean = depth_weighted_mean(stack, [5, 10, 15])
+    assert mean[0, 0] == pytest.approx((5 * 1 + 10 * 4 + 15 * 7) / 30)
+    # masked in any interval is masked in the mean
+    assert np.ma.getmaskarray(mean).tolist() == [[False, True]]
+
+
+def test_get_slga_depth_weighted(tmp_path, wcs):
+    harvester = slga_harvest()
+    fname = harvester.get_slga_depth_weighted("farm", "Clay", BBOX, str(tmp_path), 0, 30, resolution=9, get_ci=True)
+
+    assert fname == str(tmp_path / "SLGA_Clay_0-30cm_weighted_farm.tiff")
+    # identifiers 3 * interval + 1 are the estimates, + 2 the 95 and + 3 the 5 percentiles
+    assert sorted(int(identifier) for _, identifier in wcs.calls) == list(range(1, 10))
+    with rasterio.open(fname) as src:
+        assert src.descriptions == ("mean", "percentile_5", "percentile_95")
+        assert src.tags()["weights"] == "5,10,15"
+        data = src.read()
+    np.testing.assert_allclose(data[:, 1, 1], [(5 * 1 + 10 * 4 + 15 * 7) / 30, 7, 6])
+    assert np.isnan(data[:, 0, 0]).all()
+    # the interval downloads are removed
+    assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(fname)]
+
+
+def test_get_slga_depth_weighted_fails_when_an_interval_fails(tmp_path, wcs, monkeypatch):
+    harvester = slga_harvest()
+    download = harvester.getwcs_slga
+
+    def failing_5_15cm(url, identifier, *args):
+        return identifier != "4" and download(url, identifier, *args)
+
+    monkeypatch.setattr(harvester, "getwcs_slga", failing_5_15cm)
+
+    assert harvester.get_slga_depth_weighted("farm", "Clay", BBOX, str(tmp_path), 0, 30, resolution=9) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_toggling_slga_ci_fetches_the_layer_again(tmp_path, wcs):
+    config = SimpleNamespace(
+        target_sources={"SLGA": {"Clay": ["0-5cm"]}},
+        target_bbox=BBOX,
+        property_name="farm",
+        outpath=str(tmp_path),
+        target_crs="EPSG:4326",
+    )
+    geom = gpd.GeoDataFrame(geometry=[box(*BBOX)], crs="EPSG:4326")
+    outfile = tmp_path / "SLGA_Clay_0-5cm_farm.tiff"
+
+    DataHarvester.from_settings(Settings(config), geom).run()
+    with rasterio.open(outfile) as src:
+        assert src.count == 1
+    assert len(wcs.calls) == 1
+
+    # the same request again is up to date
+    DataHarvester.from_settings(Settings(config), geom).run()
+    assert len(wcs.calls) == 1
+
+    config.slga_ci = True
+    DataHarvester.from_settings(Settings(config), geom).run()
+    with rasterio.open(outfile) as src:
+        assert src.descriptions == ("estimate", "percentile_5", "percentile_95")
+    assert len(wcs.calls) == 4
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from geodata_fetch import harvest
+from geodata_fetch.harvest import (
+    DataHarvester,
+    Settings,
+    _chunks_for_budget,
+    _init_mask_worker,
+)
+
+# 40x40 pixels at 0.001 degrees from (116.0, -29.0), the geometry is the
+# middle 20x20
+GEOM = gpd.GeoDataFrame(
+    geometry=[box(116.01, -29.03, 116.03, -29.01)], crs="EPSG:4326"
+)
+
+
+def write_download(path):
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": 40,
+        "height": 40,
+        "crs": "EPSG:4326",
+        "transform": from_origin(116.0, -29.0, 0.001, 0.001),
+        "nodata": -9999.0,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(np.arange(1600, dtype="float32").reshape(1, 40, 40))
+
+
+def harvester(outpath, workers):
+    config = SimpleNamespace(
+        target_sources={},
+        target_bbox=list(GEOM.total_bounds),
+        property_name="farm",
+        outpath=str(outpath),
+        target_crs="EPSG:4326",
+        data_mask=True,
+        mask_workers=workers,
+        mask_memory_mb=64,
+        incremental=False,
+    )
+    return DataHarvester.from_settings(Settings(config), GEOM)
+
+
+def test_chunks_for_budget():
+    assert _chunks_for_budget(None) is None
+    # half of 512 MB at 16 bytes per pixel is 4096x4096
+    assert _chunks_for_budget(512) == (4096, 4096)
+    # rounded down to whole 256 pixel blocks, at least one block
+    assert _chunks_for_budget(16) == (512, 512)
+    assert _chunks_for_budget(1) == (256, 256)
+
+
+def test_init_mask_worker(monkeypatch):
+    for var in harvest._THREAD_ENV_VARS:
+        monkeypatch.setenv(var, "8")
+    wkb = list(GEOM.geometry.to_wkb())
+
+    # masking in the parent process leaves its environment alone
+    _init_mask_worker(wkb, GEOM.crs.to_wkt(), 64)
+    assert harvest._worker_geom.geom_equals(GEOM.geometry).all()
+    assert harvest._worker_gdal_env == {
+        "GDAL_NUM_THREADS": 1,
+        "GDAL_CACHEMAX": 32,
+    }
+    assert {os.environ[var] for var in harvest._THREAD_ENV_VARS} == {"8"}
+
+    _init_mask_worker(wkb, GEOM.crs.to_wkt(), None, threads=1)
+    assert harvest._worker_gdal_env == {"GDAL_NUM_THREADS": 1}
+    assert {os.environ[var] for var in harvest._THREAD_ENV_VARS} == {"1"}
+
+
+def test_pool_workers_are_single_threaded(monkeypatch):
+    for var in harvest._THREAD_ENV_VARS:
+        monkeypatch.setenv(var, "8")
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_mask_worker,
+        initargs=(list(GEOM.geometry.to_wkb()), GEOM.crs.to_wkt(), 64, 1),
+    ) as pool:
+        assert pool.submit(os.getenv, "OMP_NUM_THREADS").result() == "1"
+    assert os.environ["OMP_NUM_THREADS"] == "8"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mask_data_collects_failures(tmp_path, workers):
+    for name in ("a.tiff", "b.tiff"):
+        write_download(str(tmp_path / name))
+    (tmp_path / "broken.tiff").write_bytes(b"not a tiff")
+    environ = dict(os.environ)
+
+    results = harvester(tmp_path, workers).mask_data()
+
+    assert results["masked"] == {
+        "a.tiff": str(tmp_path / "a_masked.tiff"),
+        "b.tiff": str(tmp_path / "b_masked.tiff"),
+    }
+    assert list(results["failed"]) == ["broken.tiff"]
+    assert "broken.tiff" in results["failed"]["broken.tiff"]
+    with rasterio.open(str(tmp_path / "a_masked.tiff")) as src:
+        data = src.read(1, masked=True)
+    # clipped to the geometry, the middle 20x20 pixels
+    expected = np.arange(1600, dtype="float32").reshape(40, 40)[10:30, 10:30]
+    np.testing.assert_array_equal(data.filled(np.nan), expected)
+    # the parent environment is untouched
+    assert dict(os.environ) == environ
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from geodata_fetch.manifest import HarvestManifest, _matches_unit, geometry_checksum, merge_target, split_target
+
+
+def make_settings(**overrides):
+    settings = {
+        "target_bbox": [116.0, -29.01, 116.01, -29.0],
+        "target_res": 3,
+        "target_crs": "EPSG:4326",
+        "slga_ci": False,
+    }
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def write(path, content):
+    path.write_bytes(content)
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "filename, layer, depth, expected",
+    [
+        ("SLGA_Clay_0-5cm_farm.tiff", "Clay", "0-5cm", True),
+        ("SLGA_Clay_0-30cm_weighted_farm.tiff", "Clay", "0-30cm", True),
+        ("/out/SLGA_Organic_Carbon_5-15cm_farm.tiff", "Organic_Carbon", "5-15cm", True),
+        ("DEM_SRTM_1_Second_Hydro_Enforced_farm.tiff", "DEM", None, True),
+        ("DEM_Global_COP_30_GLO_farm.tiff", "DEM Global", None, True),
+        ("radiometric_radmap2019_grid_k_conc_filtered_awags_rad_2019_farm.tiff",
+         "radmap2019_grid_k_conc_filtered_awags_rad_2019", None, True),
+        # another depth that contains the requested one
+        ("SLGA_Clay_15-30cm_farm.tiff", "Clay", "5-30cm", False),
+        ("SLGA_Clay_100-200cm_farm.tiff", "Clay", "0-200cm", False),
+        # the layer name only appears in the property name
+        ("SLGA_Sand_0-5cm_Clay_paddock.tiff", "Clay", "0-5cm", False),
+        ("SLGA_Sand_0-5cm_Clay.tiff", "Clay", None, False),
+        # a layer that is a suffix of another layer
+        ("radiometric_radmap2019_grid_uk_ratio_awags_rad_2019_farm.tiff", "k_ratio_awags_rad_2019", None, False),
+    ],
+)
+def test_matches_unit(filename, layer, depth, expected):
+    assert _matches_unit(filename, layer, depth) is expected
+
+
+def test_split_and_merge_target():
+    units = split_target({"Clay": ["0-5cm", "5-15cm"], "Sand": "0-5cm"})
+    assert units == [("Clay", "0-5cm"), ("Clay", "5-15cm"), ("Sand", "0-5cm")]
+    assert merge_target(units) == {"Clay": ["0-5cm", "5-15cm"], "Sand": ["0-5cm"]}
+    assert split_target("DEM") == [("DEM", None)]
+    assert merge_target(split_target(["a", "b"])) == ["a", "b"]
+
+
+def test_files_are_attributed_to_their_unit(tmp_path):
+    manifest = HarvestManifest(str(tmp_path))
+    settings = make_settings()
+    clay = write(tmp_path / "SLGA_Clay_0-5cm_Sand.tiff", b"clay")
+    sand = write(tmp_path / "SLGA_Sand_0-5cm_Sand.tiff", b"sand")
+    manifest.record_outputs("SLGA", [("Clay", "0-5cm"), ("Sand", "0-5cm")], [clay, sand], settings)
+
+    assert list(manifest.entries["SLGA/Clay/0-5cm"]["files"]) == ["SLGA_Clay_0-5cm_Sand.tiff"]
+    assert list(manifest.entries["SLGA/Sand/0-5cm"]["files"]) == ["SLGA_Sand_0-5cm_Sand.tiff"]
+
+
+def test_stale_units_after_changes(tmp_path):
+    settings = make_settings()
+    target = {"Clay": ["0-5cm", "5-15cm"]}
+    manifest = HarvestManifest(str(tmp_path))
+    assert manifest.stale_units("SLGA", target, settings) == [("Clay", "0-5cm"), ("Clay", "5-15cm")]
+
+    files = [
+        write(tmp_path / "SLGA_Clay_0-5cm_farm.tiff", b"top"),
+        write(tmp_path / "SLGA_Clay_5-15cm_farm.tiff", b"middle"),
+    ]
+    manifest.record_outputs("SLGA", split_target(target), files, settings)
+    manifest.save()
+
+    # a new run reads the manifest back
+    manifest = HarvestManifest(str(tmp_path))
+    assert manifest.stale_units("SLGA", target, settings) == []
+    # a new depth is the only stale unit
+    assert manifest.stale_units("SLGA", {"Clay": ["0-5cm", "15-30cm"]}, settings) == [("Clay", "15-30cm")]
+    # changed request settings make every unit stale
+    for changed in (
+        make_settings(target_bbox=[116.0, -29.02, 116.01, -29.0]),
+        make_settings(target_res=1),
+        make_settings(target_crs="EPSG:3857"),
+        make_settings(slga_ci=True),
+    ):
+        assert len(manifest.stale_units("SLGA", target, changed)) == 2
+
+    # a file changed on disk fails its checksum, a deleted one is missing
+    write(tmp_path / "SLGA_Clay_0-5cm_farm.tiff", b"changed")
+    (tmp_path / "SLGA_Clay_5-15cm_farm.tiff").unlink()
+    manifest = HarvestManifest(str(tmp_path))
+    assert manifest.stale_units("SLGA", target, settings) == [("Clay", "0-5cm"), ("Clay", "5-15cm")]
+
+
+def test_derived_files_follow_their_source(tmp_path):
+    settings = make_settings()
+    geom = gpd.GeoDataFrame(geometry=[box(116.0, -29.01, 116.01, -29.0)], crs="EPSG:4326")
+    options = {"geometry": geometry_checksum(geom), "target_crs": "EPSG:4326", "resample": False}
+    manifest = HarvestManifest(str(tmp_path))
+    source = write(tmp_path / "SLGA_Clay_0-5cm_farm.tiff", b"source")
+    manifest.record_outputs("SLGA", [("Clay", "0-5cm")], [source], settings)
+    masked = write(tmp_path / "SLGA_Clay_0-5cm_farm_masked.tiff", b"masked")
+
+    assert not manifest.derived_is_current("SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **options)
+    manifest.record_derived("SLGA_Clay_0-5cm_farm.tiff", masked, **options)
+    assert manifest.derived_is_current("SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **options)
+
+    # another geometry or option needs a new mask
+    other = geometry_checksum(geom.set_geometry([box(116.0, -29.01, 116.02, -29.0)]))
+    assert not manifest.derived_is_current(
+        "SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **{**options, "geometry": other}
+    )
+    assert not manifest.derived_is_current(
+        "SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **{**options, "resample": True}
+    )
+
+    # a new download of the source invalidates the mask made from the old one
+    write(tmp_path / "SLGA_Clay_0-5cm_farm.tiff", b"new source")
+    manifest.record_outputs("SLGA", [("Clay", "0-5cm")], [source], settings)
+    assert not manifest.derived_is_current("SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **options)
+
+    # so does a mask edited before the next run
+    manifest.record_derived("SLGA_Clay_0-5cm_farm.tiff", masked, **options)
+    manifest.save()
+    write(tmp_path / "SLGA_Clay_0-5cm_farm_masked.tiff", b"edited")
+    manifest = HarvestManifest(str(tmp_path))
+    assert not manifest.derived_is_current("SLGA_Clay_0-5cm_farm.tiff", "SLGA_Clay_0-5cm_farm_masked.tiff", **options)
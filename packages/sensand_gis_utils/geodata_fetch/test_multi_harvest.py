@@ -0,0 +1,101 @@
+import io
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from geodata_fetch import harvest
+from geodata_fetch.multi_harvest import MultiGeometryHarvester, cluster_geometries
+
+RES = 0.001
+
+
+class LocalSource:
+    """Data source writing a raster of the requested bbox, plus the derived files a harvest leaves next to it."""
+
+    def __init__(self):
+        self.bboxes = []
+
+    def fetch_data(self, settings):
+        self.bboxes.append(settings.target_bbox)
+        min_x, min_y, max_x, max_y = settings.target_bbox
+        width, height = round((max_x - min_x) / RES), round((max_y - min_y) / RES)
+        profile = {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": 1,
+            "width": width,
+            "height": height,
+            "crs": "EPSG:4326",
+            "transform": from_origin(min_x, max_y, RES, RES),
+            "nodata": np.nan,
+        }
+        os.makedirs(settings.outpath, exist_ok=True)
+        path = os.path.join(settings.outpath, f"SLGA_Clay_0-5cm_{settings.property_name}.tiff")
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(np.ones((1, height, width), dtype="float32"))
+        for suffix in ("_cog.public.tiff", "_colored.tiff", "_cube.tiff"):
+            with rasterio.open(path.replace(".tiff", suffix), "w", **profile) as dst:
+                dst.write(np.zeros((1, height, width), dtype="float32"))
+        return [path]
+
+
+def test_cluster_geometries():
+    geoms = gpd.GeoSeries(
+        [
+            box(116.000, -29.010, 116.010, -29.000),
+            box(116.008, -29.010, 116.018, -29.000),
+            box(116.500, -29.010, 116.510, -29.000),
+            # near the first two, but merging it would grow the envelope beyond the boxes
+            box(116.000, -29.014, 116.010, -29.011),
+        ],
+        crs="EPSG:4326",
+    )
+    clusters = sorted(sorted(c) for c in cluster_geometries(geoms, cluster_distance=0.005))
+    assert clusters == [[0, 1], [2], [3]]
+    # the envelope may grow, within the extent cap
+    assert len(cluster_geometries(geoms, cluster_distance=0.05, max_area_ratio=100)) == 2
+    assert len(cluster_geometries(geoms, cluster_distance=0.05, max_cluster_extent=0.015, max_area_ratio=100)) == 3
+
+
+def test_multi_harvest_masks_each_property(tmp_path, monkeypatch):
+    source = LocalSource()
+    monkeypatch.setattr(harvest.data_source_factory, "get_data_source", staticmethod(lambda key: source))
+    config = {
+        "target_sources": {"SLGA": {"Clay": ["0-5cm"]}},
+        "target_bbox": [],
+        "property_name": "farm",
+        "outpath": str(tmp_path),
+        "target_crs": "EPSG:4326",
+        "date_start": "2020-01-01",
+        "date_end": "2020-12-31",
+    }
+    geoms = gpd.GeoDataFrame(
+        {"name": ["north", "south", "far"]},
+        geometry=[
+            box(116.000, -29.010, 116.010, -29.000),
+            box(116.008, -29.010, 116.018, -29.000),
+            box(116.500, -29.010, 116.510, -29.000),
+        ],
+        crs="EPSG:4326",
+    )
+
+    result = MultiGeometryHarvester(
+        io.StringIO(json.dumps(config)), geoms, name_column="name", cluster_distance=0.005
+    ).run()
+
+    # two downloads, one per cluster
+    assert sorted(source.bboxes) == [[116.0, -29.01, 116.018, -29.0], [116.5, -29.01, 116.51, -29.0]]
+    assert result["report"]["clusters"] == 2
+    for name, geom in zip(geoms["name"], geoms.geometry):
+        # only the download is masked, not the COG, coloured or cube files next to it
+        assert [os.path.basename(f) for f in result["outputs"][name]] == [f"SLGA_Clay_0-5cm_{name}_masked.tiff"]
+        assert sorted(os.listdir(tmp_path / name)) == [f"SLGA_Clay_0-5cm_{name}_masked.tiff"]
+        with rasterio.open(result["outputs"][name][0]) as src:
+            np.testing.assert_allclose(src.bounds, geom.bounds, atol=RES)
+            data = src.read(1)
+        assert np.nanmin(data) == 1
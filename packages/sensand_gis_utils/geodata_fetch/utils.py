@@ -17,6 +17,8 @@ _read_file: Reads a raster file using rasterio library.
 
 reproj_mask: Masks a raster to the area of a shape, and reprojects.
 
+reproj_mask_windowed: Single-pass replacement for reproj_mask that only reads the source window covering the shape.
+
 colour_geotiff_and_save_cog: Colorizes a GeoTIFF image using a specified color map and saves it as a COG (Cloud-Optimized GeoTIFF).
 
 retry_decorator: A decorator to retry the WCS endpoint if an HTTP 502 or 503 error occurs.
@@ -35,15 +37,16 @@ from types import SimpleNamespace
 import numpy as np
 import rasterio
 import rioxarray as rxr
-from matplotlib import cm
-from matplotlib.colors import Normalize
+import shapely
+from affine import Affine
+from gis_utils.colourise import colourise_to_cog
 from owslib.wcs import WebCoverageService
 from rasterio.enums import Resampling
-from rasterio.io import MemoryFile
-from rasterio.plot import reshape_as_raster
+from rasterio.features import rasterize
+from rasterio.vrt import WarpedVRT
 from rasterio.warp import Resampling, calculate_default_transform
-from rio_cogeo.cogeo import cog_translate
-from rio_cogeo.profiles import cog_profiles
+from rasterio.windows import Window
+from rioxarray.rioxarray import affine_to_coords
 
 logger = logging.getLogger()
 # try this but remove if it doesn't work well with datadog:
@@ -337,66 +340,347 @@ def reproj_mask(
         return None
 
 
-def colour_geotiff_and_save_cog(input_geotiff, colour_map):
-    output_colored_tiff_filename = input_geotiff.replace(".tiff", "_colored.tiff")
-    output_cog_filename = input_geotiff.replace(".tiff", "_cog.public.tiff")
+class _Grid:
+    """
+    Internal grid of `width` x `height` pixels, kept the way rioxarray keeps the grid of a raster: the pixel
+    centre coordinates and a cached transform. `reproj_mask` derives every grid from these, so repeating
+    rioxarray's arithmetic here reproduces its grids to the last bit without creating any array.
+    """
 
-    try:
-        with rasterio.open(input_geotiff) as src:
-            meta = src.meta.copy()
-            dst_crs = rasterio.crs.CRS.from_epsg(4326)
-            transform, width, height = calculate_default_transform(
-                src.crs, dst_crs, src.width, src.height, *src.bounds
-            )
+    def __init__(self, transform, width, height, xs=None, ys=None):
+        self.width = width
+        self.height = height
+        self._transform = transform
+        if xs is None or ys is None:
+            coords = affine_to_coords(transform, width, height)
+            xs, ys = coords["x"], coords["y"]
+        self.xs = xs
+        self.ys = ys
+
+    def resolution(self, recalc=False):
+        if not recalc or self.width == 1 or self.height == 1:
+            return self._transform.a, self._transform.e
+        return (
+            (self.xs[-1] - self.xs[0]) / (self.width - 1),
+            (self.ys[-1] - self.ys[0]) / (self.height - 1),
+        )
 
-            meta.update(
-                {
-                    "crs": dst_crs,
-                    "transform": transform,
-                    "width": width,
-                    "height": height,
-                }
-            )
+    def bounds(self, recalc=False):
+        res_x, res_y = self.resolution(recalc=recalc)
+        return (
+            float(self.xs[0]) - res_x / 2.0,
+            float(self.ys[-1]) + res_y / 2.0,
+            float(self.xs[-1]) + res_x / 2.0,
+            float(self.ys[0]) - res_y / 2.0,
+        )
 
-            tif_data = src.read(1, masked=True).astype("float32")
-            tif_formatted = tif_data.filled(np.nan)
+    def transform(self, recalc=False):
+        left, _, _, top = self.bounds(recalc=recalc)
+        return Affine.translation(left, top) @ Affine.scale(*self.resolution(recalc=recalc))
 
-            cmap = cm.get_cmap(colour_map)
-            na = tif_formatted[~np.isnan(tif_formatted)]
+    def isel_window(self, window):
+        (row_start, row_stop), (col_start, col_stop) = window.toranges()
+        rows, cols = slice(int(row_start), int(row_stop)), slice(int(col_start), int(col_stop))
+        transform = rasterio.windows.transform(
+            Window.from_slices(rows, cols, width=self.width, height=self.height),
+            self.transform(recalc=True),
+        )
+        return _Grid(
+            transform, cols.stop - cols.start, rows.stop - rows.start, self.xs[cols], self.ys[rows]
+        )
 
-            min_value = min(na)
-            max_value = max(na)
 
-            norm = Normalize(vmin=min_value, vmax=max_value)
+def _pixel_geometries(geometries, transform):
+    """
+    Internal function returning `geometries` in the pixel coordinates of the north up grid `transform`,
+    computed with the inverse geotransform GDAL applies when rasterising on the whole grid. Windows of the
+    grid are then whole pixel shifts, and rasterising them burns exactly the pixels the whole grid would.
+    """
+    inverse = (
+        -transform.c / transform.a,
+        1.0 / transform.a,
+        -transform.f / transform.e,
+        1.0 / transform.e,
+    )
+
+    def to_pixels(coords):
+        return np.column_stack(
+            (inverse[0] + coords[:, 0] * inverse[1], inverse[2] + coords[:, 1] * inverse[3])
+        )
 
-            coloured_data = (cmap(norm(tif_formatted))[:, :, :3] * 255).astype(np.uint8)
+    return [shapely.transform(geometry, to_pixels) for geometry in geometries]
 
-            meta.update({"count": 3})
 
-            with rasterio.open(output_colored_tiff_filename, "w", **meta) as dst:
-                reshape = reshape_as_raster(coloured_data)
-                dst.write(reshape)
+def _rasterize_window(pixel_geometries, window):
+    """
+    Internal function returning the pixels of `window` touched by geometries in pixel coordinates.
+    """
+    return rasterize(
+        pixel_geometries,
+        out_shape=(int(window.height), int(window.width)),
+        transform=Affine.translation(window.col_off, window.row_off),
+        all_touched=True,
+        dtype="uint8",
+    ).view(bool)
 
-        try:
-            dst_profile = cog_profiles.get("deflate")
-            with MemoryFile() as mem_dst:
-                cog_translate(
-                    output_colored_tiff_filename,
-                    output_cog_filename,
-                    config=dst_profile,
-                    in_memory=True,
-                    dtype="uint8",
-                    add_mask=False,
-                    nodata=0,
-                    dst_kwargs=dst_profile,
-                )
 
-        except Exception as e:
-            logger.error(
-                f"Error converting {output_colored_tiff_filename} to COG: {e}",
-                exc_info=True,
+def _touched_window(pixel_geometries, width, height, rows=None):
+    """
+    Internal function returning the window of the pixels of a `width` x `height` grid touched by geometries in
+    pixel coordinates, as rioxarray's clip crops it, or None if no pixel is touched. The mask is rasterised
+    `rows` rows at a time over the pixels around the geometry bounds, never over the whole grid.
+    """
+    extents = np.array([geometry.bounds for geometry in pixel_geometries])
+    # one pixel of margin for all_touched on the pixel edges
+    col_start = max(int(np.floor(extents[:, 0].min())) - 1, 0)
+    row_start = max(int(np.floor(extents[:, 1].min())) - 1, 0)
+    col_stop = min(int(np.ceil(extents[:, 2].max())) + 1, width)
+    row_stop = min(int(np.ceil(extents[:, 3].max())) + 1, height)
+    if row_start >= row_stop or col_start >= col_stop:
+        return None
+    rows = rows or row_stop - row_start
+
+    touched_rows, touched_cols = [], np.zeros(col_stop - col_start, dtype=bool)
+    for row in range(row_start, row_stop, rows):
+        strip = Window.from_slices((row, min(row + rows, row_stop)), (col_start, col_stop))
+        inside = _rasterize_window(pixel_geometries, strip)
+        touched_rows.extend(row + np.flatnonzero(inside.any(axis=1)))
+        touched_cols |= inside.any(axis=0)
+    if not touched_rows:
+        return None
+    touched_cols = col_start + np.flatnonzero(touched_cols)
+    return Window.from_slices(
+        (touched_rows[0], touched_rows[-1] + 1), (touched_cols[0], touched_cols[-1] + 1)
+    )
+
+
+def _nearest_index(start, count, transform, src_transform, size, axis):
+    """
+    Internal function mapping `count` pixels of a grid, from pixel `start` along `axis` ("x" or "y"), to the
+    pixels of `src_transform` a nearest neighbour warp samples, -1 where the pixel centre falls outside the `size`
+    source pixels.
+    """
+    centres = np.arange(start, start + count) + 0.5
+    if axis == "x":
+        coords = transform.c + centres * transform.a
+        index = np.floor((coords - src_transform.c) / src_transform.a).astype("int64")
+    else:
+        coords = transform.f + centres * transform.e
+        index = np.floor((coords - src_transform.f) / src_transform.e).astype("int64")
+    index[(index < 0) | (index >= size)] = -1
+    return index
+
+
+def _warp_mask_block(vrt, rows, cols, inside, src_nodata):
+    """
+    Internal function that warps, converts to float32 and masks a single block. `rows`/`cols` index the rows and
+    columns of `vrt` each output pixel samples (-1 outside the clip) and `inside` is the clip mask at those pixels.
+    """
+    data = np.full((vrt.count, len(rows), len(cols)), np.nan, dtype="float32")
+    keep_rows, keep_cols = rows >= 0, cols >= 0
+    if not keep_rows.any() or not keep_cols.any():
+        return data
+    row_start, row_stop = rows[keep_rows].min(), rows[keep_rows].max() + 1
+    col_start, col_stop = cols[keep_cols].min(), cols[keep_cols].max() + 1
+    source = vrt.read(window=Window.from_slices((row_start, row_stop), (col_start, col_stop))).astype("float32")
+    if src_nodata is not None and not np.isnan(src_nodata):
+        source[source == src_nodata] = np.nan
+    block = source[:, (rows[keep_rows] - row_start)[:, None], cols[keep_cols] - col_start]
+    block[:, ~inside] = np.nan
+    data[:, np.flatnonzero(keep_rows)[:, None], np.flatnonzero(keep_cols)] = block
+    return data
+
+
+def reproj_mask_windowed(
+    filename,
+    input_filepath,
+    bbox,
+    out_crscode,
+    output_filepath,
+    resample=False,
+    chunks=None,
+    raise_errors=False,
+    output_filename=None,
+):
+    """
+    Single-pass replacement for `reproj_mask`. The grids `reproj_mask` goes through (reprojected, upsampled,
+    clipped and reprojected again) are derived from the source raster without reading it, then only the source
+    pixels underneath the clipped window are read, and the warp, float32 conversion and mask are applied in one
+    pass before writing the `_masked.tiff`.
+
+    The output grid and pixel values match those written by `reproj_mask` (nearest neighbour resampling,
+    pixels touching the geometry kept, everything else NaN), also when the source is already in `out_crscode`.
+    The clip mask is rasterised per block, so where the geometry boundary runs exactly along pixel edges or
+    through pixel corners a pixel on the boundary may be kept or dropped differently than on the whole grid,
+    and with it an edge row or column of the output.
+    Source NoData values are converted to NaN for every input dtype, not only uint16.
+
+    Args:
+        filename (str): The name of the input raster file.
+        input_filepath (str): The path to the directory containing the input raster file.
+        bbox (geopandas.GeoDataFrame or geopandas.GeoSeries): The geometry used for clipping the raster.
+        out_crscode (str): The CRS code to reproject the raster to.
+        output_filepath (str): The path to the directory where the masked raster will be saved.
+        resample (bool, optional): Flag indicating whether to upsample pixels 3x (nearest). Defaults to False.
+        chunks (int or tuple, optional): Block size (rows, cols) to stream the output in, the clip mask is
+            rasterised per block too. If None, the clipped window is processed in memory in a single block.
+            Defaults to None.
+        raise_errors (bool, optional): Re-raise errors after logging them instead of returning None. Defaults to False.
+        output_filename (str, optional): Name of the masked raster. Defaults to `filename` with a `_masked.tiff` suffix.
+
+    Returns:
+        str: The path of the masked raster, or None if an error occurred.
+    """
+    input_full_filepath = os.path.join(input_filepath, filename)
+    masked_filepath = output_filename or filename.replace(".tiff", "_masked.tiff")
+    mask_outpath = os.path.join(output_filepath, masked_filepath)
+
+    try:
+        dst_crs = rasterio.crs.CRS.from_user_input(out_crscode)
+        if bbox.crs != dst_crs:
+            logger.info(
+                f"Reprojecting geometry, input crs:{bbox.crs}, output crs:{out_crscode}"
+            )
+            bbox = bbox.to_crs(dst_crs)
+        geometries = list(bbox.geometry)
+
+        if chunks is not None:
+            chunks = chunks if isinstance(chunks, (tuple, list)) else (chunks, chunks)
+
+        # the grids of reproj_mask, derived the way it derives them (no pixels read)
+        with rasterio.open(input_full_filepath) as source:
+            source_grid = _Grid(source.transform, source.width, source.height)
+            if source.crs.to_epsg() != out_crscode:
+                warped = calculate_default_transform(
+                    source.crs, dst_crs, source.width, source.height, *source_grid.bounds()
+                )
+            else:
+                warped = (source_grid.transform(), source.width, source.height)
+        warped_grid = _Grid(*warped)
+        grid = warped_grid
+        if resample:
+            upscale_factor = 3
+            grid = _Grid(
+                *calculate_default_transform(
+                    dst_crs,
+                    dst_crs,
+                    warped_grid.width,
+                    warped_grid.height,
+                    *warped_grid.bounds(),
+                    dst_width=warped_grid.width * upscale_factor,
+                    dst_height=warped_grid.height * upscale_factor,
+                )
             )
+        transform = grid.transform(recalc=True)
+
+        # the data window of the pixels touched by the geometry, as rioxarray's clip crops it
+        pixel_geometries = _pixel_geometries(geometries, transform)
+        clip_window = _touched_window(
+            pixel_geometries, grid.width, grid.height, rows=chunks and chunks[0]
+        )
+        if clip_window is None:
+            raise ValueError(f"No data found in bounds of {filename}")
+        clipped = grid.isel_window(clip_window)
+        clip_transform = clipped.transform(recalc=True)
+        out_transform, out_width, out_height = calculate_default_transform(
+            dst_crs, dst_crs, clipped.width, clipped.height, *clipped.bounds()
+        )
+
+        # output pixel -> clipped pixel -> pixel of the (upsampled) grid -> pixel of the warped source
+        clip_sizes = {"x": clipped.width, "y": clipped.height}
+        clip_offsets = {"x": clip_window.col_off, "y": clip_window.row_off}
+        if grid is warped_grid:
+            warped_index = None
+        else:
+            warped_transform = warped_grid.transform(recalc=True)
+            warped_index = {
+                axis: _nearest_index(0, grid_size, transform, warped_transform, warped_size, axis)
+                for axis, grid_size, warped_size in (
+                    ("x", grid.width, warped_grid.width),
+                    ("y", grid.height, warped_grid.height),
+                )
+            }
+
+        def sample(start, count, axis):
+            index = _nearest_index(start, count, out_transform, clip_transform, clip_sizes[axis], axis)
+            grid_index = np.where(index >= 0, index + clip_offsets[axis], -1)
+            if warped_index is None:
+                return grid_index, grid_index
+            vrt_index = np.where(grid_index >= 0, warped_index[axis][grid_index], -1)
+            return np.where(vrt_index >= 0, grid_index, -1), vrt_index
+
+        with rasterio.open(input_full_filepath) as src:
+            src_nodata = src.nodata
+            if src_nodata is None and np.issubdtype(src.dtypes[0], np.floating):
+                src_nodata = np.nan
+            profile = {
+                "driver": "GTiff",
+                "dtype": "float32",
+                "count": src.count,
+                "crs": dst_crs,
+                "transform": out_transform,
+                "width": out_width,
+                "height": out_height,
+                "nodata": np.nan,
+                "tiled": True,
+            }
+
+            with WarpedVRT(
+                src,
+                crs=dst_crs,
+                transform=warped[0],
+                width=warped[1],
+                height=warped[2],
+                resampling=Resampling.nearest,
+                nodata=src_nodata,
+            ) as vrt, rasterio.open(mask_outpath, "w", **profile) as dst:
+                if chunks is None:
+                    blocks = [Window(0, 0, out_width, out_height)]
+                else:
+                    rows, cols = chunks
+                    blocks = [
+                        Window(
+                            col, row,
+                            min(cols, out_width - col),
+                            min(rows, out_height - row),
+                        )
+                        for row in range(0, out_height, rows)
+                        for col in range(0, out_width, cols)
+                    ]
+                for block in blocks:
+                    grid_rows, vrt_rows = sample(int(block.row_off), int(block.height), "y")
+                    grid_cols, vrt_cols = sample(int(block.col_off), int(block.width), "x")
+                    # the clip mask of the grid pixels the block samples, rasterised for this block only
+                    grid_rows, grid_cols = grid_rows[grid_rows >= 0], grid_cols[grid_cols >= 0]
+                    if len(grid_rows) and len(grid_cols):
+                        mask_window = Window.from_slices(
+                            (grid_rows.min(), grid_rows.max() + 1), (grid_cols.min(), grid_cols.max() + 1)
+                        )
+                        block_inside = _rasterize_window(pixel_geometries, mask_window)[
+                            np.ix_(grid_rows - mask_window.row_off, grid_cols - mask_window.col_off)
+                        ]
+                    else:
+                        block_inside = np.zeros((len(grid_rows), len(grid_cols)), dtype=bool)
+                    data = _warp_mask_block(vrt, vrt_rows, vrt_cols, block_inside, src_nodata)
+                    dst.write(data, window=block)
+
+        return mask_outpath
+    except Exception as e:
+        logger.error(
+            f"Error occurred while reprojecting and masking raster {filename}: {e}",
+            exc_info=True,
+        )
+        if raise_errors:
             raise
+        return None
+
+
+def colour_geotiff_and_save_cog(input_geotiff, colour_map):
+    output_cog_filename = input_geotiff.replace(".tiff", "_cog.public.tiff")
+
+    try:
+        # warp to EPSG:4326, colour and write the COG in one pass, no intermediate _colored.tiff
+        return colourise_to_cog(input_geotiff, output_cog_filename, colour_map)
     except Exception as e:
         logger.error(f"Error colorizing GeoTIFF {input_geotiff}: {e}", exc_info=True)
 
@@ -1,7 +1,18 @@
+from .block_cache import BlockCache, open_raster
+from .colourise import colourise, colourise_raster, colourise_to_cog
 from .dataframe import get_bbox_from_geodf
+from .geometry import AreaOfInterest
+from .io_profile import apply_io_profile, remote_io
 from .meteo import OpenMeteoAPI, convert_epoch_to_timezone, setup_session
+from .mosaic import read_mosaic, select_assets
+from .postprocess import postprocess_labels
 from .stac import (initialize_stac_client, inspect_stac_item,
-                   process_dem_asset, query_stac_api, read_metadata_sidecar,
-                   save_metadata_sidecar)
+                   iter_stac_items, process_dem_asset, query_stac_api,
+                   read_metadata_sidecar, register_static_items,
+                   save_metadata_sidecar, search_stac)
+from .statistics import raster_statistics, zonal_statistics
+from .stratification import (MiniBatchKMeans, compute_band_stats,
+                             stratify_raster)
+from .terrain import terrain_products
 from .visualisation import (colour_geotiff_and_save_cog,
                             get_coords_from_geodataframe)
@@ -0,0 +1,483 @@
+"""
+Disk-backed block cache for remote COGs that are read over and over.
+
+Most DEM requests read blocks of the same GA SRTM COG and most SLGA requests
+read the same esoil.io COGs, so the same byte ranges are fetched again on every
+run. `open_raster` opens http(s) rasters through `CachedRangeFile`, a file
+object that GDAL reads via rasterio's Python file VSI plugin. Reads are split
+into fixed size blocks that are looked up in a `BlockCache` directory first;
+missing consecutive blocks are fetched with one range request and stored for
+the next reader.
+
+- Blocks are keyed by URL, validator (the ETag, or Last-Modified when there is
+  none) and byte range, so a changed object is never served from stale blocks.
+  The validator of a URL is re-checked with a HEAD request at most every
+  `metadata_ttl` seconds.
+- The cache is a plain directory: every process and container that mounts it
+  shares it, writes are atomic (temporary file + rename) and eviction is least
+  recently used by file modification time, down to `max_bytes`.
+- The cache is off unless `GIS_UTILS_BLOCK_CACHE_DIR` names a directory,
+  ideally a volume shared between runs. Its size is `GIS_UTILS_BLOCK_CACHE_MB`
+  (default 2048, 0 disables the cache), capped at half of the free space on
+  that volume so the cache never fills ephemeral storage such as a Lambda /tmp
+  that outputs are written to.
+- Cached reads go through Python instead of GDAL's curl reader, so the
+  `gis_utils.io_profile` HTTP settings do not apply to them and a cold read is
+  slower than GDAL's own; only warm reads are faster (compare them with
+  `benchmarks/bench_remote_io.py`). Configure the directory where the same COGs
+  are read run after run.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import rasterio
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger()
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+
+_local = threading.local()
+_default_cache = None
+_default_cache_config = None
+_default_cache_lock = threading.Lock()
+
+
+def _session():
+    """
+    Per thread session, so connections are reused between opens of the same
+    host.
+    """
+    if not hasattr(_local, "session"):
+        session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        session.mount("http://", HTTPAdapter(max_retries=retry))
+        session.mount("https://", HTTPAdapter(max_retries=retry))
+        _local.session = session
+    return _local.session
+
+
+def _digest(*parts):
+    return hashlib.sha256(
+        "\x00".join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+class BlockCache:
+    """
+    Byte range blocks of remote files stored in a directory, evicted least
+    recently used.
+
+    Args:
+        directory (str): Cache directory, created if missing. Can be shared
+            between processes.
+        max_bytes (int, optional): Size cap of the stored blocks. Defaults to 2
+            GiB.
+        block_size (int, optional): Size of the blocks remote files are read
+            in. Defaults to 256 KiB.
+        metadata_ttl (float, optional): Seconds a URL's validator and size are
+            trusted before they are checked again with a HEAD request. Defaults
+            to 3600.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=2048 * 1024 * 1024,
+        block_size=DEFAULT_BLOCK_SIZE,
+        metadata_ttl=3600,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.metadata_ttl = metadata_ttl
+        self._blocks_dir = os.path.join(directory, "blocks")
+        self._meta_dir = os.path.join(directory, "meta")
+        os.makedirs(self._blocks_dir, exist_ok=True)
+        os.makedirs(self._meta_dir, exist_ok=True)
+        # bytes written since the directory size was last checked, None forces
+        # a check on the first write
+        self._written = None
+        self._lock = threading.Lock()
+
+    def _block_path(self, url, validator, start, end):
+        key = _digest(url, validator, start, end)
+        return os.path.join(self._blocks_dir, key[:2], key)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def get(self, url, validator, start, end):
+        """
+        The cached bytes `[start, end)` of `url` at `validator`, None on a
+        miss.
+        """
+        path = self._block_path(url, validator, start, end)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # the modification time is the recency used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, url, validator, start, end, data):
+        """
+        Store the bytes `[start, end)` of `url` at `validator`, evicting old
+        blocks when over the size cap.
+        """
+        self._write(self._block_path(url, validator, start, end), data)
+        with self._lock:
+            self._written = (
+                None if self._written is None else self._written + len(data)
+            )
+            check = (
+                self._written is None or self._written > self.max_bytes // 10
+            )
+            if check:
+                self._written = 0
+        if check:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self._blocks_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @property
+    def size(self):
+        """Bytes stored in the cache directory."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes=None):
+        """
+        Remove the least recently used blocks until the cache holds at most
+        `max_bytes` (default the cap).
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(
+                f"Evicted {removed} blocks from {self.directory}, "
+                f"{total / 1024 / 1024:.0f} MB left"
+            )
+
+    def clear(self):
+        """Remove every block and URL metadata entry."""
+        self.evict(0)
+        for name in os.listdir(self._meta_dir):
+            os.remove(os.path.join(self._meta_dir, name))
+
+    def _meta_path(self, url):
+        return os.path.join(self._meta_dir, _digest(url) + ".json")
+
+    def metadata(self, url, session=None):
+        """
+        Validator and size of `url`, from the cache while younger than
+        `metadata_ttl`, else from a HEAD request.
+        """
+        path = self._meta_path(url)
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+            if time.time() - meta["checked"] < self.metadata_ttl:
+                return meta["validator"], meta["size"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        session = session or _session()
+        response = session.head(url, allow_redirects=True, timeout=30)
+        response.raise_for_status()
+        if "Content-Length" in response.headers:
+            size = int(response.headers["Content-Length"])
+        else:
+            # some servers leave the length out of HEAD responses, a one byte
+            # range request carries it
+            response = session.get(
+                url, headers={"Range": "bytes=0-0"}, timeout=30
+            )
+            response.raise_for_status()
+            size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+        validator = (
+            response.headers.get("ETag")
+            or response.headers.get("Last-Modified")
+            or ""
+        )
+        meta = {
+            "url": url,
+            "validator": validator,
+            "size": size,
+            "checked": time.time(),
+        }
+        self._write(path, json.dumps(meta).encode())
+        return validator, size
+
+    def invalidate(self, url):
+        """Forget the validator of `url`, so the next open checks it again."""
+        try:
+            os.remove(self._meta_path(url))
+        except FileNotFoundError:
+            pass
+
+
+class _CachedFileSystem:
+    """
+    The fsspec style `fs` rasterio's file plugin uses to open another handle of
+    a file object. The plugin never closes these handles, `close` does.
+    """
+
+    def __init__(self, cache, session):
+        self.cache = cache
+        self.session = session
+        self._files = []
+
+    def open(self, path, mode="rb"):
+        f = CachedRangeFile(path, self.cache, self.session)
+        self._files.append(f)
+        return f
+
+    def close(self):
+        while self._files:
+            self._files.pop().close()
+
+
+class CachedRangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over an http(s) URL whose reads go through
+    a `BlockCache`.
+
+    Args:
+        url (str): http(s) URL of the file, the server must support range
+            requests.
+        cache (BlockCache): Block cache to read through.
+        session (requests.Session, optional): Session for the HEAD and range
+            requests. Defaults to a per thread session with retries.
+    """
+
+    # decoded blocks kept in memory, GDAL reads the header and neighbouring
+    # tiles in many small reads
+    recent_blocks = 16
+
+    def __init__(self, url, cache, session=None):
+        super().__init__()
+        self.url = url
+        self.path = self.name = url
+        self.mode = "rb"
+        self.cache = cache
+        self.fs = _CachedFileSystem(cache, session)
+        self._session = session or _session()
+        self._validator, self._size = cache.metadata(url, self._session)
+        self._position = 0
+        self._recent = OrderedDict()
+        self.requests = 0
+
+    def close(self):
+        if not self.closed:
+            self.fs.close()
+        super().close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        start = self._position
+        end = min(self._size, start + len(buffer))
+        if end <= start:
+            return 0
+        first, last = (
+            start // self.cache.block_size,
+            (end - 1) // self.cache.block_size,
+        )
+        data = b"".join(self._blocks(first, last))
+        offset = start - first * self.cache.block_size
+        buffer[: end - start] = data[offset : offset + end - start]
+        self._position = end
+        return end - start
+
+    def _block_range(self, index):
+        start = index * self.cache.block_size
+        return start, min(self._size, start + self.cache.block_size)
+
+    def _blocks(self, first, last):
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            if index in self._recent:
+                self._recent.move_to_end(index)
+                blocks[index] = self._recent[index]
+                continue
+            data = self.cache.get(
+                self.url, self._validator, *self._block_range(index)
+            )
+            if data is None:
+                missing.append(index)
+            else:
+                blocks[index] = data
+
+        # one range request per run of consecutive missing blocks
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        for run_first, run_last in runs:
+            start, end = (
+                self._block_range(run_first)[0],
+                self._block_range(run_last)[1],
+            )
+            data = self._fetch(start, end)
+            for index in range(run_first, run_last + 1):
+                block_start, block_end = self._block_range(index)
+                block = data[block_start - start : block_end - start]
+                self.cache.put(
+                    self.url, self._validator, block_start, block_end, block
+                )
+                blocks[index] = block
+
+        for index in range(first, last + 1):
+            self._recent[index] = blocks[index]
+            self._recent.move_to_end(index)
+        while len(self._recent) > self.recent_blocks:
+            self._recent.popitem(last=False)
+        return [blocks[index] for index in range(first, last + 1)]
+
+    def _fetch(self, start, end):
+        response = self._session.get(
+            self.url, headers={"Range": f"bytes={start}-{end - 1}"}, timeout=60
+        )
+        self.requests += 1
+        response.raise_for_status()
+        validator = response.headers.get("ETag") or response.headers.get(
+            "Last-Modified"
+        )
+        if validator and self._validator and validator != self._validator:
+            self.cache.invalidate(self.url)
+            raise IOError(
+                f"{self.url} changed while reading it, open it again"
+            )
+        data = response.content
+        if response.status_code != 206:
+            # the server ignored the range and sent the whole file
+            data = data[start:end]
+        if len(data) != end - start:
+            raise IOError(
+                f"Short read of {self.url}: expected {end - start} bytes, "
+                f"got {len(data)}"
+            )
+        return data
+
+
+def default_block_cache():
+    """
+    The process wide block cache configured by `GIS_UTILS_BLOCK_CACHE_DIR` and
+    `GIS_UTILS_BLOCK_CACHE_MB`, None when no directory is configured or the
+    cache is disabled.
+    """
+    global _default_cache, _default_cache_config
+    directory = os.environ.get("GIS_UTILS_BLOCK_CACHE_DIR")
+    size_mb = float(os.environ.get("GIS_UTILS_BLOCK_CACHE_MB", 2048))
+    if not directory or size_mb <= 0:
+        return None
+    configured = (directory, size_mb)
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache_config != configured:
+            # blocks already in the directory count as free space, eviction
+            # gives them back
+            cache = BlockCache(directory)
+            available = shutil.disk_usage(directory).free + cache.size
+            cache.max_bytes = min(int(size_mb * 1024 * 1024), available // 2)
+            _default_cache, _default_cache_config = cache, configured
+        return _default_cache
+
+
+@contextmanager
+def open_raster(href, cache=None, use_cache=True):
+    """
+    Context manager opening `href` for reading, http(s) rasters are read
+    through the block cache when one is configured. The cached file handle is
+    closed with the dataset.
+
+    Args:
+        href (str): Path or URL of the raster.
+        cache (BlockCache, optional): Cache to read through. Defaults to
+            `default_block_cache()`, with no cache configured `href` is read by
+            GDAL with the remote I/O profile.
+        use_cache (bool, optional): False opens `href` directly with GDAL.
+            Defaults to True.
+
+    Yields:
+        rasterio.io.DatasetReader: The open dataset.
+    """
+    if use_cache and href.startswith(("http://", "https://")):
+        cache = cache or default_block_cache()
+        if cache is not None:
+            with CachedRangeFile(href, cache) as f, rasterio.open(f) as src:
+                yield src
+            return
+    with rasterio.open(href) as src:
+        yield src
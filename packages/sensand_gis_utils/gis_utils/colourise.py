@@ -0,0 +1,333 @@
+"""
+Colourisation engine shared by the COG writers and notebooks.
+
+Colouring a raster with `cmap(norm(data))` allocates a float64 RGBA array (32
+bytes per pixel), and finding the range with the builtin `min`/`max` iterates
+over every pixel in Python. Here the colour map is turned into a uint8 lookup
+table once (`build_lut`), values are quantised to LUT indices block by block
+(`quantise`) and the colours are gathered with one indexing operation, so each
+block only needs a float32 copy of the data and the uint8 output.
+
+The colours are identical to `cmap(norm(data))[..., :3] * 255` cast to uint8.
+Nodata (masked or NaN) pixels are black, and can additionally be flagged in an
+alpha band. `colourise_raster` colours a GeoTIFF block by block, as RGB(A) or
+as a single band palette image, and `colourise_to_cog` warps, colours and
+writes a COG in one pass.
+"""
+
+import logging
+
+import matplotlib
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.vrt import WarpedVRT
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+logger = logging.getLogger()
+
+# palette images use index 255 for nodata and 255 colours for the data
+PALETTE_NODATA = 255
+
+
+def build_lut(colour_map, n_colours=None):
+    """
+    (n_colours, 3) uint8 RGB lookup table of a matplotlib colour map. Defaults
+    to the number of colours of the colour map itself (256 for viridis,
+    gist_earth, ...).
+    """
+    cmap = matplotlib.colormaps[colour_map]
+    if n_colours is None or n_colours == cmap.N:
+        rgba = cmap(np.arange(cmap.N))
+    else:
+        rgba = cmap(np.linspace(0, 1, n_colours))
+    return (rgba[:, :3] * 255).astype(np.uint8)
+
+
+def _as_float(data):
+    """float32 copy of the data with masked values as NaN."""
+    if np.ma.isMaskedArray(data):
+        return data.astype("float32").filled(np.nan)
+    return np.asarray(data, dtype="float32")
+
+
+def value_range(data):
+    """min and max of the valid (unmasked, not NaN) values."""
+    values = _as_float(data)
+    return float(np.nanmin(values)), float(np.nanmax(values))
+
+
+def quantise(data, vmin, vmax, n_colours=256):
+    """
+    LUT indices of the data, matching matplotlib's
+    `Colormap(Normalize(vmin, vmax)(data))`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The indices (uint8 for up to 256
+            colours) and the boolean nodata mask.
+    """
+    values = _as_float(data)
+    nodata = np.isnan(values)
+    scale = n_colours / (vmax - vmin) if vmax > vmin else 0.0
+    scaled = (values - vmin) * scale
+    np.clip(scaled, 0, n_colours - 1, out=scaled)
+    scaled[nodata] = 0
+    dtype = np.uint8 if n_colours <= 256 else np.uint16
+    return scaled.astype(dtype), nodata
+
+
+def colourise(
+    data,
+    colour_map,
+    vmin=None,
+    vmax=None,
+    alpha=False,
+    block_rows=1024,
+    lut=None,
+):
+    """
+    Colour a 2D array with a matplotlib colour map.
+
+    Args:
+        data (np.ndarray or np.ma.MaskedArray): 2D data, masked or NaN pixels
+            are nodata.
+        colour_map (str): Matplotlib colour map name.
+        vmin (float, optional): Value mapped to the first colour. Defaults to
+            the data minimum.
+        vmax (float, optional): Value mapped to the last colour. Defaults to
+            the data maximum.
+        alpha (bool, optional): Add an alpha band, 0 for nodata and 255
+            otherwise. Defaults to False.
+        block_rows (int, optional): Rows coloured at a time, bounds the
+            temporary memory. Defaults to 1024.
+        lut (np.ndarray, optional): Precomputed `build_lut(colour_map)`.
+            Defaults to None.
+
+    Returns:
+        np.ndarray: (3, height, width) uint8 RGB, or (4, height, width) RGBA
+            with `alpha`.
+    """
+    if vmin is None or vmax is None:
+        data_min, data_max = value_range(data)
+        vmin = data_min if vmin is None else vmin
+        vmax = data_max if vmax is None else vmax
+    lut = build_lut(colour_map) if lut is None else lut
+
+    height, width = np.shape(data)
+    out = np.empty((4 if alpha else 3, height, width), dtype=np.uint8)
+    for row in range(0, height, block_rows):
+        rows = slice(row, row + block_rows)
+        indices, nodata = quantise(data[rows], vmin, vmax, len(lut))
+        rgb = lut[indices]
+        rgb[nodata] = 0
+        out[:3, rows] = np.moveaxis(rgb, -1, 0)
+        if alpha:
+            out[3, rows] = np.where(nodata, 0, 255)
+    return out
+
+
+def raster_value_range(src, band=1):
+    """
+    min and max of the valid values of an open raster band, read block by
+    block.
+    """
+    vmin, vmax = np.inf, -np.inf
+    for _, window in src.block_windows(band):
+        values = _as_float(src.read(band, window=window, masked=True))
+        if np.isnan(values).all():
+            continue
+        vmin = min(vmin, float(np.nanmin(values)))
+        vmax = max(vmax, float(np.nanmax(values)))
+    if vmin > vmax:
+        raise ValueError(f"{src.name} has no valid pixels to colour")
+    return vmin, vmax
+
+
+def colourise_raster(
+    input_geotiff,
+    output_geotiff,
+    colour_map,
+    vmin=None,
+    vmax=None,
+    alpha=False,
+    palette=False,
+):
+    """
+    Colour the first band of a GeoTIFF block by block, keeping its grid and
+    CRS.
+
+    Args:
+        input_geotiff (str): Input raster.
+        output_geotiff (str): Output GeoTIFF.
+        colour_map (str): Matplotlib colour map name.
+        vmin (float, optional): Value mapped to the first colour. Defaults to
+            the raster minimum.
+        vmax (float, optional): Value mapped to the last colour. Defaults to
+            the raster maximum.
+        alpha (bool, optional): Write RGBA with nodata transparent. Defaults to
+            False (RGB, nodata black).
+        palette (bool, optional): Write a single band palette image with 255
+            colours and `PALETTE_NODATA` as nodata, a third of the size of RGB.
+            Defaults to False.
+
+    Returns:
+        str: The output path.
+    """
+    with rasterio.open(input_geotiff) as src:
+        if vmin is None or vmax is None:
+            data_min, data_max = raster_value_range(src)
+            vmin = data_min if vmin is None else vmin
+            vmax = data_max if vmax is None else vmax
+
+        profile = src.profile.copy()
+        profile.update(
+            {"driver": "GTiff", "dtype": "uint8", "compress": "deflate"}
+        )
+        if palette:
+            lut = build_lut(colour_map, PALETTE_NODATA)
+            profile.update(
+                {
+                    "count": 1,
+                    "nodata": PALETTE_NODATA,
+                    "photometric": "palette",
+                }
+            )
+        else:
+            lut = build_lut(colour_map)
+            profile.update(
+                {"count": 4 if alpha else 3, "nodata": None if alpha else 0}
+            )
+            if alpha:
+                profile["photometric"] = "rgb"
+
+        with rasterio.open(output_geotiff, "w", **profile) as dst:
+            for _, window in src.block_windows(1):
+                data = src.read(1, window=window, masked=True)
+                if palette:
+                    indices, nodata = quantise(data, vmin, vmax, len(lut))
+                    indices[nodata] = PALETTE_NODATA
+                    dst.write(indices, 1, window=window)
+                else:
+                    dst.write(
+                        colourise(
+                            data, colour_map, vmin, vmax, alpha, lut=lut
+                        ),
+                        window=window,
+                    )
+            if palette:
+                dst.write_colormap(
+                    1,
+                    {
+                        i: tuple(int(c) for c in colour) + (255,)
+                        for i, colour in enumerate(lut)
+                    }
+                    | {PALETTE_NODATA: (0, 0, 0, 0)},
+                )
+            elif alpha:
+                dst.colorinterp = [
+                    rasterio.enums.ColorInterp.red,
+                    rasterio.enums.ColorInterp.green,
+                    rasterio.enums.ColorInterp.blue,
+                    rasterio.enums.ColorInterp.alpha,
+                ]
+    return output_geotiff
+
+
+def colourise_to_cog(
+    input_geotiff,
+    output_cog,
+    colour_map,
+    dst_crs="EPSG:4326",
+    vmin=None,
+    vmax=None,
+    resampling=Resampling.bilinear,
+    cog_profile="deflate",
+    block_size=512,
+):
+    """
+    Warp the first band of a raster to `dst_crs`, colour it and write an RGB
+    COG, in one pass.
+
+    The source is read through a `WarpedVRT`, so pixels are resampled into the
+    output grid rather than relabelled with its transform. Warped blocks are
+    coloured straight into an in-memory tiled GeoTIFF, which `cog_translate`
+    turns into the COG with overviews; no intermediate file is written to disk.
+    Nodata is 0 (black).
+
+    Args:
+        input_geotiff (str): Input raster.
+        output_cog (str): Output COG path.
+        colour_map (str): Matplotlib colour map name.
+        dst_crs (str, optional): Output CRS. Defaults to "EPSG:4326".
+        vmin (float, optional): Value mapped to the first colour. Defaults to
+            the raster minimum.
+        vmax (float, optional): Value mapped to the last colour. Defaults to
+            the raster maximum.
+        resampling (Resampling, optional): Warp resampling. Defaults to
+            bilinear.
+        cog_profile (str, optional): rio-cogeo profile name. Defaults to
+            "deflate".
+        block_size (int, optional): Block size of the warp and colouring.
+            Defaults to 512.
+
+    Returns:
+        str: The output path.
+    """
+    with rasterio.open(input_geotiff) as src:
+        if vmin is None or vmax is None:
+            data_min, data_max = raster_value_range(src)
+            vmin = data_min if vmin is None else vmin
+            vmax = data_max if vmax is None else vmax
+        lut = build_lut(colour_map)
+
+        # without a nodata value the area outside the source footprint is
+        # flagged through an alpha band, which masked reads ignore, so it is
+        # applied to the mask explicitly
+        use_alpha = src.nodata is None
+        vrt_options = {
+            "crs": dst_crs,
+            "resampling": resampling,
+            "add_alpha": use_alpha,
+        }
+
+        with WarpedVRT(src, **vrt_options) as vrt:
+            profile = {
+                "driver": "GTiff",
+                "dtype": "uint8",
+                "count": 3,
+                "width": vrt.width,
+                "height": vrt.height,
+                "crs": vrt.crs,
+                "transform": vrt.transform,
+                "nodata": 0,
+                "tiled": True,
+                "blockxsize": block_size,
+                "blockysize": block_size,
+            }
+            with MemoryFile() as memfile:
+                with memfile.open(**profile) as dataset:
+                    for _, window in dataset.block_windows(1):
+                        data = vrt.read(1, window=window, masked=True)
+                        if use_alpha:
+                            outside = vrt.read(vrt.count, window=window) == 0
+                            data = np.ma.masked_array(
+                                data, np.ma.getmaskarray(data) | outside
+                            )
+                        dataset.write(
+                            colourise(data, colour_map, vmin, vmax, lut=lut),
+                            window=window,
+                        )
+                with memfile.open() as dataset:
+                    cog_translate(
+                        dataset,
+                        output_cog,
+                        cog_profiles.get(cog_profile),
+                        in_memory=True,
+                        dtype="uint8",
+                        add_mask=False,
+                        nodata=0,
+                        quiet=True,
+                    )
+    return output_cog
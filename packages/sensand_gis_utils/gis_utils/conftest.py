@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+
+
+def _write_raster(
+    path,
+    data,
+    crs="EPSG:3857",
+    transform=from_origin(0, 0, 30, 30),
+    nodata=-9999.0,
+    blocksize=64,
+    overviews=None,
+):
+    """Write a (height, width) or (bands, height, width) array as a tiled float32 GeoTIFF."""
+    data = np.asarray(data, dtype="float32")
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": data.shape[0],
+        "width": data.shape[2],
+        "height": data.shape[1],
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": blocksize,
+        "blockysize": blocksize,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+        if overviews:
+            dst.build_overviews(overviews, Resampling.average)
+    return str(path)
+
+
+@pytest.fixture
+def write_raster():
+    """The test raster writer, defaults to 30 m pixels from (0, 0) in EPSG:3857 and -9999 nodata."""
+    return _write_raster
@@ -2,7 +2,7 @@ import logging
 import sys
 from typing import Any, Dict
 
-import geopandas as gpd
+from .geometry import AreaOfInterest
 
 logger = logging.getLogger()
 
@@ -20,9 +20,8 @@ def get_bbox_from_geodf(geojson_data: Dict[str, Any]):
 				raise ValueError("Input dictionary does not contain 'features' key.")
 		
 		try:
-			gdf = gpd.GeoDataFrame.from_features(geojson_data["features"])
-			bbox = list(gdf.total_bounds)
-			return bbox
+			# parsed straight into shapely, no GeoDataFrame
+			return AreaOfInterest.from_geojson(geojson_data).bbox
 		except Exception as e:
 				logger.error("Failed to extract bounding box from GeoJSON data")
 				raise ValueError(f"Error processing GeoJSON data: {e}")
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Area of interest geometry parsed once from GeoJSON.
+
+The notebooks used to turn the request GeoJSON into a GeoDataFrame through a
+JSON string, build another GeoDataFrame for the bbox and serialise the first
+one back to JSON for rasterio. `AreaOfInterest.from_geojson` parses the
+features once into a single shapely geometry and derives everything else from
+it: the bbox, the rasterio shapes, copies in other CRSs and a prepared geometry
+for repeated predicates. Reprojected and prepared geometries are cached by a
+hash of the geometry, so every reader of the same boundary in a process shares
+them.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from shapely.prepared import prep
+
+logger = logging.getLogger()
+
+_CACHE_SIZE = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(key, build):
+    """
+    Least recently used cache shared by all areas, keyed by geometry hash.
+    """
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    value = build()
+    with _cache_lock:
+        _cache[key] = value
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+class AreaOfInterest:
+    """
+    One shapely geometry and its CRS, with the derived forms the readers need.
+
+    Args:
+        geometry (BaseGeometry): The area, multiple features already merged
+            into one geometry.
+        crs (optional): CRS of the geometry, anything pyproj accepts. Defaults
+            to "EPSG:4326".
+    """
+
+    def __init__(self, geometry, crs="EPSG:4326"):
+        self.geometry = geometry
+        self.crs = CRS.from_user_input(crs)
+        self.digest = hashlib.blake2b(
+            shapely.to_wkb(geometry), digest_size=16
+        ).hexdigest()
+
+    @classmethod
+    def from_geojson(cls, geojson_data):
+        """
+        Parse a GeoJSON FeatureCollection, Feature or geometry. All features
+        are merged into one geometry. A legacy `crs` member is honoured,
+        otherwise the coordinates are EPSG:4326 as in RFC 7946.
+        """
+        if "features" in geojson_data:
+            geometries = [
+                feature["geometry"]
+                for feature in geojson_data["features"]
+                if feature.get("geometry")
+            ]
+        elif geojson_data.get("type") == "Feature":
+            geometries = (
+                [geojson_data["geometry"]]
+                if geojson_data.get("geometry")
+                else []
+            )
+        else:
+            geometries = [geojson_data]
+        if not geometries:
+            raise ValueError("GeoJSON data contains no geometries")
+
+        shapes = [shape(geometry) for geometry in geometries]
+        geometry = shapes[0] if len(shapes) == 1 else unary_union(shapes)
+        crs = ((geojson_data.get("crs") or {}).get("properties") or {}).get(
+            "name"
+        ) or "EPSG:4326"
+        return cls(geometry, crs)
+
+    @classmethod
+    def from_geodataframe(cls, gdf):
+        """
+        All geometries of a GeoDataFrame merged into one area, in the
+        GeoDataFrame CRS.
+        """
+        geometry = (
+            gdf.geometry.iloc[0]
+            if len(gdf) == 1
+            else unary_union(gdf.geometry.values)
+        )
+        return cls(geometry, gdf.crs or "EPSG:4326")
+
+    @property
+    def bounds(self):
+        """(min_x, min_y, max_x, max_y) in the area CRS."""
+        return self.geometry.bounds
+
+    @property
+    def bbox(self):
+        """
+        The bounds as a list, [min_lon, min_lat, max_lon, max_lat] for GeoJSON
+        input.
+        """
+        return list(self.bounds)
+
+    @cached_property
+    def mapping(self):
+        """
+        The geometry as rasterio wants it: a list of GeoJSON geometry mappings.
+        """
+        return [mapping(self.geometry)]
+
+    @property
+    def prepared(self):
+        """
+        Prepared geometry for fast repeated `contains`/`intersects` tests.
+        """
+        return _cached(
+            (self.digest, self.crs.to_wkt(), "prepared"),
+            lambda: prep(self.geometry),
+        )
+
+    def to_crs(self, crs):
+        """The area reprojected to `crs`, cached by geometry hash and CRS."""
+        crs = CRS.from_user_input(crs)
+        if crs == self.crs:
+            return self
+
+        def build():
+            transformer = Transformer.from_crs(self.crs, crs, always_xy=True)
+            geometry = shapely.transform(
+                self.geometry,
+                lambda xy: np.column_stack(
+                    transformer.transform(xy[:, 0], xy[:, 1])
+                ),
+            )
+            return AreaOfInterest(geometry, crs)
+
+        return _cached((self.digest, self.crs.to_wkt(), crs.to_wkt()), build)
+
+    def to_geodataframe(self):
+        """A one row GeoDataFrame of the area, for APIs that need one."""
+        return gpd.GeoDataFrame(geometry=[self.geometry], crs=self.crs)
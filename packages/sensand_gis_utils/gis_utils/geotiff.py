@@ -4,12 +4,12 @@ from typing import Any, Dict, Tuple
 
 import numpy as np
 import rasterio
-from matplotlib import cm
-from matplotlib.colors import Normalize
 from rasterio.io import DatasetReader
-from rasterio.plot import reshape_as_raster
+from rasterio.plot import reshape_as_image, reshape_as_raster
 from rasterio.warp import calculate_default_transform
 
+from .colourise import colourise
+
 logger = logging.getLogger()
 
 
@@ -25,16 +25,8 @@ def apply_color_map(tif_data: np.ndarray, color_map: str, meta: Dict[str, Any])
     Returns:
         Tuple[np.ndarray, Dict[str, Any]]: A tuple containing the colored data and updated metadata.
     """
-    cmap = cm.get_cmap(color_map)  # Using Matplotlib to get the color map
-    # Remove NaN values from the data
-    na = tif_data[~np.isnan(tif_data)]
-    # Get the minimum and maximum values from the data
-    norm = Normalize(vmin=min(na), vmax=max(na))
-    # Apply the color map to the data
-    # The [:, :, :3] is used to remove the alpha channel from the color map
-    # The * 255 is used to scale the values to the range [0, 255]
-    # And we do the usual dev thing of assuming the data is uint8
-    colored_data = (cmap(norm(tif_data))[:, :, :3] * 255).astype(np.uint8)
+    # LUT based colouring, NaN/masked pixels are black
+    colored_data = reshape_as_image(colourise(tif_data, color_map))
     
     # Update the metadata to reflect the change in band count (assumes RGB output)
     # Make a copy to avoid mutating the original meta directly
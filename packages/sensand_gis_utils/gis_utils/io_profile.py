@@ -0,0 +1,97 @@
+"""
+GDAL configuration for reading remote COGs over HTTP range requests.
+
+`REMOTE_IO_PROFILE` is the one place the remote read settings live. With GDAL's
+defaults every open of a COG URL lists the parent "directory" and probes for
+`.aux.xml`/`.ovr`/`.msk` side-car files, each a separate request, before the
+header is read in small chunks. The profile instead:
+- skips the directory listing and side-car probes
+  (`GDAL_DISABLE_READDIR_ON_OPEN`, `CPL_VSIL_CURL_ALLOWED_EXTENSIONS`),
+- fetches the TIFF header and tile index in one request at open
+  (`GDAL_INGESTED_BYTES_AT_OPEN`),
+- merges consecutive tile ranges into one request and multiplexes requests over
+  HTTP/2 where the server offers it,
+- keeps recently read blocks in the VSI and GDAL block caches, so overlapping
+  windows are not fetched twice,
+- reads public AWS buckets without credentials and retries transient HTTP
+  errors.
+
+Use `remote_io()` around reads, or `apply_io_profile()` once per process for
+code that opens rasters outside of it (dask workers). Both take GDAL options as
+keyword arguments that override the profile, e.g.
+`remote_io(GDAL_HTTP_MULTIPLEX="NO")`. The extension whitelist and forced
+HTTP/2 would break every other remote read of the process (`.json` side-cars,
+`.vrt`, `.zarr`, WCS responses), so `apply_io_profile()` leaves them out
+(`SCOPED_OPTIONS`) unless they are passed explicitly.
+`benchmarks/bench_remote_io.py` compares request counts and latency with GDAL's
+defaults.
+
+The profile only applies to rasters GDAL reads itself.
+`gis_utils.block_cache.open_raster` reads http(s) rasters through a Python file
+object instead when `GIS_UTILS_BLOCK_CACHE_DIR` is set, trading slower cold
+reads for warm reads served from disk, so leave the block cache unset where the
+same COGs are not read again.
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+
+import rasterio
+
+logger = logging.getLogger()
+
+REMOTE_IO_PROFILE = {
+    "AWS_NO_SIGN_REQUEST": "YES",
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff,.TIF,.TIFF",
+    "GDAL_INGESTED_BYTES_AT_OPEN": 64 * 1024,
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_MAX_RETRY": 3,
+    "GDAL_HTTP_RETRY_DELAY": 1,
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": 64 * 1024 * 1024,
+    "CPL_VSIL_CURL_CACHE_SIZE": 128 * 1024 * 1024,
+    "GDAL_CACHEMAX": 256,
+}
+
+
+# only set inside `remote_io()`, around reads of COGs
+SCOPED_OPTIONS = ("CPL_VSIL_CURL_ALLOWED_EXTENSIONS", "GDAL_HTTP_VERSION")
+
+
+def io_profile(**overrides):
+    """
+    `REMOTE_IO_PROFILE` with `overrides` applied, a None value removes an
+    option.
+    """
+    options = {**REMOTE_IO_PROFILE, **overrides}
+    return {key: value for key, value in options.items() if value is not None}
+
+
+@contextmanager
+def remote_io(**overrides):
+    """
+    `rasterio.Env` with the remote I/O profile, GDAL options passed as keywords
+    override it.
+    """
+    with rasterio.Env(**io_profile(**overrides)) as env:
+        yield env
+
+
+def apply_io_profile(**overrides):
+    """
+    Set the remote I/O profile as environment variables for the whole process,
+    for code that opens rasters outside `remote_io()` (e.g. `odc.stac`).
+    `SCOPED_OPTIONS` are left out unless given in `overrides`, other remote
+    reads of the process are not limited to `.tif` files or HTTP/2. Existing
+    variables are overwritten. Returns the applied options.
+    """
+    options = io_profile(
+        **{**{key: None for key in SCOPED_OPTIONS}, **overrides}
+    )
+    for key, value in options.items():
+        os.environ[key] = str(value)
+    return options
@@ -0,0 +1,288 @@
+"""
+Virtual mosaics of the STAC items covering an area.
+
+An area of interest can cross item footprints, so reading the first item of a
+search leaves part of it empty. `select_assets` picks the assets of every item
+whose footprint intersects the geometry. `read_mosaic` lays one output grid
+over the geometry and reads from each of them only the window overlapping that
+grid, concurrently and through the remote I/O profile and block cache.
+Decimated reads come from the COG overviews, as in
+`gis_utils.overviews.read_window`. Where items overlap, the first one in the
+item order wins.
+"""
+
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds
+from shapely.geometry import box, shape
+from shapely.ops import unary_union
+
+from .block_cache import open_raster
+from .io_profile import remote_io
+from .overviews import decimation_factor
+
+logger = logging.getLogger()
+
+
+def select_assets(items, geometry, asset_key):
+    """
+    Hrefs of the `asset_key` asset of the items whose footprint intersects the
+    geometry, in item order.
+
+    Args:
+        items: pystac Items (or item dicts), e.g. from
+            `gis_utils.stac.search_stac`.
+        geometry (Sequence[Dict[str, Any]]): GeoJSON geometries in EPSG:4326,
+            like STAC footprints.
+        asset_key (str): Key of the asset to read, e.g. "dem".
+
+    Returns:
+        List[str]: The asset hrefs.
+    """
+    area = unary_union([shape(geom) for geom in geometry])
+    hrefs = []
+    for item in items:
+        item = item if isinstance(item, dict) else item.to_dict()
+        footprint = (
+            shape(item["geometry"])
+            if item.get("geometry")
+            else box(*item["bbox"])
+        )
+        if not footprint.intersects(area):
+            continue
+        asset = item.get("assets", {}).get(asset_key)
+        if asset is None:
+            logger.warning(
+                f"Item {item.get('id')} intersects the area but has no "
+                f"{asset_key} asset"
+            )
+            continue
+        hrefs.append(asset["href"])
+    return hrefs
+
+
+def _source_info(href, io_options):
+    with remote_io(**io_options), open_raster(href) as src:
+        return {
+            "crs": src.crs,
+            "res": src.res,
+            "bounds": src.bounds,
+            "transform": src.transform,
+        }
+
+
+def _read_source(
+    href,
+    crs,
+    transform,
+    grid_shape,
+    factor,
+    io_options,
+):
+    """
+    The part of the output grid covered by one source and its data, None when
+    they do not overlap.
+    """
+    with remote_io(**io_options), open_raster(href) as src:
+        source = (
+            src
+            if src.crs == crs
+            else WarpedVRT(src, crs=crs, resampling=Resampling.bilinear)
+        )
+        try:
+            out_bounds = (
+                transform.c,
+                transform.f + grid_shape[0] * transform.e,
+                transform.c + grid_shape[1] * transform.a,
+                transform.f,
+            )
+            left, bottom = (
+                max(out_bounds[0], source.bounds.left),
+                max(out_bounds[1], source.bounds.bottom),
+            )
+            right, top = (
+                min(out_bounds[2], source.bounds.right),
+                min(out_bounds[3], source.bounds.top),
+            )
+            if left >= right or bottom >= top:
+                return None
+            # output pixels whose centre falls inside the source
+            overlap = from_bounds(left, bottom, right, top, transform)
+            col_start, row_start = (
+                round(overlap.col_off),
+                round(overlap.row_off),
+            )
+            col_end, row_end = (
+                round(overlap.col_off + overlap.width),
+                round(overlap.row_off + overlap.height),
+            )
+            if col_end <= col_start or row_end <= row_start:
+                return None
+            dst_window = Window(
+                col_start, row_start, col_end - col_start, row_end - row_start
+            )
+            dst_bounds = (
+                transform.c + dst_window.col_off * transform.a,
+                transform.f
+                + (dst_window.row_off + dst_window.height) * transform.e,
+                transform.c
+                + (dst_window.col_off + dst_window.width) * transform.a,
+                transform.f + dst_window.row_off * transform.e,
+            )
+            # clipping moves a decimated edge by less than half an output
+            # pixel, aligned grids are not clipped
+            src_window = from_bounds(
+                *dst_bounds, source.transform
+            ).intersection(Window(0, 0, source.width, source.height))
+            data = source.read(
+                1,
+                window=src_window,
+                out_shape=(int(dst_window.height), int(dst_window.width)),
+                masked=True,
+                resampling=Resampling.average
+                if factor > 1
+                else Resampling.nearest,
+            )
+        finally:
+            if source is not src:
+                source.close()
+    return dst_window, data
+
+
+def read_mosaic(
+    hrefs,
+    geometry,
+    geometry_crs="EPSG:4326",
+    resolution=None,
+    max_pixels=None,
+    all_touched=True,
+    max_workers=4,
+    io_options=None,
+):
+    """
+    Read a geometry from several rasters as one masked array on a common grid.
+
+    The grid takes the CRS of the first source and the finest pixel size of the
+    sources in that CRS, anchored on the first source's pixel grid, and covers
+    the bounds of the geometry. Sources in other CRSs are warped onto it. Only
+    the windows overlapping the grid are read.
+
+    Args:
+        hrefs (Sequence[str]): Paths or URLs of the sources, the first wins
+            where they overlap.
+        geometry (Sequence[Dict[str, Any]]): GeoJSON geometries to read and
+            mask.
+        geometry_crs (str, optional): CRS of `geometry`. Defaults to
+            "EPSG:4326".
+        resolution (float, optional): Target pixel size in the mosaic CRS
+            units. Defaults to None (native).
+        max_pixels (int, optional): Pixel budget of the mosaic, larger areas
+            are read from overviews. Defaults to None.
+        all_touched (bool, optional): Keep every pixel touched by the geometry.
+            Defaults to True.
+        max_workers (int, optional): Sources read concurrently. Defaults to 4.
+        io_options (Dict[str, Any], optional): GDAL options overriding
+            `gis_utils.io_profile.REMOTE_IO_PROFILE`. Defaults to None.
+
+    Returns:
+        Tuple[np.ma.MaskedArray, Dict[str, Any]]: The (height, width) float32
+            mosaic, masked outside the geometry and where no source has data,
+            and a single band GeoTIFF profile of it (NaN nodata).
+    """
+    if not hrefs:
+        raise ValueError("No rasters intersect the geometry")
+    io_options = io_options or {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        infos = list(
+            executor.map(lambda href: _source_info(href, io_options), hrefs)
+        )
+
+    crs = infos[0]["crs"]
+    if CRS.from_user_input(geometry_crs) != crs:
+        geometry = [
+            transform_geom(geometry_crs, crs, geom) for geom in geometry
+        ]
+    # sources in another CRS are warped onto the grid and do not set its pixel
+    # size
+    x_res = min(info["res"][0] for info in infos if info["crs"] == crs)
+    y_res = min(info["res"][1] for info in infos if info["crs"] == crs)
+    origin = infos[0]["transform"]
+
+    min_x, min_y, max_x, max_y = unary_union(
+        [shape(geom) for geom in geometry]
+    ).bounds
+    # snap outwards to whole pixels, geometry edges on pixel edges within
+    # floating point error stay put
+    col_off = math.floor((min_x - origin.c) / x_res + 1e-6)
+    row_off = math.floor((origin.f - max_y) / y_res + 1e-6)
+    width = math.ceil((max_x - origin.c) / x_res - 1e-6) - col_off
+    height = math.ceil((origin.f - min_y) / y_res - 1e-6) - row_off
+    transform = Affine(
+        x_res,
+        0,
+        origin.c + col_off * x_res,
+        0,
+        -y_res,
+        origin.f - row_off * y_res,
+    )
+
+    factor = decimation_factor(
+        width, height, (x_res, y_res), resolution, max_pixels
+    )
+    if factor > 1:
+        out_width, out_height = (
+            max(1, math.ceil(width / factor)),
+            max(1, math.ceil(height / factor)),
+        )
+        transform = transform @ Affine.scale(
+            width / out_width, height / out_height
+        )
+        width, height = out_width, out_height
+    logger.info(f"Reading a {width}x{height} mosaic from {len(hrefs)} rasters")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        parts = list(
+            executor.map(
+                lambda href: _read_source(
+                    href, crs, transform, (height, width), factor, io_options
+                ),
+                hrefs,
+            )
+        )
+
+    mosaic = np.full((height, width), np.nan, dtype="float32")
+    valid = np.zeros((height, width), dtype=bool)
+    for part in parts:
+        if part is None:
+            continue
+        window, data = part
+        rows, cols = window.toslices()
+        fill = ~np.ma.getmaskarray(data) & ~valid[rows, cols]
+        mosaic[rows, cols][fill] = data.data[fill]
+        valid[rows, cols] |= fill
+    outside = geometry_mask(
+        geometry, (height, width), transform, all_touched=all_touched
+    )
+
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": width,
+        "height": height,
+        "crs": crs,
+        "transform": transform,
+        "nodata": np.nan,
+    }
+    return np.ma.masked_array(
+        mosaic, mask=~valid | outside, fill_value=np.nan
+    ), profile
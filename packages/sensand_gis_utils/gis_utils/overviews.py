@@ -0,0 +1,128 @@
+"""
+Overview-aware reads sized by the output rather than by the area.
+
+A window read with an `out_shape` smaller than the window is a decimated read:
+GDAL serves it from the COG overview closest to the requested resolution, so
+only the bytes of that overview level are fetched from a remote COG. The
+helpers here turn a target resolution or a pixel budget into that `out_shape`.
+"""
+
+import logging
+import math
+
+from affine import Affine
+from rasterio.enums import Resampling
+
+logger = logging.getLogger()
+
+
+def decimation_factor(
+    width,
+    height,
+    native_resolution,
+    resolution=None,
+    max_pixels=None,
+):
+    """
+    Factor (>= 1) by which to coarsen a `width` x `height` pixel read.
+
+    Args:
+        width (float): Window width in native pixels.
+        height (float): Window height in native pixels.
+        native_resolution (Tuple[float, float]): Native (x, y) pixel size in
+            CRS units.
+        resolution (float, optional): Target pixel size in CRS units, reads are
+            never finer than native. Defaults to None.
+        max_pixels (int, optional): Maximum number of pixels of the read.
+            Defaults to None.
+
+    Returns:
+        float: The coarsest factor required by either limit, 1 when neither
+            applies.
+    """
+    factor = 1.0
+    if resolution is not None:
+        factor = max(
+            factor,
+            resolution
+            / max(abs(native_resolution[0]), abs(native_resolution[1])),
+        )
+    if max_pixels is not None and width * height > max_pixels:
+        factor = max(factor, math.sqrt(width * height / max_pixels))
+    return factor
+
+
+def overview_level(src, factor, band=1):
+    """
+    Index of the coarsest overview of `band` not coarser than `factor`, None
+    for the full resolution.
+    """
+    level = None
+    for index, overview_factor in enumerate(src.overviews(band)):
+        if overview_factor <= factor:
+            level = index
+    return level
+
+
+def read_window(
+    src,
+    window,
+    band=1,
+    resolution=None,
+    max_pixels=None,
+    resampling=Resampling.average,
+):
+    """
+    Masked read of a window of one band, decimated to a target resolution or
+    pixel budget.
+
+    Without `resolution` and `max_pixels` (or when the window is already small
+    enough) this is a plain full resolution read.
+
+    Args:
+        src: Open rasterio dataset, e.g. a remote COG.
+        window (Window): Window to read, in native pixels.
+        band (int, optional): 1-based band. Defaults to 1.
+        resolution (float, optional): Target pixel size in CRS units. Defaults
+            to None.
+        max_pixels (int, optional): Maximum number of pixels returned. Defaults
+            to None.
+        resampling (Resampling, optional): Resampling of decimated reads.
+            Defaults to average.
+
+    Returns:
+        Tuple[np.ma.MaskedArray, Affine]: The (height, width) masked array and
+            its transform.
+    """
+    factor = decimation_factor(
+        window.width, window.height, src.res, resolution, max_pixels
+    )
+    transform = src.window_transform(window)
+    if factor <= 1:
+        return src.read(band, window=window, masked=True), transform
+
+    out_shape = (
+        max(1, math.ceil(window.height / factor)),
+        max(1, math.ceil(window.width / factor)),
+    )
+    level = overview_level(src, factor, band)
+    logger.info(
+        f"Reading {src.name} at 1/{factor:.1f} resolution "
+        f"({out_shape[1]}x{out_shape[0]} pixels), "
+        + (
+            "no overview, decimating full resolution data"
+            if level is None
+            else f"overview level {level}"
+        )
+    )
+    data = src.read(
+        band,
+        window=window,
+        out_shape=out_shape,
+        masked=True,
+        resampling=resampling,
+    )
+    transform = transform @ Affine.scale(
+        window.width / out_shape[1], window.height / out_shape[0]
+    )
+    return data, transform
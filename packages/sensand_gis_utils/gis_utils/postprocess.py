@@ -0,0 +1,299 @@
+"""
+Post-processing of stratification label rasters.
+
+`postprocess_labels` turns a label GeoTIFF (e.g. written by
+`gis_utils.stratification.stratify_raster`) into clean strata polygons in three
+stages, timing each one:
+1. `majority_filter`: a categorical (modal) filter over a square window,
+   applied tile by tile with a halo of `radius` pixels so tiles join
+   seamlessly. It replaces the opening/closing/median variants, which treat the
+   arbitrary label numbers as ordered values.
+2. `sieve_labels`: a minimum mapping unit, connected regions smaller than
+   `min_area` are merged into their largest neighbour (GDAL sieve).
+3. `polygonise_labels`: GDAL polygonize, optionally followed by a coverage
+   simplification that keeps shared edges between neighbouring strata
+   identical, so simplified polygons have no gaps or overlaps.
+
+The polygons are written as GeoJSON or FlatGeobuf depending on the output
+extension.
+
+Only the majority filter is tiled. The sieve and polygonize follow connected
+regions across the whole raster, so the label raster is read into memory, at
+roughly 20 bytes per pixel with GDAL's working buffers, and rasters of more
+than `MAX_PIXELS` pixels are refused before they are read.
+"""
+
+import logging
+import math
+import time
+from contextlib import contextmanager
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+import shapely
+from rasterio import features
+from shapely.geometry import shape
+
+logger = logging.getLogger()
+
+MAX_PIXELS = 100_000_000
+
+VECTOR_DRIVERS = {
+    ".geojson": "GeoJSON",
+    ".json": "GeoJSON",
+    ".fgb": "FlatGeobuf",
+}
+
+
+def _box_counts(mask, radius):
+    """
+    Number of True pixels in the (2 * radius + 1) square around each pixel,
+    using an integral image.
+    """
+    size = 2 * radius + 1
+    padded = np.pad(mask.astype(np.int32), radius + 1)[:-1, :-1]
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    return (
+        integral[size:, size:]
+        - integral[:-size, size:]
+        - integral[size:, :-size]
+        + integral[:-size, :-size]
+    )
+
+
+def _majority_tile(tile, radius, nodata):
+    classes = np.unique(tile)
+    if nodata is not None:
+        classes = classes[classes != nodata]
+    if len(classes) < 2:
+        return tile.copy()
+
+    best = np.zeros(tile.shape, dtype=np.int32)
+    best_label = tile.copy()
+    own = np.zeros(tile.shape, dtype=np.int32)
+    for label in classes:
+        is_label = tile == label
+        counts = _box_counts(is_label, radius)
+        better = counts > best
+        best = np.where(better, counts, best)
+        best_label = np.where(better, label, best_label)
+        own = np.where(is_label, counts, own)
+    # keep the original label on ties, so the filter only changes pixels in a
+    # clear minority
+    result = np.where(own >= best, tile, best_label).astype(tile.dtype)
+    if nodata is not None:
+        result[tile == nodata] = nodata
+    return result
+
+
+def majority_filter(
+    labels,
+    radius=1,
+    nodata=None,
+    tile_size=1024,
+):
+    """
+    Modal filter of a label image over a (2 * radius + 1) square window,
+    ignoring nodata.
+
+    The image is processed in tiles of `tile_size` pixels, each read with a
+    halo of `radius` pixels, so the result is identical to filtering the whole
+    image at once while only one tile of class counts is held in memory.
+    """
+    if radius < 1:
+        return labels.copy()
+    result = np.empty_like(labels)
+    height, width = labels.shape
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            row0, col0 = max(0, row - radius), max(0, col - radius)
+            row1 = min(height, row + tile_size + radius)
+            col1 = min(width, col + tile_size + radius)
+            filtered = _majority_tile(
+                labels[row0:row1, col0:col1], radius, nodata
+            )
+            rows = slice(row - row0, row - row0 + min(tile_size, height - row))
+            cols = slice(col - col0, col - col0 + min(tile_size, width - col))
+            result[row : row + tile_size, col : col + tile_size] = filtered[
+                rows, cols
+            ]
+    return result
+
+
+def sieve_labels(
+    labels,
+    min_pixels,
+    nodata=None,
+    connectivity=4,
+):
+    """
+    Merge connected regions smaller than `min_pixels` into their largest
+    neighbour. Nodata pixels are kept.
+    """
+    if min_pixels <= 1:
+        return labels.copy()
+    mask = labels != nodata if nodata is not None else None
+    sieved = features.sieve(
+        labels, min_pixels, mask=mask, connectivity=connectivity
+    )
+    if nodata is not None:
+        sieved[~mask] = nodata
+    return sieved
+
+
+def polygonise_labels(
+    labels,
+    transform,
+    crs,
+    nodata=None,
+    connectivity=4,
+    simplify_tolerance=None,
+):
+    """
+    Polygonise a label image into a GeoDataFrame with one row per connected
+    region.
+
+    Args:
+        labels (np.ndarray): Label image.
+        transform (Affine): Transform of the label image.
+        crs: CRS of the label image.
+        nodata (int, optional): Label excluded from the polygons. Defaults to
+            None.
+        connectivity (int, optional): 4 or 8 connectivity of the regions.
+            Defaults to 4.
+        simplify_tolerance (float, optional): Simplification tolerance in CRS
+            units. Neighbouring polygons are simplified as a coverage so they
+            keep sharing their edges. Defaults to None (no simplification).
+
+    Returns:
+        gpd.GeoDataFrame: Columns `value` (the label) and `geometry`.
+    """
+    mask = labels != nodata if nodata is not None else None
+    shapes = list(
+        features.shapes(
+            labels, mask=mask, transform=transform, connectivity=connectivity
+        )
+    )
+    geometries = np.array([shape(geom) for geom, _ in shapes], dtype=object)
+    values = [int(value) for _, value in shapes]
+
+    if simplify_tolerance and len(geometries):
+        if hasattr(shapely, "coverage_simplify"):
+            geometries = shapely.coverage_simplify(
+                geometries, simplify_tolerance
+            )
+        else:
+            logger.warning(
+                "shapely.coverage_simplify needs shapely >= 2.1, simplifying "
+                "polygons independently"
+            )
+            geometries = shapely.simplify(
+                geometries, simplify_tolerance, preserve_topology=True
+            )
+
+    return gpd.GeoDataFrame(
+        {"value": values}, geometry=list(geometries), crs=crs
+    )
+
+
+@contextmanager
+def _timed(timings, stage):
+    start = time.perf_counter()
+    yield
+    timings[stage] = time.perf_counter() - start
+    logger.info(f"{stage} took {timings[stage]:.2f} s")
+
+
+def postprocess_labels(
+    input_path,
+    output_path,
+    radius=1,
+    min_area=None,
+    simplify_tolerance=None,
+    connectivity=4,
+    tile_size=1024,
+    raster_output_path=None,
+    max_pixels=MAX_PIXELS,
+):
+    """
+    Clean a stratification label raster and write its strata polygons.
+
+    Args:
+        input_path (str): Single band label GeoTIFF.
+        output_path (str): `.geojson` or `.fgb` file to write the polygons to.
+        radius (int, optional): Majority filter radius in pixels, 0 disables
+            the filter. Defaults to 1 (3x3).
+        min_area (float, optional): Minimum mapping unit in squared CRS units
+            (e.g. m2 for EPSG:3857), smaller regions are merged into a
+            neighbour. Defaults to None (no sieve).
+        simplify_tolerance (float, optional): Polygon simplification tolerance
+            in CRS units. Defaults to None.
+        connectivity (int, optional): 4 or 8 connectivity for the sieve and the
+            polygons. Defaults to 4.
+        tile_size (int, optional): Tile size of the majority filter. Defaults
+            to 1024.
+        raster_output_path (str, optional): Also write the cleaned label raster
+            here. Defaults to None.
+        max_pixels (int, optional): Largest label raster, in pixels, that is
+            read. Defaults to `MAX_PIXELS`.
+
+    Returns:
+        Dict[str, Any]: `output_path`, the polygons as `geodataframe` and
+            per-stage `timings` in seconds.
+    """
+    driver = VECTOR_DRIVERS.get(output_path[output_path.rfind(".") :].lower())
+    if driver is None:
+        raise ValueError(
+            f"Unsupported output {output_path}, "
+            f"use one of {sorted(VECTOR_DRIVERS)}"
+        )
+
+    timings = {}
+    with _timed(timings, "read"):
+        with rasterio.open(input_path) as src:
+            if src.width * src.height > max_pixels:
+                raise ValueError(
+                    "The sieve and polygonize read the whole label raster, "
+                    f"{src.width}x{src.height} pixels is more than "
+                    f"max_pixels={max_pixels}"
+                )
+            labels = src.read(1)
+            profile = src.profile.copy()
+            nodata = (
+                None if src.nodata is None else labels.dtype.type(src.nodata)
+            )
+
+    with _timed(timings, "majority_filter"):
+        labels = majority_filter(labels, radius, nodata, tile_size)
+
+    with _timed(timings, "sieve"):
+        if min_area:
+            pixel_area = abs(profile["transform"].a * profile["transform"].e)
+            labels = sieve_labels(
+                labels, math.ceil(min_area / pixel_area), nodata, connectivity
+            )
+
+    if raster_output_path is not None:
+        with _timed(timings, "write_raster"):
+            with rasterio.open(raster_output_path, "w", **profile) as dst:
+                dst.write(labels, 1)
+
+    with _timed(timings, "polygonise"):
+        polygons = polygonise_labels(
+            labels,
+            profile["transform"],
+            profile["crs"],
+            nodata,
+            connectivity,
+            simplify_tolerance,
+        )
+
+    with _timed(timings, "write_vector"):
+        polygons.to_file(output_path, driver=driver)
+
+    return {
+        "output_path": output_path,
+        "geodataframe": polygons,
+        "timings": timings,
+    }
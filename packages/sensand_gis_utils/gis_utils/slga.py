@@ -0,0 +1,455 @@
+"""
+Single-read SLGA processing.
+
+The SLGA production notebook used to read the remote COG window, mask the same
+remote source again with `rasterio.mask.mask`, write the masked tiff and then
+reopen it from disk to colourise it. `process_slga_cog` does the same work from
+one windowed read: the window covering the geometry is fetched once, masked in
+memory, and the statistics, colourised overlay and COG are all made from that
+in-memory array.
+
+`process_slga_layers` runs several attributes and depths in one call. Reads run
+concurrently in a thread pool, and the geometry is reprojected and rasterised
+into a mask once per raster grid (`GeometryMasks`) and shared by every layer on
+that grid. `depth_cog_source` derives the COG of another standard depth from a
+0-5cm COG URL.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.features import geometry_mask
+from rasterio.io import MemoryFile
+from rasterio.warp import calculate_default_transform, reproject
+from rasterio.windows import from_bounds
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+from .block_cache import open_raster
+from .geometry import AreaOfInterest
+from .geotiff import apply_color_map
+from .io_profile import remote_io
+from .overviews import read_window
+
+logger = logging.getLogger()
+
+# standard SLGA depth intervals and the depth code used in the COG file names
+SLGA_DEPTH_CODES = {
+    "0-5cm": "000_005",
+    "5-15cm": "005_015",
+    "15-30cm": "015_030",
+    "30-60cm": "030_060",
+    "60-100cm": "060_100",
+    "100-200cm": "100_200",
+}
+
+
+def depth_cog_source(cog_source, depth):
+    """
+    COG URL of an SLGA attribute at another standard depth, e.g.
+    `CLY_000_005_...tif` -> `CLY_005_015_...tif`. Sources without a standard
+    depth code in their name (e.g. depth of regolith) are returned unchanged.
+
+    Only the depth code is replaced, so this assumes every depth of an
+    attribute is published with the same version and date suffix as the 0-5cm
+    COG, as the SLGA releases on esoil.io are. A depth released separately
+    gives a URL that does not exist, and its layer fails in
+    `process_slga_layers`.
+    """
+    if depth not in SLGA_DEPTH_CODES:
+        raise ValueError(
+            f"Unknown SLGA depth {depth}, use one of {list(SLGA_DEPTH_CODES)}"
+        )
+    codes = "|".join(SLGA_DEPTH_CODES.values())
+    return re.sub(
+        rf"_({codes})_", f"_{SLGA_DEPTH_CODES[depth]}_", cog_source, count=1
+    )
+
+
+class GeometryMasks:
+    """
+    Reprojected geometries and rasterised masks of one area of interest, cached
+    per CRS and raster grid and safe to share between threads. The area is an
+    `AreaOfInterest` or a GeoDataFrame.
+    """
+
+    def __init__(self, gdf, all_touched=True):
+        self.area = (
+            gdf
+            if isinstance(gdf, AreaOfInterest)
+            else AreaOfInterest.from_geodataframe(gdf)
+        )
+        self.all_touched = all_touched
+        self._masks = {}
+        self._lock = threading.Lock()
+
+    def geoms(self, crs):
+        return self.area.to_crs(crs)
+
+    def mask(self, crs, transform, shape):
+        """
+        True outside the geometry, for a grid of `shape` pixels at `transform`.
+        """
+        key = (
+            CRS.from_user_input(crs).to_wkt(),
+            tuple(transform),
+            tuple(shape),
+        )
+        geoms = self.geoms(crs)
+        with self._lock:
+            if key not in self._masks:
+                self._masks[key] = geometry_mask(
+                    geoms.mapping,
+                    out_shape=shape,
+                    transform=transform,
+                    all_touched=self.all_touched,
+                )
+            return self._masks[key]
+
+
+def read_masked_window(
+    src,
+    gdf,
+    all_touched=True,
+    masks=None,
+    resolution=None,
+    max_pixels=None,
+):
+    """
+    Read the window of an open raster covering a geometry and mask it to the
+    geometry in memory. With `resolution` or `max_pixels` the window is read
+    from the matching COG overview (`gis_utils.overviews`).
+
+    Args:
+        src: Open rasterio dataset, e.g. a remote COG.
+        gdf (AreaOfInterest or geopandas.GeoDataFrame): Geometry to mask to, in
+            any CRS.
+        all_touched (bool, optional): Keep every pixel touched by the geometry.
+            Defaults to True.
+        masks (GeometryMasks, optional): Shared geometry/mask cache, used
+            instead of `gdf` and `all_touched`. Defaults to None.
+        resolution (float, optional): Target pixel size in the raster CRS
+            units. Defaults to None (native).
+        max_pixels (int, optional): Maximum pixels read. Defaults to None (no
+            limit).
+
+    Returns:
+        Tuple[np.ma.MaskedArray, Dict[str, Any]]: The (1, height, width)
+            float32 masked array and its profile.
+    """
+    if masks is None:
+        masks = GeometryMasks(gdf, all_touched)
+    geoms = masks.geoms(src.crs)
+    window = from_bounds(*geoms.bounds, transform=src.transform)
+    # snap both edges outwards to whole pixels, edges on pixel edges within
+    # floating point error stay put
+    col_start, row_start = (
+        math.floor(window.col_off + 1e-6),
+        math.floor(window.row_off + 1e-6),
+    )
+    col_end = math.ceil(window.col_off + window.width - 1e-6)
+    row_end = math.ceil(window.row_off + window.height - 1e-6)
+    window = rasterio.windows.Window(
+        col_start, row_start, col_end - col_start, row_end - row_start
+    )
+    window = window.intersection(
+        rasterio.windows.Window(0, 0, src.width, src.height)
+    )
+    data, transform = read_window(src, window, 1, resolution, max_pixels)
+    data = data.astype("float32")
+    outside = masks.mask(src.crs, transform, data.shape)
+    data = np.ma.masked_array(
+        data.data, mask=np.ma.getmaskarray(data) | outside
+    )
+
+    profile = src.meta.copy()
+    profile.update(
+        {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": 1,
+            "height": data.shape[0],
+            "width": data.shape[1],
+            "transform": transform,
+            "nodata": np.nan,
+        }
+    )
+    return data[np.newaxis], profile
+
+
+def upsample(data, profile, upscale_factor=2):
+    """
+    Bilinear upsampling of a masked (1, height, width) array by an integer
+    factor, in memory.
+    """
+    out_shape = (
+        data.shape[0],
+        int(data.shape[1] * upscale_factor),
+        int(data.shape[2] * upscale_factor),
+    )
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dataset:
+            dataset.write(data.filled(np.nan))
+            upsampled = dataset.read(
+                out_shape=out_shape, resampling=Resampling.bilinear
+            )
+
+    profile = profile.copy()
+    profile.update(
+        {
+            "height": out_shape[1],
+            "width": out_shape[2],
+            "transform": profile["transform"]
+            @ Affine.scale(1 / upscale_factor, 1 / upscale_factor),
+        }
+    )
+    return np.ma.masked_invalid(upsampled), profile
+
+
+def raster_stats(data):
+    """min, max, mean and std_dev of the unmasked pixels."""
+    return {
+        "min": float(data.min()),
+        "max": float(data.max()),
+        "mean": float(data.mean()),
+        "std_dev": float(data.std()),
+    }
+
+
+def to_epsg4326(data, profile):
+    """
+    Reproject a masked (1, height, width) array to EPSG:4326 in memory, masked
+    pixels become NaN.
+    """
+    dst_crs = CRS.from_epsg(4326)
+    source = data.filled(np.nan)
+    if CRS.from_user_input(profile["crs"]) == dst_crs:
+        return source[0], dict(profile, crs=dst_crs)
+
+    transform, width, height = calculate_default_transform(
+        profile["crs"],
+        dst_crs,
+        profile["width"],
+        profile["height"],
+        *rasterio.transform.array_bounds(
+            profile["height"], profile["width"], profile["transform"]
+        ),
+    )
+    destination = np.full((height, width), np.nan, dtype="float32")
+    reproject(
+        source[0],
+        destination,
+        src_transform=profile["transform"],
+        src_crs=profile["crs"],
+        src_nodata=np.nan,
+        dst_transform=transform,
+        dst_crs=dst_crs,
+        dst_nodata=np.nan,
+        resampling=Resampling.nearest,
+    )
+    profile = dict(
+        profile, crs=dst_crs, transform=transform, width=width, height=height
+    )
+    return destination, profile
+
+
+def write_cog(rgb, profile, output_cog_filename):
+    """
+    Write a (height, width, 3) uint8 image straight to a deflate COG, with 0 as
+    nodata.
+    """
+    meta = {
+        "driver": "GTiff",
+        "dtype": "uint8",
+        "count": 3,
+        "height": rgb.shape[0],
+        "width": rgb.shape[1],
+        "crs": profile["crs"],
+        "transform": profile["transform"],
+    }
+    dst_profile = cog_profiles.get("deflate")
+    with MemoryFile() as memfile:
+        with memfile.open(**meta) as dataset:
+            dataset.write(np.moveaxis(rgb, -1, 0))
+        with memfile.open() as dataset:
+            cog_translate(
+                dataset,
+                output_cog_filename,
+                dst_profile,
+                in_memory=True,
+                dtype="uint8",
+                add_mask=False,
+                nodata=0,
+                quiet=True,
+            )
+    return output_cog_filename
+
+
+def process_slga_cog(
+    cog_source,
+    gdf,
+    output_cog_filename,
+    colour_map="viridis",
+    masked_tiff_filename=None,
+    upscale_factor=None,
+    all_touched=True,
+    masks=None,
+    max_pixels=None,
+    io_options=None,
+):
+    """
+    Read, mask, summarise, colourise and COG an SLGA layer with a single read
+    of the remote COG.
+
+    Args:
+        cog_source (str): URL or path of the SLGA COG.
+        gdf (AreaOfInterest or geopandas.GeoDataFrame): Area of interest.
+        output_cog_filename (str): Path of the colourised EPSG:4326 COG, e.g.
+            `..._cog.public.tiff`.
+        colour_map (str, optional): Matplotlib colour map name. Defaults to
+            "viridis".
+        masked_tiff_filename (str, optional): Also write the masked float32
+            data here. Defaults to None.
+        upscale_factor (int, optional): Bilinear upsampling factor applied
+            before colourising. Defaults to None.
+        all_touched (bool, optional): Keep every pixel touched by the geometry.
+            Defaults to True.
+        masks (GeometryMasks, optional): Geometry/mask cache shared between
+            layers. Defaults to None.
+        max_pixels (int, optional): Pixel budget of the read, larger areas are
+            read from a COG overview. Defaults to None (native resolution).
+        io_options (Dict[str, Any], optional): GDAL options overriding
+            `gis_utils.io_profile.REMOTE_IO_PROFILE`. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The masked `data`, its `profile`, the `raster_stats`
+            and the `cog` path.
+    """
+    print(f"Opening SLGA asset from: {cog_source}")
+    with remote_io(**(io_options or {})), open_raster(cog_source) as src:
+        data, profile = read_masked_window(
+            src, gdf, all_touched, masks, max_pixels=max_pixels
+        )
+
+    if data.count() == 0:
+        raise ValueError(
+            f"No valid SLGA pixels inside the geometry in {cog_source}"
+        )
+
+    if upscale_factor:
+        print(f"Resampling data to upscale factor: {upscale_factor}")
+        data, profile = upsample(data, profile, upscale_factor)
+
+    if masked_tiff_filename is not None:
+        os.makedirs(
+            os.path.dirname(masked_tiff_filename) or ".", exist_ok=True
+        )
+        with rasterio.open(masked_tiff_filename, "w", **profile) as dst:
+            dst.write(data.filled(np.nan))
+        print(f"Written masked data to {masked_tiff_filename}")
+
+    stats = raster_stats(data)
+
+    overlay, overlay_profile = to_epsg4326(data, profile)
+    rgb, _ = apply_color_map(overlay, colour_map, overlay_profile)
+    os.makedirs(os.path.dirname(output_cog_filename) or ".", exist_ok=True)
+    write_cog(rgb, overlay_profile, output_cog_filename)
+    print(f"Written COG to {output_cog_filename}")
+
+    return {
+        "data": data,
+        "profile": profile,
+        "raster_stats": stats,
+        "cog": output_cog_filename,
+    }
+
+
+def process_slga_layers(
+    layers,
+    gdf,
+    colour_map="viridis",
+    upscale_factor=None,
+    all_touched=True,
+    max_workers=4,
+    stats_filename=None,
+    max_pixels=None,
+    io_options=None,
+):
+    """
+    Process several SLGA attributes/depths concurrently with
+    `process_slga_cog`.
+
+    The geometry is reprojected and rasterised once per raster grid and shared
+    by all layers, and each layer's window is read once.
+
+    Args:
+        layers (List[Dict[str, str]]): One dict per layer with `name`, `source`
+            (COG URL) and `cog` (output COG path), and optionally `masked_tiff`
+            (path of the masked float32 tiff).
+        gdf (AreaOfInterest or geopandas.GeoDataFrame): Area of interest.
+        colour_map (str, optional): Matplotlib colour map name. Defaults to
+            "viridis".
+        upscale_factor (int, optional): Bilinear upsampling factor. Defaults to
+            None.
+        all_touched (bool, optional): Keep every pixel touched by the geometry.
+            Defaults to True.
+        max_workers (int, optional): Concurrent layer reads. Defaults to 4.
+        stats_filename (str, optional): Write the stats of every layer to this
+            JSON file. Defaults to None.
+        max_pixels (int, optional): Pixel budget of every layer read. Defaults
+            to None (native resolution).
+        io_options (Dict[str, Any], optional): GDAL options overriding the
+            remote I/O profile. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: `results` and `failed` (error message) keyed by layer
+            name, and the combined `stats`.
+    """
+    masks = GeometryMasks(gdf, all_touched)
+
+    def process(layer):
+        return process_slga_cog(
+            layer["source"],
+            gdf,
+            layer["cog"],
+            colour_map=colour_map,
+            masked_tiff_filename=layer.get("masked_tiff"),
+            upscale_factor=upscale_factor,
+            masks=masks,
+            max_pixels=max_pixels,
+            io_options=io_options,
+        )
+
+    results, failed = {}, {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(layers)))
+    ) as pool:
+        futures = {
+            layer["name"]: pool.submit(process, layer) for layer in layers
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(
+                    f"Error processing SLGA layer {name}: {e}", exc_info=True
+                )
+                failed[name] = f"{type(e).__name__}: {e}"
+
+    stats = {name: result["raster_stats"] for name, result in results.items()}
+    if stats_filename is not None:
+        with open(stats_filename, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+        print(f"Stats of {len(stats)} layers saved to {stats_filename}")
+
+    return {"results": results, "failed": failed, "stats": stats}
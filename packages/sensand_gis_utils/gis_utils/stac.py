@@ -1,34 +1,211 @@
 import json
 import logging
+import math
 import os
+import threading
+import time
+from queue import Full, Queue
 
 import numpy as np  # added to use nan for masking.
+import pystac
 import pystac_client
 import rasterio
 import rasterio.mask  # added for masking/cliping rasters
+from rasterio.features import geometry_mask, geometry_window
 from rasterio.windows import from_bounds
+from shapely.geometry import box, mapping, shape
+
+from .block_cache import open_raster
+from .io_profile import remote_io
+from .mosaic import read_mosaic, select_assets
+from .overviews import read_window
 
 logger = logging.getLogger()
 
 
-def initialize_stac_client(stac_url):
+# Items of collections whose contents never change, served without any STAC request. Keyed by
+# (STAC API URL, collection id), see `register_static_items`.
+STATIC_ITEMS = {}
+
+_SEARCH_CACHE = {}
+_STAC_CLIENTS = {}
+_cache_lock = threading.Lock()
+
+
+def _normalise_url(stac_url):
+    return stac_url.rstrip("/")
+
+
+def register_static_items(stac_url, collection, items):
+    """
+    Serve the items of a static collection from memory, so searches of it never reach the STAC API.
+
+    Parameters:
+    - stac_url (str): The URL of the STAC API the collection belongs to.
+    - collection (str): The collection ID.
+    - items (list): pystac Items or item dicts; searches return the ones intersecting the bbox and date range.
+    """
+    STATIC_ITEMS[(_normalise_url(stac_url), collection)] = [
+        item.to_dict() if isinstance(item, pystac.Item) else item for item in items
+    ]
+
+
+# GA SRTM 1 second smoothed DEM: one item covering Australia whose COG never changes. The bbox is the continental
+# extent used to decide whether a search area is covered.
+register_static_items(
+    "https://explorer.sandbox.dea.ga.gov.au/stac/",
+    "ga_srtm_dem1sv1_0",
+    [
+        {
+            "type": "Feature",
+            "stac_version": "1.0.0",
+            "id": "ga_srtm_dem1sv1_0",
+            "collection": "ga_srtm_dem1sv1_0",
+            "bbox": [112.0, -44.0, 154.0, -10.0],
+            "geometry": mapping(box(112.0, -44.0, 154.0, -10.0)),
+            "properties": {
+                "datetime": None,
+                "start_datetime": "2000-02-11T00:00:00Z",
+                "end_datetime": "2000-02-22T23:59:59Z",
+            },
+            "links": [],
+            "assets": {
+                "dem": {
+                    "title": "dem",
+                    "href": "https://dea-public-data.s3-ap-southeast-2.amazonaws.com/projects/elevation/"
+                    "ga_srtm_dem1sv1_0/dem1sv1_0.tif",
+                    "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+                    "roles": ["data"],
+                }
+            },
+        }
+    ],
+)
+
+
+def initialize_stac_client(stac_url, refresh=False):
     """
     Initialize and return a STAC client for a given STAC API URL.
 
+    Clients are memoised per URL, so the root catalog and conformance documents are only fetched once per process.
+
     Parameters:
     - stac_url (str): The URL of the STAC API.
+    - refresh (bool, optional): Open a new client even if one is memoised. Defaults to False.
 
     Returns:
     - A pystac_client.Client object
     """
+    key = _normalise_url(stac_url)
+    with _cache_lock:
+        if not refresh and key in _STAC_CLIENTS:
+            return _STAC_CLIENTS[key]
     try:
         print(f"Initializing STAC client for URL: {stac_url}")
         client = pystac_client.Client.open(stac_url)
         print("STAC client initialized successfully")
-        return client
     except Exception:
         print("Failed to initialize STAC client")
         raise
+    with _cache_lock:
+        _STAC_CLIENTS[key] = client
+    return client
+
+
+def quantise_bbox(bbox, precision=0.01):
+    """Expand a bbox outwards to a grid of `precision` degrees, so nearby areas share search cache entries."""
+    min_x, min_y, max_x, max_y = bbox
+    return (
+        round(math.floor(min_x / precision) * precision, 10),
+        round(math.floor(min_y / precision) * precision, 10),
+        round(math.ceil(max_x / precision) * precision, 10),
+        round(math.ceil(max_y / precision) * precision, 10),
+    )
+
+
+def _item_matches(item, bbox, start_date, end_date):
+    """Whether an item dict intersects the bbox and the (inclusive) date range."""
+    geometry = shape(item["geometry"]) if item.get("geometry") else box(*item["bbox"])
+    if not geometry.intersects(box(*bbox)):
+        return False
+    if start_date and end_date:
+        properties = item.get("properties", {})
+        item_start = properties.get("start_datetime") or properties.get("datetime")
+        item_end = properties.get("end_datetime") or properties.get("datetime")
+        if item_start and item_end:
+            return item_start[:10] <= end_date and item_end[:10] >= start_date
+    return True
+
+
+def search_stac(
+    stac_url,
+    bbox,
+    collections,
+    start_date=None,
+    end_date=None,
+    limit=10,
+    ttl=3600,
+    bbox_precision=0.01,
+):
+    """
+    Cached search of a STAC API for items within a bounding box and date range for specific collections.
+
+    Collections registered with `register_static_items` are answered from memory. Other searches are memoised for
+    `ttl` seconds by (STAC URL, collections, bbox quantised to `bbox_precision` degrees, date range): the API is
+    searched with the quantised bbox and the items intersecting the requested bbox are returned. The client is
+    only opened (once per URL) on a cache miss.
+
+    Parameters:
+    - stac_url (str): The URL of the STAC API.
+    - bbox (list): The bounding box for the query [min_lon, min_lat, max_lon, max_lat].
+    - collections (list): A list of collection IDs to include in the query.
+    - start_date (str, optional): The start date for the query (YYYY-MM-DD). Defaults to None.
+    - end_date (str, optional): The end date for the query (YYYY-MM-DD). Defaults to None.
+    - limit (int): Number of items per page of the search.
+    - ttl (float, optional): Seconds a search result is reused, 0 disables the cache. Defaults to 3600.
+    - bbox_precision (float, optional): Grid of the quantised cache key bbox, in degrees. Defaults to 0.01.
+
+    Returns:
+    - A list of STAC Items that match the query parameters.
+    """
+    url = _normalise_url(stac_url)
+    collections = [collections] if isinstance(collections, str) else list(collections)
+    dates = (start_date, end_date) if start_date and end_date else (None, None)
+
+    if all((url, collection) in STATIC_ITEMS for collection in collections):
+        items = [
+            item
+            for collection in collections
+            for item in STATIC_ITEMS[(url, collection)]
+            if _item_matches(item, bbox, *dates)
+        ]
+        print(f"Found {len(items)} static items")
+        return [pystac.Item.from_dict(item) for item in items]
+
+    search_bbox = quantise_bbox(bbox, bbox_precision)
+    key = (url, tuple(sorted(collections)), search_bbox, dates, limit)
+    with _cache_lock:
+        cached = _SEARCH_CACHE.get(key)
+    if cached is not None and time.monotonic() < cached[0]:
+        item_dicts = cached[1]
+    else:
+        client = initialize_stac_client(stac_url)
+        items = query_stac_api(client, list(search_bbox), collections, *dates, limit=limit)
+        item_dicts = [item.to_dict() for item in items]
+        if ttl > 0:
+            with _cache_lock:
+                _SEARCH_CACHE[key] = (time.monotonic() + ttl, item_dicts)
+
+    items = [item for item in item_dicts if _item_matches(item, bbox, *dates)]
+    print(f"Found {len(items)} items")
+    return [pystac.Item.from_dict(item) for item in items]
+
+
+def clear_stac_cache():
+    """Forget memoised STAC clients and search results (static items are kept)."""
+    with _cache_lock:
+        _STAC_CLIENTS.clear()
+        _SEARCH_CACHE.clear()
 
 
 def query_stac_api(
@@ -49,16 +226,11 @@ def query_stac_api(
     - A list of STAC Items that match the query parameters.
     """
     try:
-        search_params = {
-            "bbox": bbox,
-            "collections": collections,
-            "limit": limit,
-        }
-        if start_date and end_date:
-            search_params["datetime"] = f"{start_date}/{end_date}"
-
-        search = client.search(**search_params)
-        items = list(search.items())
+        items = list(
+            iter_stac_items(
+                client, bbox, collections, start_date, end_date, page_size=limit, prefetch_pages=0
+            )
+        )
         print(f"Found {len(items)} items")
         return items
     except Exception:
@@ -66,6 +238,111 @@ def query_stac_api(
         raise
 
 
+def _prefetched(pages, prefetch_pages):
+    """Iterate `pages` in a background thread, keeping up to `prefetch_pages` fetched ahead of the consumer."""
+    queue = Queue(maxsize=prefetch_pages)
+    stop = threading.Event()
+    done = object()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                queue.put(value, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def fetch():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=fetch, daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = queue.get()
+            if page is done:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        # also reached when the consumer stops early, the fetch thread stops after the page in flight
+        stop.set()
+
+
+def iter_stac_items(
+    client,
+    bbox,
+    collections,
+    start_date=None,
+    end_date=None,
+    query=None,
+    filter=None,
+    filter_lang=None,
+    sortby=None,
+    fields=None,
+    max_items=None,
+    page_size=100,
+    prefetch_pages=2,
+    as_dicts=False,
+):
+    """
+    Stream the items of a STAC search as pages arrive, instead of collecting every page first.
+
+    The next `prefetch_pages` pages are fetched in a background thread while the consumer works on the current
+    one, e.g. loading rasters of the first Sentinel-2 scenes while later pages are still in flight. Stopping the
+    iteration early (or `max_items`) stops paging.
+
+    Parameters:
+    - client: A pystac_client.Client, or the URL of the STAC API (opened with `initialize_stac_client`).
+    - bbox (list): The bounding box for the query [min_lon, min_lat, max_lon, max_lat].
+    - collections (list): A list of collection IDs to include in the query.
+    - start_date (str, optional): The start date for the query (YYYY-MM-DD). Defaults to None.
+    - end_date (str, optional): The end date for the query (YYYY-MM-DD). Defaults to None.
+    - query (dict, optional): STAC query extension filter, e.g. {"eo:cloud_cover": {"lt": 20}}. Defaults to None.
+    - filter (dict or str, optional): CQL2 filter evaluated by the server. Defaults to None.
+    - filter_lang (str, optional): "cql2-json" or "cql2-text", inferred by pystac_client when None.
+    - sortby (str or list, optional): Sort order, e.g. "-properties.datetime". Defaults to None.
+    - fields (list or dict, optional): Fields extension include/exclude list to shrink the payload, e.g.
+      ["id", "properties.datetime", "assets.red"]. Defaults to None.
+    - max_items (int, optional): Stop after this many items. Defaults to None (all).
+    - page_size (int): Items per page requested from the server. Defaults to 100.
+    - prefetch_pages (int): Pages fetched ahead in the background, 0 fetches each page when it is needed.
+    - as_dicts (bool): Yield item dicts instead of pystac Items, cheaper and needed when `fields` drops keys
+      pystac requires. Defaults to False.
+
+    Yields:
+    - STAC Items (or item dicts) matching the query parameters.
+    """
+    if isinstance(client, str):
+        client = initialize_stac_client(client)
+    search_params = {
+        "bbox": bbox,
+        "collections": collections,
+        "limit": page_size,
+        "max_items": max_items,
+    }
+    if start_date and end_date:
+        search_params["datetime"] = f"{start_date}/{end_date}"
+    optional = {"query": query, "filter": filter, "filter_lang": filter_lang, "sortby": sortby, "fields": fields}
+    search_params.update({key: value for key, value in optional.items() if value is not None})
+
+    pages = client.search(**search_params).pages_as_dicts()
+    root = client if isinstance(client, pystac.Catalog) else None
+    if prefetch_pages > 0:
+        pages = _prefetched(pages, prefetch_pages)
+    for page in pages:
+        for item in page.get("features", []):
+            yield item if as_dicts else pystac.Item.from_dict(item, root=root, preserve_dict=False)
+
+
 def inspect_stac_item(item):
     """
     Inspects a STAC item and prints out key information to help identify the data type.
@@ -170,7 +447,14 @@ def process_dem_asset(dem_asset, bbox, output_tiff_filename):
 
 
 def process_dem_asset_and_mask(
-    dem_asset, geometry, bbox, output_tiff_filename, masked=True
+    dem_asset,
+    geometry,
+    bbox,
+    output_tiff_filename,
+    masked=True,
+    resolution=None,
+    max_pixels=None,
+    io_options=None,
 ):
     """
     Process a DEM asset by reading a specific region defined by a bounding box and writing it to a new file.
@@ -182,6 +466,11 @@ def process_dem_asset_and_mask(
     - output_tiff_filename (str): The file path where the output TIFF file will be written.
     - asset_type (str): The type of the asset (typically 'overlay' considering we're using rasterio).
     - masked (boolean): If true, apply masking to the raster.
+    - resolution (float, optional): Target pixel size in the units of the DEM CRS (degrees for the SRTM DEM).
+    - max_pixels (int, optional): Maximum number of pixels to read. With `resolution` or `max_pixels` the window
+      is read from the matching COG overview instead of at native resolution, so large areas only fetch the
+      bytes of the output size.
+    - io_options (dict, optional): GDAL options overriding `gis_utils.io_profile.REMOTE_IO_PROFILE` for this read.
 
     Returns:
     - None
@@ -190,11 +479,23 @@ def process_dem_asset_and_mask(
         print(f"Opening DEM asset from: {dem_asset.href}")
         data, metadata = None, {}
 
-        with rasterio.open(dem_asset.href) as src:
-            # Nodata value here is being set to 0. This works for DEM but is not OK for indices.
-            data, out_transform = rasterio.mask.mask(
-                src, geometry, crop=True, nodata=np.nan, all_touched=True
-            )
+        with remote_io(**(io_options or {})), open_raster(dem_asset.href) as src:
+            if resolution is None and max_pixels is None:
+                # Nodata value here is being set to 0. This works for DEM but is not OK for indices.
+                data, out_transform = rasterio.mask.mask(
+                    src, geometry, crop=True, nodata=np.nan, all_touched=True
+                )
+            else:
+                window = geometry_window(src, geometry)
+                band, out_transform = read_window(
+                    src, window, resolution=resolution, max_pixels=max_pixels
+                )
+                outside = geometry_mask(
+                    geometry, band.shape, out_transform, all_touched=True
+                )
+                band = band.astype("float32").filled(np.nan)
+                band[outside] = np.nan
+                data = band[np.newaxis]
 
             # window = from_bounds(*bbox, transform=src.transform)
             # data = src.read(window=window)
@@ -230,6 +531,52 @@ def process_dem_asset_and_mask(
         raise
 
 
+def process_dem_items_and_mask(
+    items,
+    geometry,
+    output_tiff_filename,
+    asset_key="dem",
+    resolution=None,
+    max_pixels=None,
+    io_options=None,
+):
+    """
+    Mosaic the DEM assets of every STAC item intersecting the geometry, mask it and write it to a new file.
+
+    Unlike `process_dem_asset_and_mask`, which reads one asset, areas crossing item footprints are read from all
+    the items they touch (see `gis_utils.mosaic.read_mosaic`), each only over the window overlapping the area.
+
+    Parameters:
+    - items (list): STAC Items, e.g. from `search_stac`.
+    - geometry (list): GeoJSON geometries (EPSG:4326) of the area, formatted for rasterio.
+    - output_tiff_filename (str): The file path where the output TIFF file will be written.
+    - asset_key (str, optional): Key of the DEM asset in the items. Defaults to "dem".
+    - resolution (float, optional): Target pixel size in the units of the DEM CRS (degrees for the SRTM DEM).
+    - max_pixels (int, optional): Maximum number of pixels to read, larger areas are read from COG overviews.
+    - io_options (dict, optional): GDAL options overriding `gis_utils.io_profile.REMOTE_IO_PROFILE` for the reads.
+
+    Returns:
+    - The (1, height, width) float32 data with NaN outside the area, and its GeoTIFF metadata.
+    """
+    try:
+        hrefs = select_assets(items, geometry, asset_key)
+        print(f"Mosaicking {len(hrefs)} DEM assets: {hrefs}")
+        mosaic, metadata = read_mosaic(
+            hrefs, geometry, resolution=resolution, max_pixels=max_pixels, io_options=io_options
+        )
+        data = mosaic.filled(np.nan)[np.newaxis]
+
+        os.makedirs(os.path.dirname(output_tiff_filename) or ".", exist_ok=True)
+        print(f"Writing to file: {output_tiff_filename}")
+        with rasterio.open(output_tiff_filename, "w", **metadata) as dst:
+            dst.write(data)
+        print(f"Output mask file size: {os.path.getsize(output_tiff_filename)} bytes")
+        return data, metadata
+    except Exception as e:
+        print(f"Failed to process DEM items: {e}")
+        raise
+
+
 def save_metadata_sidecar(file_path, metadata):
     """
     Saves metadata to a sidecar file in JSON format.
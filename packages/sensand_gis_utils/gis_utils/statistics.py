@@ -0,0 +1,433 @@
+"""
+Block-streamed raster statistics.
+
+`raster_statistics` reads a raster block by block, so memory depends on the
+block size and not on the raster size. Every band is handled independently: a
+pixel counts for a band when it is not masked (nodata) in that band, is finite,
+and lies inside the optional geometries.
+
+Up to three passes are made over the raster:
+1. count, min, max, mean and standard deviation, merged block by block
+   (`StreamingStats`).
+2. only when percentiles are requested: a histogram of `bins` equal bins
+   between min and max. Percentiles are interpolated inside the bin holding
+   their rank, so they are off by at most one bin width.
+3. only with `exact=True`: the values of the bins holding the requested ranks
+   are collected and sorted, which gives the same percentiles as
+   `np.percentile` while only a few bins of values are held in memory.
+
+`zonal_statistics` summarises one raster band per zone (e.g. every paddock of a
+property) in a single read: the zones are rasterised once into a label grid and
+the statistics of all zones are reduced together with `np.bincount`, instead of
+masking the raster once per zone.
+"""
+
+import logging
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import geometry_mask, rasterize
+
+from .stratification import StreamingStats, iter_windows
+
+logger = logging.getLogger()
+
+HISTOGRAM_BINS = 4096
+
+
+def _percentile_key(percentile):
+    return f"p{percentile:g}"
+
+
+class _BandStatistics:
+    """Streaming statistics of one band."""
+
+    def __init__(self, bins):
+        self.moments = StreamingStats(1)
+        self.min = np.inf
+        self.max = -np.inf
+        self.bins = bins
+        self.histogram = np.zeros(bins, dtype=np.int64)
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        self.moments.update(values[:, None])
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def bin_index(self, values):
+        if self.max <= self.min:
+            return np.zeros(len(values), dtype=np.int64)
+        scaled = (values - self.min) * (self.bins / (self.max - self.min))
+        return np.minimum(scaled.astype(np.int64), self.bins - 1)
+
+    def update_histogram(self, values):
+        if len(values):
+            self.histogram += np.bincount(
+                self.bin_index(values), minlength=self.bins
+            )
+
+    def rank(self, percentile):
+        """
+        Fractional rank of a percentile among the sorted values, as used by
+        `np.percentile`.
+        """
+        return percentile / 100 * (self.moments.count - 1)
+
+    def rank_bins(self, percentiles):
+        """Bins holding the ranks needed to interpolate the percentiles."""
+        cumulative = np.cumsum(self.histogram)
+        ranks = set()
+        for percentile in percentiles:
+            rank = self.rank(percentile)
+            ranks.update((int(np.floor(rank)), int(np.ceil(rank))))
+        return sorted(
+            {
+                int(np.searchsorted(cumulative, rank, side="right"))
+                for rank in ranks
+            }
+        )
+
+    def approximate_percentile(self, percentile):
+        rank = self.rank(percentile)
+        cumulative = np.cumsum(self.histogram)
+        k = int(np.searchsorted(cumulative, rank, side="right"))
+        before = cumulative[k] - self.histogram[k]
+        width = (self.max - self.min) / self.bins
+        # values are taken as evenly spread over their bin
+        value = self.min + width * (
+            k + (rank - before + 0.5) / self.histogram[k]
+        )
+        return float(np.clip(value, self.min, self.max))
+
+    def exact_percentile(self, percentile, bin_values):
+        cumulative = np.cumsum(self.histogram)
+
+        def value_at(rank):
+            k = int(np.searchsorted(cumulative, rank, side="right"))
+            before = cumulative[k] - self.histogram[k]
+            return float(bin_values[k][rank - before])
+
+        rank = self.rank(percentile)
+        lower, upper = int(np.floor(rank)), int(np.ceil(rank))
+        low_value = value_at(lower)
+        if upper == lower:
+            return low_value
+        return low_value + (value_at(upper) - low_value) * (rank - lower)
+
+    def result(self, percentiles):
+        count = self.moments.count
+        if count == 0:
+            return {
+                "count": 0,
+                "min": None,
+                "max": None,
+                "mean": None,
+                "std": None,
+            } | percentiles
+        stats = {
+            "count": int(count),
+            "min": self.min,
+            "max": self.max,
+            "mean": float(self.moments.mean[0]),
+            "std": float(self.moments.std[0]),
+        }
+        return stats | percentiles
+
+
+def _iter_band_values(src, bands, geoms, all_touched, max_pixels):
+    """
+    Yield, per window, the valid values of every band as a list of 1D float64
+    arrays.
+    """
+    for window in iter_windows(src, max_pixels):
+        data = src.read(bands, window=window, masked=True)
+        values = np.ma.filled(data.astype("float64"), np.nan)
+        valid = np.isfinite(values)
+        if geoms is not None:
+            inside = geometry_mask(
+                geoms,
+                out_shape=(int(window.height), int(window.width)),
+                transform=src.window_transform(window),
+                all_touched=all_touched,
+                invert=True,
+            )
+            valid &= inside
+        yield [
+            band_values[band_valid]
+            for band_values, band_valid in zip(values, valid)
+        ]
+
+
+def raster_statistics(
+    path,
+    bands=None,
+    geoms=None,
+    all_touched=False,
+    percentiles=(50,),
+    exact=False,
+    bins=HISTOGRAM_BINS,
+    max_pixels=1024 * 1024,
+):
+    """
+    Statistics of the valid pixels of a raster, streamed block by block.
+
+    Args:
+        path (str): Raster path.
+        bands (Sequence[int], optional): 1-based bands to summarise. Defaults
+            to all bands.
+        geoms (Iterable[dict], optional): GeoJSON-like geometries in the raster
+            CRS, only pixels inside them are used. Defaults to None (whole
+            raster).
+        all_touched (bool, optional): Use every pixel touched by the geometries
+            instead of the pixels whose centre is inside. Defaults to False.
+        percentiles (Sequence[float], optional): Percentiles (0-100) to
+            compute, 50 is also reported as `median`. Defaults to (50,).
+        exact (bool, optional): Exact percentiles (one more pass over the
+            raster) instead of histogram approximations within
+            `(max - min) / bins`. Defaults to False.
+        bins (int, optional): Histogram bins of the percentile pass. Defaults
+            to HISTOGRAM_BINS.
+        max_pixels (int, optional): Maximum pixels per block read. Defaults to
+            1024 * 1024.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: Per band `count`, `min`, `max`, `mean`,
+            `std` (population) and one `p<percentile>` entry per percentile,
+            plus `median`. Statistics of bands without valid pixels are None.
+    """
+    geoms = list(geoms) if geoms is not None else None
+    with rasterio.open(path) as src:
+        bands = list(bands) if bands is not None else list(src.indexes)
+        stats = {band: _BandStatistics(bins) for band in bands}
+
+        for block in _iter_band_values(
+            src, bands, geoms, all_touched, max_pixels
+        ):
+            for band, values in zip(bands, block):
+                stats[band].update(values)
+
+        needs_percentiles = bool(percentiles) and any(
+            s.moments.count for s in stats.values()
+        )
+        if needs_percentiles:
+            for block in _iter_band_values(
+                src, bands, geoms, all_touched, max_pixels
+            ):
+                for band, values in zip(bands, block):
+                    stats[band].update_histogram(values)
+
+        bin_values = {band: {} for band in bands}
+        if needs_percentiles and exact:
+            wanted = {
+                band: stats[band].rank_bins(percentiles)
+                for band in bands
+                if stats[band].moments.count
+            }
+            collected = {
+                band: {k: [] for k in wanted[band]} for band in wanted
+            }
+            for block in _iter_band_values(
+                src, bands, geoms, all_touched, max_pixels
+            ):
+                for band, values in zip(bands, block):
+                    if band not in wanted:
+                        continue
+                    indices = stats[band].bin_index(values)
+                    for k in wanted[band]:
+                        collected[band][k].append(values[indices == k])
+            for band, per_bin in collected.items():
+                bin_values[band] = {
+                    k: np.sort(np.concatenate(parts))
+                    for k, parts in per_bin.items()
+                }
+
+    results = {}
+    for band in bands:
+        band_stats = stats[band]
+        values = {}
+        if band_stats.moments.count:
+            for percentile in percentiles:
+                if exact:
+                    value = band_stats.exact_percentile(
+                        percentile, bin_values[band]
+                    )
+                else:
+                    value = band_stats.approximate_percentile(percentile)
+                values[_percentile_key(percentile)] = value
+        else:
+            values = {
+                _percentile_key(percentile): None for percentile in percentiles
+            }
+        if 50 in percentiles:
+            values["median"] = values[_percentile_key(50)]
+        results[band] = band_stats.result(values)
+    return results
+
+
+def _zones_frame(zones):
+    """
+    GeoDataFrame of the zones, GeoJSON FeatureCollections are taken to be in
+    EPSG:4326.
+    """
+    if isinstance(zones, gpd.GeoDataFrame):
+        return zones
+    return gpd.GeoDataFrame.from_features(zones["features"], crs="EPSG:4326")
+
+
+def rasterise_zones(geometries, shape, transform, all_touched=False):
+    """
+    Label grid of zones: pixel value `i + 1` for the i-th geometry and 0
+    outside every zone. Where zones overlap the later geometry wins.
+    """
+    shapes = [
+        (geometry, i + 1)
+        for i, geometry in enumerate(geometries)
+        if geometry is not None and not geometry.is_empty
+    ]
+    if not shapes:
+        return np.zeros(shape, dtype=np.uint32)
+    return rasterize(
+        shapes,
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        all_touched=all_touched,
+        dtype="uint32",
+    )
+
+
+class _ZoneStatistics:
+    """
+    Count, min, max, mean and variance of every zone, merged block by block.
+    """
+
+    def __init__(self, n_zones, histogram_bins):
+        size = n_zones + 1  # label 0 is outside every zone
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+        self.edges = histogram_bins
+        if histogram_bins is not None:
+            self.histogram = np.zeros(
+                (size, len(histogram_bins) - 1), dtype=np.int64
+            )
+
+    def update(self, labels, values):
+        size = len(self.count)
+        count = np.bincount(labels, minlength=size)
+        block_mean = np.bincount(labels, values, minlength=size) / np.maximum(
+            count, 1
+        )
+        block_m2 = np.bincount(
+            labels, (values - block_mean[labels]) ** 2, minlength=size
+        )
+
+        total = self.count + count
+        delta = block_mean - self.mean
+        weight = np.divide(count, total, out=np.zeros(size), where=total > 0)
+        self.mean = self.mean + delta * weight
+        self._m2 = self._m2 + block_m2 + delta**2 * self.count * weight
+        self.count = total
+        np.minimum.at(self.min, labels, values)
+        np.maximum.at(self.max, labels, values)
+
+        if self.edges is not None:
+            n_bins = len(self.edges) - 1
+            # same binning as np.histogram: half open bins, the last one
+            # includes its right edge
+            bins = np.searchsorted(self.edges, values, side="right") - 1
+            bins[values == self.edges[-1]] = n_bins - 1
+            inside = (bins >= 0) & (bins < n_bins)
+            self.histogram += np.bincount(
+                labels[inside] * n_bins + bins[inside], minlength=size * n_bins
+            ).reshape(size, n_bins)
+
+    def table(self):
+        empty = self.count[1:] == 0
+        columns = {
+            "count": self.count[1:],
+            "min": np.where(empty, np.nan, self.min[1:]),
+            "max": np.where(empty, np.nan, self.max[1:]),
+            "mean": np.where(empty, np.nan, self.mean[1:]),
+            "std": np.where(
+                empty,
+                np.nan,
+                np.sqrt(self._m2[1:] / np.maximum(self.count[1:], 1)),
+            ),
+        }
+        if self.edges is not None:
+            columns["histogram"] = [row.tolist() for row in self.histogram[1:]]
+        return pd.DataFrame(columns)
+
+
+def zonal_statistics(
+    path,
+    zones,
+    band=1,
+    id_field=None,
+    histogram_bins=None,
+    all_touched=False,
+    max_pixels=1024 * 1024,
+):
+    """
+    Statistics of one raster band for every zone, from a single pass over the
+    raster.
+
+    Args:
+        path (str): Raster path.
+        zones (gpd.GeoDataFrame or dict): Zones as a GeoDataFrame or a GeoJSON
+            FeatureCollection (EPSG:4326). They are reprojected to the raster
+            CRS. Where zones overlap, the pixels go to the later zone.
+        band (int, optional): 1-based band. Defaults to 1.
+        id_field (str, optional): Column or feature property identifying the
+            zones. Defaults to None (row order).
+        histogram_bins (Sequence[float], optional): Histogram bin edges, as for
+            `np.histogram`. Defaults to None (no histogram).
+        all_touched (bool, optional): Assign every pixel touched by a zone
+            instead of the pixels whose centre is inside. Defaults to False.
+        max_pixels (int, optional): Maximum pixels per block read. Defaults to
+            1024 * 1024.
+
+    Returns:
+        pd.DataFrame: One row per zone with the zone id (`id_field`, or `zone`
+            for the row order), `count`, `min`, `max`, `mean`, `std`
+            (population) and, with `histogram_bins`, the `histogram` counts.
+            Statistics of zones without valid pixels are NaN.
+    """
+    gdf = _zones_frame(zones)
+    edges = (
+        None
+        if histogram_bins is None
+        else np.asarray(histogram_bins, dtype="float64")
+    )
+
+    with rasterio.open(path) as src:
+        if gdf.crs is not None and src.crs is not None:
+            gdf = gdf.to_crs(src.crs)
+        labels = rasterise_zones(
+            gdf.geometry, (src.height, src.width), src.transform, all_touched
+        )
+        stats = _ZoneStatistics(len(gdf), edges)
+
+        for window in iter_windows(src, max_pixels):
+            rows, cols = window.toslices()
+            block_labels = labels[rows, cols]
+            if not block_labels.any():
+                continue  # blocks outside every zone are never read
+            data = src.read(band, window=window, masked=True)
+            values = np.ma.filled(data.astype("float64"), np.nan)
+            valid = (block_labels > 0) & np.isfinite(values)
+            stats.update(block_labels[valid].astype(np.int64), values[valid])
+
+    table = stats.table()
+    if id_field is None:
+        table.insert(0, "zone", np.arange(len(gdf)))
+    else:
+        table.insert(0, id_field, gdf[id_field].to_numpy())
+    return table
@@ -0,0 +1,357 @@
+"""
+Raster based K-means stratification with bounded memory.
+
+The input is one aligned multi-band raster, e.g. the cube written by
+`geodata_fetch.cube.build_cube`. A pixel is only used when every band is valid
+(not nodata and finite), so nodata never takes part in the clustering.
+
+The raster is read block by block in three passes:
+1. `compute_band_stats` accumulates per-band mean and standard deviation (Chan
+   et al. parallel update).
+2. `sample_pixels` draws a spatially stratified sample: every block contributes
+   pixels in proportion to its number of valid pixels, so no part of the
+   property is over or under represented.
+3. `predict_raster` standardises each block, assigns every valid pixel to its
+   nearest centre and writes the labels straight to a GeoTIFF.
+
+`MiniBatchKMeans` is fitted on the standardised sample only, so memory use
+depends on the block size and `n_samples`, not on the size of the property.
+`stratify_raster` runs the whole pipeline.
+"""
+
+import logging
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+logger = logging.getLogger()
+
+LABEL_NODATA = 255
+
+
+def iter_windows(src, max_pixels=1024 * 1024):
+    """
+    Windows covering a raster, following its internal tiling and holding at
+    most about `max_pixels` pixels. Untiled rasters are read in strips of whole
+    rows.
+    """
+    block_height, block_width = src.block_shapes[0]
+    if block_width < src.width:
+        for _, window in src.block_windows(1):
+            yield window
+        return
+    rows = max(1, min(src.height, max_pixels // max(1, src.width)))
+    for row in range(0, src.height, rows):
+        yield Window(0, row, src.width, min(rows, src.height - row))
+
+
+def read_valid(src, window):
+    """
+    Read a window as a (pixels, bands) float64 array.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The values of the valid pixels and the
+            boolean validity mask of the window (shape rows x cols). A pixel is
+            valid when it is valid in every band.
+    """
+    data = src.read(window=window, masked=True)
+    values = np.ma.filled(data.astype("float64"), np.nan)
+    valid = np.all(np.isfinite(values), axis=0)
+    return values[:, valid].T, valid
+
+
+class StreamingStats:
+    """Per-band count, mean and variance accumulated over blocks."""
+
+    def __init__(self, n_bands):
+        self.count = 0
+        self.mean = np.zeros(n_bands)
+        self._m2 = np.zeros(n_bands)
+
+    def update(self, values):
+        """Add a (pixels, bands) block of values."""
+        n = len(values)
+        if n == 0:
+            return
+        block_mean = values.mean(axis=0)
+        block_m2 = ((values - block_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self._m2 = self._m2 + block_m2 + delta**2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self._m2 / self.count)
+
+    def scale(self, values):
+        """
+        Standardise values to zero mean and unit variance, constant bands are
+        only centred.
+        """
+        std = self.std
+        return (values - self.mean) / np.where(std > 0, std, 1.0)
+
+
+def compute_band_stats(path, max_pixels=1024 * 1024):
+    """
+    Stream a raster once and return the per-band statistics of its valid
+    pixels.
+    """
+    with rasterio.open(path) as src:
+        stats = StreamingStats(src.count)
+        for window in iter_windows(src, max_pixels):
+            values, _ = read_valid(src, window)
+            stats.update(values)
+    return stats
+
+
+def sample_pixels(
+    path,
+    n_samples,
+    valid_count,
+    seed=0,
+    max_pixels=1024 * 1024,
+):
+    """
+    Spatially stratified sample of valid pixels.
+
+    Each block contributes `n_samples * block_valid / valid_count` pixels
+    (rounded stochastically so the expected total is `n_samples`), drawn
+    without replacement.
+
+    Args:
+        path (str): Multi-band raster path.
+        n_samples (int): Target number of samples.
+        valid_count (int): Number of valid pixels in the raster, e.g.
+            `StreamingStats.count`.
+        seed (int, optional): Random seed. Defaults to 0.
+        max_pixels (int, optional): Maximum pixels per block read. Defaults to
+            1024 * 1024.
+
+    Returns:
+        np.ndarray: (samples, bands) array of raw pixel values.
+    """
+    rng = np.random.default_rng(seed)
+    fraction = min(1.0, n_samples / max(1, valid_count))
+    samples = []
+    with rasterio.open(path) as src:
+        for window in iter_windows(src, max_pixels):
+            values, _ = read_valid(src, window)
+            expected = len(values) * fraction
+            take = int(expected) + int(rng.random() < expected - int(expected))
+            if take:
+                samples.append(
+                    values[rng.choice(len(values), take, replace=False)]
+                )
+        n_bands = src.count
+    if not samples:
+        return np.empty((0, n_bands))
+    return np.concatenate(samples)
+
+
+def _nearest(X, centers):
+    """
+    Index of and squared distance to the nearest centre for every row of X.
+    """
+    distances = (
+        (X**2).sum(axis=1)[:, None]
+        - 2 * X @ centers.T
+        + (centers**2).sum(axis=1)[None, :]
+    )
+    labels = distances.argmin(axis=1)
+    return labels, np.maximum(distances[np.arange(len(X)), labels], 0)
+
+
+class MiniBatchKMeans:
+    """
+    Mini-batch K-means (Sculley, 2010) with k-means++ initialisation.
+
+    Args:
+        n_clusters (int): Number of clusters.
+        batch_size (int, optional): Samples per update. Defaults to 4096.
+        max_iter (int, optional): Maximum number of mini-batch updates.
+            Defaults to 200.
+        tol (float, optional): Stop when no centre moves more than `tol` (in
+            standardised units) over an update. Defaults to 1e-4.
+        seed (int, optional): Random seed. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        n_clusters,
+        batch_size=4096,
+        max_iter=200,
+        tol=1e-4,
+        seed=0,
+    ):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.tol = tol
+        self.seed = seed
+        self.cluster_centers_ = None
+        self.inertia_ = None
+        self.n_iter_ = 0
+
+    def _init_centers(self, X, rng):
+        centers = [X[rng.integers(len(X))]]
+        closest = ((X - centers[0]) ** 2).sum(axis=1)
+        for _ in range(1, self.n_clusters):
+            total = closest.sum()
+            if total == 0:
+                index = rng.integers(len(X))
+            else:
+                index = rng.choice(len(X), p=closest / total)
+            centers.append(X[index])
+            closest = np.minimum(closest, ((X - X[index]) ** 2).sum(axis=1))
+        return np.array(centers)
+
+    def fit(self, X):
+        if len(X) < self.n_clusters:
+            raise ValueError(
+                f"Need at least {self.n_clusters} samples to fit "
+                f"{self.n_clusters} clusters, got {len(X)}"
+            )
+        rng = np.random.default_rng(self.seed)
+        centers = self._init_centers(X, rng)
+        counts = np.zeros(self.n_clusters)
+
+        for iteration in range(1, self.max_iter + 1):
+            batch = X[
+                rng.choice(len(X), min(self.batch_size, len(X)), replace=False)
+            ]
+            labels, _ = _nearest(batch, centers)
+            previous = centers.copy()
+            for k in np.unique(labels):
+                members = batch[labels == k]
+                counts[k] += len(members)
+                # per-centre learning rate 1 / count, equivalent to a running
+                # mean of assigned samples
+                centers[k] += (
+                    members.sum(axis=0) - len(members) * centers[k]
+                ) / counts[k]
+            self.n_iter_ = iteration
+            if (
+                np.sqrt(((centers - previous) ** 2).sum(axis=1)).max()
+                <= self.tol
+            ):
+                break
+
+        self.cluster_centers_ = centers
+        _, distances = _nearest(X, centers)
+        self.inertia_ = float(distances.sum())
+        return self
+
+    def predict(self, X, chunk_size=65536):
+        """
+        Nearest centre of every row of X, computed in chunks of `chunk_size`
+        rows.
+        """
+        if self.cluster_centers_ is None:
+            raise ValueError("MiniBatchKMeans is not fitted yet")
+        labels = np.empty(len(X), dtype=np.int64)
+        for start in range(0, len(X), chunk_size):
+            labels[start : start + chunk_size], _ = _nearest(
+                X[start : start + chunk_size], self.cluster_centers_
+            )
+        return labels
+
+
+def predict_raster(
+    path,
+    output_path,
+    model,
+    stats,
+    max_pixels=1024 * 1024,
+):
+    """
+    Label every valid pixel of a raster with its nearest cluster, block by
+    block. Labels are written as a tiled uint8 GeoTIFF with `LABEL_NODATA`
+    where any input band is invalid.
+    """
+    with rasterio.open(path) as src:
+        profile = {
+            "driver": "GTiff",
+            "dtype": "uint8",
+            "count": 1,
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs,
+            "transform": src.transform,
+            "nodata": LABEL_NODATA,
+            "tiled": True,
+            "blockxsize": 512,
+            "blockysize": 512,
+            "compress": "deflate",
+        }
+        with rasterio.open(output_path, "w", **profile) as dst:
+            for window in iter_windows(src, max_pixels):
+                values, valid = read_valid(src, window)
+                labels = np.full(valid.shape, LABEL_NODATA, dtype=np.uint8)
+                if len(values):
+                    labels[valid] = model.predict(stats.scale(values))
+                dst.write(labels, 1, window=window)
+    return output_path
+
+
+def stratify_raster(
+    path,
+    output_path,
+    n_clusters=10,
+    n_samples=100_000,
+    batch_size=4096,
+    max_iter=200,
+    seed=0,
+    max_pixels=1024 * 1024,
+):
+    """
+    Stratify an aligned multi-band raster into `n_clusters` zones and write the
+    label raster.
+
+    Args:
+        path (str): Multi-band raster, one band per covariate, e.g. a harvest
+            cube.
+        output_path (str): Label GeoTIFF to write.
+        n_clusters (int, optional): Number of strata, at most 255. Defaults to
+            10.
+        n_samples (int, optional): Pixels sampled to fit the model. Defaults to
+            100_000.
+        batch_size (int, optional): Mini-batch size. Defaults to 4096.
+        max_iter (int, optional): Maximum mini-batch updates. Defaults to 200.
+        seed (int, optional): Random seed for sampling and fitting. Defaults to
+            0.
+        max_pixels (int, optional): Maximum pixels per block read, bounds the
+            memory of each pass. Defaults to 1024 * 1024.
+
+    Returns:
+        Dict[str, Any]: The output path, fitted model, band statistics and
+            number of samples used.
+    """
+    if not 1 <= n_clusters < LABEL_NODATA:
+        raise ValueError(
+            f"n_clusters must be between 1 and {LABEL_NODATA - 1}"
+        )
+
+    stats = compute_band_stats(path, max_pixels)
+    logger.info(
+        f"{stats.count} valid pixels, mean {stats.mean}, std {stats.std}"
+    )
+    sample = sample_pixels(path, n_samples, stats.count, seed, max_pixels)
+    model = MiniBatchKMeans(n_clusters, batch_size, max_iter, seed=seed).fit(
+        stats.scale(sample)
+    )
+    logger.info(
+        f"K-means fitted on {len(sample)} samples in {model.n_iter_} updates"
+    )
+    predict_raster(path, output_path, model, stats, max_pixels)
+    return {
+        "output_path": output_path,
+        "model": model,
+        "stats": stats,
+        "n_samples": len(sample),
+    }
@@ -0,0 +1,337 @@
+"""
+Terrain products derived from a DEM.
+
+The local products come from 3x3 stencils:
+- `slope` in degrees and `aspect` in compass degrees (direction of steepest
+  descent, clockwise from north, -1 on flat cells), from Horn's (1981) finite
+  differences.
+- `hillshade` (0-255) for a light source at `azimuth` and `altitude`.
+- `curvature`, the Zevenbergen & Thorne (1987) total curvature in 1/100 m,
+  positive on convex (upwardly bulging) cells.
+They are computed tile by tile, every tile read with a one pixel halo, so
+memory depends on the tile size only.
+
+`twi`, the topographic wetness index ln(a / tan(slope)), needs the upslope area
+`a` of every cell. Flow routing is not local, so it is computed on the whole
+DEM with D8 flow accumulation, without depression filling: cells without a
+lower neighbour are sinks. That takes about 100 bytes per DEM pixel, so `twi`
+is only made when it is requested and DEMs of more than `TWI_MAX_PIXELS` pixels
+are refused before they are read.
+
+Distances are in metres: projected DEMs are expected in a metric CRS, for
+geographic DEMs (e.g. SRTM in EPSG:4326) the pixel size is converted per row
+from the latitude.
+"""
+
+import logging
+import os
+import tempfile
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from rio_cogeo.cogeo import cog_translate
+from rio_cogeo.profiles import cog_profiles
+
+logger = logging.getLogger()
+
+TERRAIN_PRODUCTS = ("slope", "aspect", "hillshade", "curvature", "twi")
+LOCAL_PRODUCTS = ("slope", "aspect", "hillshade", "curvature")
+
+# metres per degree of latitude and of longitude at the equator
+METRES_PER_DEGREE_LAT = 110_574.0
+METRES_PER_DEGREE_LON = 111_320.0
+
+# largest DEM the wetness index is computed for, about 1.6 GB of working arrays
+TWI_MAX_PIXELS = 16_000_000
+
+# minimum slope (as tan) used by the wetness index, so flat cells get a finite
+# value
+MIN_TAN_SLOPE = 0.001
+
+
+def pixel_size_m(transform, crs, rows):
+    """
+    Pixel width (per row, shape (rows, 1)) and height in metres.
+    Geographic CRS are converted with the latitude of each row centre.
+    """
+    dx, dy = abs(transform.a), abs(transform.e)
+    if crs is not None and crs.is_geographic:
+        latitudes = transform.f + transform.e * (rows + 0.5)
+        widths = dx * METRES_PER_DEGREE_LON * np.cos(np.radians(latitudes))
+        return widths[:, None], dy * METRES_PER_DEGREE_LAT
+    return np.full((len(rows), 1), dx), dy
+
+
+def _neighbours(padded):
+    """
+    The nine 3x3 stencil views z1..z9 (row by row, z1 top left) of a halo
+    padded array.
+    """
+    height, width = padded.shape[0] - 2, padded.shape[1] - 2
+    return [
+        padded[i : i + height, j : j + width]
+        for i in range(3)
+        for j in range(3)
+    ]
+
+
+def terrain_tile(
+    padded,
+    dx,
+    dy,
+    products=LOCAL_PRODUCTS,
+    azimuth=315.0,
+    altitude=45.0,
+):
+    """
+    Local terrain products of a DEM tile.
+
+    Args:
+        padded (np.ndarray): float DEM tile with a one pixel halo on every
+            side, NaN as nodata.
+        dx (np.ndarray): Pixel width in metres, a scalar or one value per row
+            (shape (rows, 1)).
+        dy (float): Pixel height in metres.
+        products (Sequence[str], optional): Any of `LOCAL_PRODUCTS`. Defaults
+            to all of them.
+        azimuth (float, optional): Hillshade light azimuth in compass degrees.
+            Defaults to 315.
+        altitude (float, optional): Hillshade light altitude in degrees.
+            Defaults to 45.
+
+    Returns:
+        Dict[str, np.ndarray]: One float32 array per product, without the halo.
+            Cells next to nodata are NaN.
+    """
+    z1, z2, z3, z4, z5, z6, z7, z8, z9 = _neighbours(padded)
+    # Horn: dz/dx positive uphill to the east, dz/dy positive uphill to the
+    # south
+    dzdx = ((z3 + 2 * z6 + z9) - (z1 + 2 * z4 + z7)) / (8 * dx)
+    dzdy = ((z7 + 2 * z8 + z9) - (z1 + 2 * z2 + z3)) / (8 * dy)
+    slope = np.arctan(np.hypot(dzdx, dzdy))
+    math_aspect = np.arctan2(dzdy, -dzdx)
+
+    results = {}
+    if "slope" in products:
+        results["slope"] = np.degrees(slope)
+    if "aspect" in products:
+        aspect = np.mod(90.0 - np.degrees(math_aspect), 360.0)
+        aspect[(dzdx == 0) & (dzdy == 0)] = -1.0
+        results["aspect"] = aspect
+    if "hillshade" in products:
+        zenith = np.radians(90.0 - altitude)
+        light = np.radians(np.mod(450.0 - azimuth, 360.0))
+        shade = np.cos(zenith) * np.cos(slope) + np.sin(zenith) * np.sin(
+            slope
+        ) * np.cos(light - math_aspect)
+        results["hillshade"] = 255.0 * np.clip(shade, 0, 1)
+    if "curvature" in products:
+        d = ((z4 + z6) / 2 - z5) / dx**2
+        e = ((z2 + z8) / 2 - z5) / dy**2
+        results["curvature"] = -2 * (d + e) * 100
+    return {name: value.astype("float32") for name, value in results.items()}
+
+
+def _read_padded(src, window, band=1):
+    """
+    Read a window with a one pixel halo, edge cells repeated at the raster
+    border, nodata as NaN.
+    """
+    row0, col0 = max(0, window.row_off - 1), max(0, window.col_off - 1)
+    row1 = min(src.height, window.row_off + window.height + 1)
+    col1 = min(src.width, window.col_off + window.width + 1)
+    data = src.read(
+        band, window=Window(col0, row0, col1 - col0, row1 - row0), masked=True
+    )
+    values = np.ma.filled(data.astype("float64"), np.nan)
+    # halo rows and columns missing beyond the raster border
+    top, left = 1 - (window.row_off - row0), 1 - (window.col_off - col0)
+    bottom = window.row_off + window.height + 1 - row1
+    right = window.col_off + window.width + 1 - col1
+    return np.pad(values, ((top, bottom), (left, right)), mode="edge")
+
+
+def flow_accumulation(dem, dx, dy):
+    """
+    D8 flow accumulation: the number of cells draining through every cell,
+    itself included.
+
+    Every cell drains to its steepest lower neighbour. Cells are processed in
+    topological order, all cells whose donors are done being added to their
+    receivers at once, so the loop runs once per cell of the longest flow path
+    rather than once per cell. Nodata (NaN) cells are 0.
+    """
+    height, width = dem.shape
+    dx = np.broadcast_to(dx, (height, 1))
+    padded = np.pad(dem, 1, constant_values=np.nan)
+    index = np.arange(height * width).reshape(height, width)
+    receiver = index.copy()
+    steepest = np.zeros(dem.shape)
+    with np.errstate(invalid="ignore"):
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                if di == 0 and dj == 0:
+                    continue
+                neighbour = padded[
+                    1 + di : 1 + di + height, 1 + dj : 1 + dj + width
+                ]
+                drop = (dem - neighbour) / np.hypot(dj * dx, di * dy)
+                steeper = drop > steepest
+                steepest = np.where(steeper, drop, steepest)
+                receiver = np.where(steeper, index + di * width + dj, receiver)
+
+    receiver = receiver.ravel()
+    valid = np.isfinite(dem).ravel()
+    accumulation = valid.astype(np.float64)
+    drains = receiver != index.ravel()
+    donors = np.bincount(receiver[drains], minlength=height * width)
+    current = np.flatnonzero((donors == 0) & drains)
+    while len(current):
+        targets = receiver[current]
+        np.add.at(accumulation, targets, accumulation[current])
+        np.subtract.at(donors, targets, 1)
+        ready = np.unique(targets[donors[targets] == 0])
+        current = ready[drains[ready]]
+    return accumulation.reshape(height, width)
+
+
+def topographic_wetness_index(dem, dx, dy):
+    """
+    ln(a / tan(slope)) with `a` the D8 upslope area per unit contour width, in
+    metres.
+    """
+    accumulation = flow_accumulation(dem, dx, dy)
+    padded = np.pad(dem, 1, mode="edge")
+    slope = np.radians(terrain_tile(padded, dx, dy, ("slope",))["slope"])
+    cell_width = np.sqrt(dx * dy)
+    specific_area = accumulation * cell_width
+    with np.errstate(divide="ignore", invalid="ignore"):
+        twi = np.log(specific_area / np.maximum(np.tan(slope), MIN_TAN_SLOPE))
+    twi[~np.isfinite(dem)] = np.nan
+    return twi.astype("float32")
+
+
+def terrain_products(
+    dem_path,
+    output_path,
+    products=LOCAL_PRODUCTS,
+    tile_size=1024,
+    azimuth=315.0,
+    altitude=45.0,
+    cog=True,
+    twi_max_pixels=TWI_MAX_PIXELS,
+):
+    """
+    Write terrain products of a DEM as the bands of one float32 raster on the
+    DEM grid.
+
+    Args:
+        dem_path (str): DEM raster, e.g. written by
+            `gis_utils.stac.process_dem_asset_and_mask`.
+        output_path (str): Output raster, one band per product named after it,
+            NaN as nodata.
+        products (Sequence[str], optional): Any of `TERRAIN_PRODUCTS`, in band
+            order. Defaults to the tiled `LOCAL_PRODUCTS`, "twi" reads the
+            whole DEM and has to be requested.
+        tile_size (int, optional): Tile size of the local products. Defaults to
+            1024.
+        azimuth (float, optional): Hillshade light azimuth in compass degrees.
+            Defaults to 315.
+        altitude (float, optional): Hillshade light altitude in degrees.
+            Defaults to 45.
+        cog (bool, optional): Write a COG (with overviews) instead of a tiled
+            GeoTIFF. Defaults to True.
+        twi_max_pixels (int, optional): Largest DEM, in pixels, "twi" is
+            computed for. Defaults to `TWI_MAX_PIXELS`.
+
+    Returns:
+        str: The output path.
+    """
+    unknown = set(products) - set(TERRAIN_PRODUCTS)
+    if unknown:
+        raise ValueError(
+            f"Unknown terrain products {sorted(unknown)}, "
+            f"use {TERRAIN_PRODUCTS}"
+        )
+    local = [name for name in products if name in LOCAL_PRODUCTS]
+
+    with (
+        rasterio.open(dem_path) as src,
+        tempfile.TemporaryDirectory() as tmpdir,
+    ):
+        if "twi" in products and src.width * src.height > twi_max_pixels:
+            raise ValueError(
+                "The wetness index reads the whole DEM, "
+                f"{src.width}x{src.height} pixels is more than "
+                f"twi_max_pixels={twi_max_pixels}"
+            )
+        profile = {
+            "driver": "GTiff",
+            "dtype": "float32",
+            "count": len(products),
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs,
+            "transform": src.transform,
+            "nodata": np.nan,
+            "tiled": True,
+            "blockxsize": 512,
+            "blockysize": 512,
+            "compress": "deflate",
+        }
+        tiles_path = (
+            os.path.join(tmpdir, "terrain.tiff") if cog else output_path
+        )
+        with rasterio.open(tiles_path, "w", **profile) as dst:
+            dst.descriptions = tuple(products)
+            for row in range(0, src.height, tile_size):
+                for col in range(0, src.width, tile_size):
+                    window = Window(
+                        col,
+                        row,
+                        min(tile_size, src.width - col),
+                        min(tile_size, src.height - row),
+                    )
+                    dx, dy = pixel_size_m(
+                        src.transform,
+                        src.crs,
+                        np.arange(row, row + window.height),
+                    )
+                    tiles = terrain_tile(
+                        _read_padded(src, window),
+                        dx,
+                        dy,
+                        local,
+                        azimuth,
+                        altitude,
+                    )
+                    for name, tile in tiles.items():
+                        dst.write(
+                            tile, products.index(name) + 1, window=window
+                        )
+
+            if "twi" in products:
+                dem = np.ma.filled(
+                    src.read(1, masked=True).astype("float64"), np.nan
+                )
+                dx, dy = pixel_size_m(
+                    src.transform, src.crs, np.arange(src.height)
+                )
+                dst.write(
+                    topographic_wetness_index(dem, dx, dy),
+                    products.index("twi") + 1,
+                )
+
+        if cog:
+            with rasterio.open(tiles_path) as dataset:
+                cog_translate(
+                    dataset,
+                    output_path,
+                    cog_profiles.get("deflate"),
+                    in_memory=False,
+                    nodata=np.nan,
+                    quiet=True,
+                )
+    logger.info(f"Terrain products {list(products)} written to {output_path}")
+    return output_path
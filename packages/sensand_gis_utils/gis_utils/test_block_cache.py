@@ -0,0 +1,143 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+import pytest
+
+from gis_utils import block_cache
+from gis_utils.block_cache import (
+    BlockCache,
+    CachedRangeFile,
+    default_block_cache,
+    open_raster,
+)
+
+
+class FileSession:
+    """Serves HEAD and range GET requests from a local file and counts them."""
+
+    def __init__(self, path, etag='"v1"'):
+        self.path = path
+        self.etag = etag
+        self.calls = []
+
+    def _response(self, status_code, content, headers):
+        headers = {"ETag": self.etag, **headers}
+        return SimpleNamespace(
+            status_code=status_code, content=content, headers=headers, raise_for_status=lambda: None
+        )
+
+    def head(self, url, **kwargs):
+        self.calls.append("HEAD")
+        return self._response(200, b"", {"Content-Length": str(os.path.getsize(self.path))})
+
+    def get(self, url, headers, **kwargs):
+        self.calls.append(headers["Range"])
+        start, end = (int(value) for value in headers["Range"].split("=")[1].split("-"))
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return self._response(206, f.read(end - start + 1), {})
+
+
+def test_cached_reads_match_and_reuse_blocks(tmp_path, write_raster):
+    path = write_raster(
+        tmp_path / "dem.tif",
+        np.random.default_rng(0).normal(0, 1, (500, 600)),
+        crs="EPSG:4326",
+        transform=from_origin(116.0, -29.0, 0.001, 0.001),
+        nodata=None,
+        blocksize=128,
+    )
+    cache = BlockCache(str(tmp_path / "cache"), block_size=64 * 1024)
+    window = Window(100, 150, 300, 200)
+    with rasterio.open(path) as src:
+        expected = src.read(1, window=window)
+
+    session = FileSession(path)
+    with rasterio.open(CachedRangeFile("https://example.com/dem.tif", cache, session)) as src:
+        np.testing.assert_array_equal(src.read(1, window=window), expected)
+    assert session.calls[0] == "HEAD" and len(session.calls) > 1
+
+    # a second open in the same or another process is served from the cache, without even a HEAD
+    session = FileSession(path)
+    with rasterio.open(CachedRangeFile("https://example.com/dem.tif", cache, session)) as src:
+        np.testing.assert_array_equal(src.read(1, window=window), expected)
+    assert session.calls == []
+
+    # a new ETag is a different object, its blocks are fetched again
+    cache.metadata_ttl = 0
+    session = FileSession(path, etag='"v2"')
+    with rasterio.open(CachedRangeFile("https://example.com/dem.tif", cache, session)) as src:
+        np.testing.assert_array_equal(src.read(1, window=window), expected)
+    assert len(session.calls) > 1
+
+
+def test_eviction_is_least_recently_used(tmp_path):
+    cache = BlockCache(str(tmp_path / "cache"), max_bytes=10 * 1000, block_size=1000)
+    for index in range(10):
+        cache.put("url", "v1", index * 1000, (index + 1) * 1000, bytes(1000))
+        os.utime(cache._block_path("url", "v1", index * 1000, (index + 1) * 1000), (index, index))
+    # reading the oldest block makes it the most recently used
+    assert cache.get("url", "v1", 0, 1000) == bytes(1000)
+    cache.put("url", "v1", 10000, 11000, bytes(1000))
+    cache.evict()
+    assert cache.size == 10 * 1000
+    assert cache.get("url", "v1", 0, 1000) is not None
+    assert cache.get("url", "v1", 1000, 2000) is None
+
+
+def test_default_cache_needs_a_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv("GIS_UTILS_BLOCK_CACHE_DIR", raising=False)
+    assert default_block_cache() is None
+
+    monkeypatch.setenv("GIS_UTILS_BLOCK_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("GIS_UTILS_BLOCK_CACHE_MB", "1")
+    cache = default_block_cache()
+    assert cache.directory == str(tmp_path / "cache") and cache.max_bytes == 1024 * 1024
+
+    # the cap never exceeds half of the free space of the volume
+    monkeypatch.setenv("GIS_UTILS_BLOCK_CACHE_MB", str(10**12))
+    usage = shutil.disk_usage(str(tmp_path))
+    assert default_block_cache().max_bytes <= usage.free // 2 + 1024 * 1024
+
+
+def test_open_raster_closes_the_cached_file(tmp_path, write_raster, monkeypatch):
+    path = write_raster(
+        tmp_path / "dem.tif",
+        np.arange(100 * 120, dtype="float32").reshape(100, 120),
+        crs="EPSG:4326",
+        transform=from_origin(116.0, -29.0, 0.001, 0.001),
+    )
+    opened = []
+
+    class RecordedRangeFile(CachedRangeFile):
+        def __init__(self, url, cache, session=None):
+            super().__init__(url, cache, FileSession(path))
+            opened.append(self)
+
+    monkeypatch.setattr(block_cache, "CachedRangeFile", RecordedRangeFile)
+    cache = BlockCache(str(tmp_path / "cache"))
+
+    with open_raster("https://example.com/dem.tif", cache) as src:
+        assert src.read(1)[99, 119] == 100 * 120 - 1
+        assert not opened[0].closed
+    # with every handle GDAL opened through the file system
+    assert src.closed and all(f.closed for f in opened)
+
+    # also when reading fails
+    count = len(opened)
+    with pytest.raises(RuntimeError):
+        with open_raster("https://example.com/dem.tif", cache):
+            raise RuntimeError("read failed")
+    assert len(opened) > count and all(f.closed for f in opened)
+
+    # local paths are opened by GDAL directly
+    count = len(opened)
+    with open_raster(path, cache) as src:
+        assert src.name == path
+    assert len(opened) == count
@@ -0,0 +1,115 @@
+import numpy as np
+import rasterio
+from matplotlib import cm
+from matplotlib.colors import Normalize
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rio_cogeo.cogeo import cog_validate
+
+from gis_utils.colourise import (
+    PALETTE_NODATA,
+    colourise,
+    colourise_raster,
+    colourise_to_cog,
+)
+
+
+def matplotlib_colours(data, colour_map):
+    """The colouring the engine replaces."""
+    values = data.astype("float32")
+    norm = Normalize(vmin=np.nanmin(values), vmax=np.nanmax(values))
+    return (cm.get_cmap(colour_map)(norm(values))[:, :, :3] * 255).astype(np.uint8)
+
+
+def test_colourise_matches_matplotlib():
+    rng = np.random.default_rng(0)
+    data = rng.normal(300, 50, (300, 200)).astype("float32")
+    data[:10, :10] = np.nan
+    for colour_map in ("viridis", "gist_earth", "tab20"):
+        expected = np.moveaxis(matplotlib_colours(data, colour_map), -1, 0)
+        np.testing.assert_array_equal(colourise(data, colour_map, block_rows=64), expected)
+
+
+def test_colourise_alpha_and_masked_input():
+    data = np.ma.masked_array(np.arange(12, dtype="float32").reshape(3, 4))
+    data[0, 0] = np.ma.masked
+    rgba = colourise(data, "viridis", alpha=True)
+    assert rgba.shape == (4, 3, 4)
+    assert rgba[3, 0, 0] == 0 and (rgba[:3, 0, 0] == 0).all()
+    assert (rgba[3].ravel()[1:] == 255).all()
+
+
+def test_colourise_raster_palette(tmp_path):
+    data = np.linspace(0, 100, 64 * 64, dtype="float32").reshape(1, 64, 64)
+    data[0, 0, :5] = -9999
+    input_path = str(tmp_path / "dem.tiff")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": 64,
+        "height": 64,
+        "crs": "EPSG:3857",
+        "transform": from_origin(0, 0, 30, 30),
+        "nodata": -9999,
+        "tiled": True,
+        "blockxsize": 16,
+        "blockysize": 16,
+    }
+    with rasterio.open(input_path, "w", **profile) as dst:
+        dst.write(data)
+
+    rgb_path = colourise_raster(input_path, str(tmp_path / "rgb.tiff"), "viridis")
+    palette_path = colourise_raster(
+        input_path, str(tmp_path / "palette.tiff"), "viridis", palette=True
+    )
+    with rasterio.open(rgb_path) as src:
+        rgb = src.read()
+    valid = np.ma.masked_equal(data[0], -9999)
+    np.testing.assert_array_equal(rgb, colourise(valid, "viridis"))
+    with rasterio.open(palette_path) as src:
+        indices = src.read(1)
+        assert src.count == 1 and src.nodata == PALETTE_NODATA
+        assert (indices[0, :5] == PALETTE_NODATA).all()
+        assert indices.max() == PALETTE_NODATA and indices[-1, -1] == PALETTE_NODATA - 1
+
+
+def test_colourise_to_cog_warps_in_one_pass(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.normal(300, 50, (1, 700, 900)).astype("float32")
+    data[0, :50, :50] = -9999
+    input_path = str(tmp_path / "dem.tiff")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": 900,
+        "height": 700,
+        "crs": "EPSG:3857",
+        "transform": from_origin(16_000_000, -4_000_000, 30, 30),
+        "nodata": -9999,
+    }
+    with rasterio.open(input_path, "w", **profile) as dst:
+        dst.write(data)
+
+    output_path = str(tmp_path / "dem_cog.public.tiff")
+    colourise_to_cog(
+        input_path, output_path, "viridis", resampling=Resampling.nearest
+    )
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dem.tiff", "dem_cog.public.tiff"]
+    assert cog_validate(output_path)[0]
+
+    with rasterio.open(input_path) as src, WarpedVRT(
+        src, crs="EPSG:4326", resampling=Resampling.nearest
+    ) as vrt:
+        valid = data[data != -9999]
+        expected = colourise(
+            vrt.read(1, masked=True), "viridis", float(valid.min()), float(valid.max())
+        )
+        bounds = vrt.bounds
+    with rasterio.open(output_path) as src:
+        assert src.crs.to_epsg() == 4326 and src.count == 3
+        assert src.overviews(1)
+        np.testing.assert_allclose(tuple(src.bounds), tuple(bounds))
+        np.testing.assert_array_equal(src.read(), expected)
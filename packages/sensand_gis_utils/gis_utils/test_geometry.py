@@ -0,0 +1,48 @@
+import geopandas as gpd
+import numpy as np
+from rasterio.features import geometry_mask
+from rasterio.transform import from_origin
+from shapely.geometry import Point, box, mapping
+
+from gis_utils.dataframe import get_bbox_from_geodf
+from gis_utils.geometry import AreaOfInterest
+
+GEOJSON = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "properties": {"name": "north"}, "geometry": mapping(box(116.1, -29.2, 116.3, -29.1))},
+        {"type": "Feature", "properties": {"name": "south"}, "geometry": mapping(box(116.2, -29.4, 116.4, -29.2))},
+    ],
+}
+
+
+def test_from_geojson_matches_geodataframe():
+    aoi = AreaOfInterest.from_geojson(GEOJSON)
+    gdf = gpd.GeoDataFrame.from_features(GEOJSON["features"], crs="EPSG:4326")
+    np.testing.assert_allclose(aoi.bbox, gdf.total_bounds)
+    assert get_bbox_from_geodf(GEOJSON) == aoi.bbox
+    assert aoi.geometry.equals(gdf.unary_union)
+
+    # every feature is masked, not only the first
+    mask = geometry_mask(aoi.mapping, (300, 300), from_origin(116.1, -29.1, 0.001, 0.001))
+    assert not mask[50, 50] and not mask[200, 250] and mask[250, 50]
+    assert aoi.prepared.contains(Point(116.35, -29.3)) and not aoi.prepared.contains(Point(116.15, -29.3))
+
+
+def test_to_crs_is_cached_and_matches_geopandas():
+    aoi = AreaOfInterest.from_geojson(GEOJSON)
+    projected = aoi.to_crs("EPSG:3577")
+    expected = gpd.GeoDataFrame.from_features(GEOJSON["features"], crs="EPSG:4326").to_crs("EPSG:3577")
+    np.testing.assert_allclose(projected.bounds, expected.total_bounds)
+    assert projected.crs.to_epsg() == 3577 and aoi.to_crs(aoi.crs) is aoi
+
+    # the same boundary parsed again shares the reprojected copy
+    assert AreaOfInterest.from_geojson(GEOJSON).to_crs("EPSG:3577") is projected
+    assert AreaOfInterest.from_geodataframe(projected.to_geodataframe()).digest == projected.digest
+
+
+def test_from_geojson_null_crs():
+    aoi = AreaOfInterest.from_geojson({**GEOJSON, "crs": None})
+    assert aoi.crs.to_epsg() == 4326
+    aoi = AreaOfInterest.from_geojson({**GEOJSON, "crs": {"type": "name", "properties": None}})
+    assert aoi.crs.to_epsg() == 4326
@@ -0,0 +1,38 @@
+import os
+
+import rasterio
+
+from gis_utils.io_profile import (
+    REMOTE_IO_PROFILE,
+    SCOPED_OPTIONS,
+    apply_io_profile,
+    io_profile,
+    remote_io,
+)
+
+
+def test_io_profile_overrides():
+    options = io_profile(GDAL_HTTP_MULTIPLEX="NO", VSI_CACHE=None)
+    assert options["GDAL_HTTP_MULTIPLEX"] == "NO"
+    assert "VSI_CACHE" not in options
+    assert REMOTE_IO_PROFILE["GDAL_HTTP_MULTIPLEX"] == "YES"
+
+
+def test_remote_io_sets_gdal_options():
+    with remote_io(GDAL_HTTP_MAX_RETRY=5):
+        options = rasterio.env.getenv()
+    assert options["GDAL_DISABLE_READDIR_ON_OPEN"] == "EMPTY_DIR"
+    assert options["GDAL_HTTP_MAX_RETRY"] == 5
+
+
+def test_apply_io_profile(monkeypatch):
+    # set then delete, so monkeypatch restores the original environment afterwards
+    for key in REMOTE_IO_PROFILE:
+        monkeypatch.setenv(key, "")
+        monkeypatch.delenv(key)
+    applied = apply_io_profile(GDAL_CACHEMAX=None)
+    assert "GDAL_CACHEMAX" not in applied and "GDAL_CACHEMAX" not in os.environ
+    assert os.environ["VSI_CACHE_SIZE"] == str(64 * 1024 * 1024)
+    # other remote reads of the process are not limited to .tif files or HTTP/2
+    assert not set(SCOPED_OPTIONS) & set(applied) and not set(SCOPED_OPTIONS) & set(os.environ)
+    assert apply_io_profile(GDAL_HTTP_VERSION="2")["GDAL_HTTP_VERSION"] == "2"
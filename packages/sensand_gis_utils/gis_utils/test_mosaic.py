@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from rasterio.transform import from_origin
+from shapely.geometry import box, mapping
+
+from gis_utils.mosaic import read_mosaic, select_assets
+
+# 400x300 DEM at 0.001 degrees from (116.0, -29.0), split into two overlapping tiles
+DEM = np.add.outer(np.arange(300), np.arange(400)).astype("float32")
+
+
+@pytest.fixture
+def write_tile(write_raster):
+    """Writes the DEM columns col_off:col_off + width as one tile."""
+
+    def write(path, col_off, width, overviews=False):
+        return write_raster(
+            path,
+            DEM[:, col_off : col_off + width],
+            crs="EPSG:4326",
+            transform=from_origin(116.0 + col_off * 0.001, -29.0, 0.001, 0.001),
+            overviews=[2, 4] if overviews else None,
+        )
+
+    return write
+
+
+def item(item_id, path, bounds):
+    return {"id": item_id, "bbox": list(bounds), "geometry": mapping(box(*bounds)), "assets": {"dem": {"href": path}}}
+
+
+def test_mosaic_across_items(tmp_path, write_tile):
+    west = write_tile(str(tmp_path / "west.tif"), 0, 220)
+    east = write_tile(str(tmp_path / "east.tif"), 180, 220)
+    items = [
+        item("west", west, (116.0, -29.3, 116.22, -29.0)),
+        item("east", east, (116.18, -29.3, 116.4, -29.0)),
+        # never opened, it does not intersect the area
+        item("far", str(tmp_path / "missing.tif"), (120.0, -30.0, 121.0, -29.0)),
+    ]
+    geometry = [mapping(box(116.1005, -29.2, 116.3, -29.05))]
+
+    hrefs = select_assets(items, geometry, "dem")
+    assert hrefs == [west, east]
+    data, profile = read_mosaic(hrefs, geometry)
+
+    # the whole area is covered and matches the source DEM pixel for pixel
+    assert data.shape == (150, 200) and profile["transform"] == from_origin(116.1, -29.05, 0.001, 0.001)
+    assert not data.mask.any()
+    np.testing.assert_array_equal(data.data, DEM[50:200, 100:300])
+
+    # a single item leaves the eastern part masked
+    west_only, _ = read_mosaic([west], geometry)
+    assert west_only.mask[:, 120:].all() and not west_only.mask[:, :120].any()
+
+
+def test_mosaic_pixel_budget(tmp_path, write_tile):
+    west = write_tile(str(tmp_path / "west.tif"), 0, 220, overviews=True)
+    east = write_tile(str(tmp_path / "east.tif"), 180, 220, overviews=True)
+    geometry = [mapping(box(116.1, -29.2, 116.3, -29.05))]
+    full, full_profile = read_mosaic([west, east], geometry)
+    data, profile = read_mosaic([west, east], geometry, max_pixels=50 * 40)
+
+    assert data.shape == (39, 52) and not data.mask.any()
+    np.testing.assert_allclose(profile["transform"].c, full_profile["transform"].c)
+    np.testing.assert_allclose(data.mean(), full.mean(), rtol=1e-2)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import array_bounds, from_origin
+from rasterio.windows import Window
+from shapely.geometry import box, mapping
+
+from gis_utils.overviews import decimation_factor, overview_level, read_window
+from gis_utils.stac import process_dem_asset_and_mask
+
+
+@pytest.fixture
+def dem(tmp_path, write_raster):
+    """512x512 DEM at 0.001 degrees from (116.0, -29.0) with 2x, 4x and 8x overviews."""
+    rows, cols = np.mgrid[0:512, 0:512]
+    return write_raster(
+        tmp_path / "dem.tiff",
+        rows + cols,
+        crs="EPSG:4326",
+        transform=from_origin(116.0, -29.0, 0.001, 0.001),
+        blocksize=128,
+        overviews=[2, 4, 8],
+    )
+
+
+def test_decimation_factor():
+    assert decimation_factor(1000, 1000, (10, 10)) == 1
+    assert decimation_factor(1000, 1000, (10, 10), resolution=5) == 1
+    assert decimation_factor(1000, 1000, (10, 10), resolution=40) == 4
+    assert decimation_factor(1000, 1000, (10, 10), max_pixels=10_000) == 10
+    assert decimation_factor(1000, 1000, (10, 10), resolution=40, max_pixels=10_000) == 10
+
+
+def test_read_window_uses_overview(dem):
+    window = Window(64, 32, 256, 256)
+    with rasterio.open(dem) as src:
+        assert overview_level(src, 4.5) == 1
+        full, full_transform = read_window(src, window)
+        data, transform = read_window(src, window, max_pixels=64 * 64)
+    # served from the 4x overview, the same window at a quarter of the size
+    with rasterio.open(dem, overview_level=1) as overview:
+        expected = overview.read(1, window=Window(16, 8, 64, 64))
+
+    assert full.shape == (256, 256) and data.shape == (64, 64)
+    np.testing.assert_array_equal(data, expected)
+    np.testing.assert_allclose(array_bounds(64, 64, transform), array_bounds(256, 256, full_transform))
+    np.testing.assert_allclose(data.mean(), full.mean(), rtol=1e-3)
+
+
+def test_process_dem_asset_with_pixel_budget(tmp_path, dem):
+    geometry = [mapping(box(116.1, -29.4, 116.4, -29.1))]
+    asset = SimpleNamespace(href=dem)
+
+    full, full_meta, _ = process_dem_asset_and_mask(asset, geometry, None, str(tmp_path / "full.tiff"))
+    data, meta, _ = process_dem_asset_and_mask(
+        asset, geometry, None, str(tmp_path / "coarse.tiff"), max_pixels=100 * 100
+    )
+    assert data.shape[1] * data.shape[2] <= 100 * 100 < full.shape[1] * full.shape[2]
+    np.testing.assert_allclose(
+        array_bounds(meta["height"], meta["width"], meta["transform"]),
+        array_bounds(full_meta["height"], full_meta["width"], full_meta["transform"]),
+    )
+    np.testing.assert_allclose(np.nanmean(data), np.nanmean(full), rtol=1e-2)
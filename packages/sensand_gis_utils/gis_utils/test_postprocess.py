@@ -0,0 +1,74 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gis_utils.postprocess import majority_filter, postprocess_labels, sieve_labels
+
+
+def test_majority_filter_tiles_match_whole_image():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 4, (97, 131)).astype(np.uint8)
+    labels[:10, :10] = 255
+    whole = majority_filter(labels, radius=2, nodata=255, tile_size=1000)
+    tiled = majority_filter(labels, radius=2, nodata=255, tile_size=16)
+    np.testing.assert_array_equal(whole, tiled)
+    assert (whole[:10, :10] == 255).all()
+
+
+def test_majority_filter_removes_speckle():
+    labels = np.zeros((20, 20), dtype=np.uint8)
+    labels[5, 5] = 1
+    labels[10:, :] = 2
+    filtered = majority_filter(labels, radius=1)
+    assert filtered[5, 5] == 0
+    np.testing.assert_array_equal(filtered[10:], labels[10:])
+
+
+def test_sieve_keeps_nodata():
+    labels = np.zeros((30, 30), dtype=np.uint8)
+    labels[:, 15:] = 1
+    labels[3:5, 3:5] = 1
+    labels[25:, :5] = 255
+    sieved = sieve_labels(labels, min_pixels=10, nodata=255)
+    assert (sieved[3:5, 3:5] == 0).all()
+    assert (sieved[25:, :5] == 255).all()
+    assert (sieved[:, 15:] == 1).all()
+
+
+def test_postprocess_labels(tmp_path):
+    labels = np.zeros((64, 64), dtype=np.uint8)
+    labels[:, 32:] = 1
+    labels[10, 10] = 1
+    labels[40:43, 5:8] = 2
+    labels[:4, :4] = 255
+    input_path = str(tmp_path / "labels.tiff")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "uint8",
+        "count": 1,
+        "width": 64,
+        "height": 64,
+        "crs": "EPSG:3857",
+        "transform": from_origin(0, 0, 10, 10),
+        "nodata": 255,
+    }
+    with rasterio.open(input_path, "w", **profile) as dst:
+        dst.write(labels, 1)
+
+    output_path = str(tmp_path / "strata.fgb")
+    result = postprocess_labels(
+        input_path, output_path, radius=1, min_area=2000, simplify_tolerance=10
+    )
+
+    polygons = gpd.read_file(output_path)
+    assert sorted(polygons["value"]) == [0, 1]
+    assert set(result["timings"]) >= {"majority_filter", "sieve", "polygonise"}
+    # coverage simplification keeps the strata edge-matched
+    union = polygons.geometry.unary_union
+    assert abs(union.area - (64 * 64 - 16) * 100) < 1e-6
+
+    # the sieve and polygonize need the whole raster in memory
+    with pytest.raises(ValueError, match="max_pixels=4000"):
+        postprocess_labels(input_path, output_path, max_pixels=4000)
@@ -0,0 +1,129 @@
+import json
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+from rio_cogeo.cogeo import cog_translate, cog_validate
+from rio_cogeo.profiles import cog_profiles
+from shapely.geometry import box
+
+from gis_utils.slga import depth_cog_source, process_slga_cog, process_slga_layers
+
+# 400x400 layer at 0.001 degrees from (116.0, -29.0), with a nodata block at rows 50:55, cols 80:85
+VALUES = np.add.outer(np.arange(400), np.arange(400) * 2).astype("float32")
+VALUES[50:55, 80:85] = -9999.0
+
+
+def pixel_area(row0, row1, col0, col1):
+    """Area covering rows row0:row1 and columns col0:col1, inset by half a pixel so all_touched keeps exactly them."""
+    return gpd.GeoDataFrame(
+        geometry=[
+            box(
+                116.0 + (col0 + 0.5) * 0.001,
+                -29.0 - (row1 - 0.5) * 0.001,
+                116.0 + (col1 - 0.5) * 0.001,
+                -29.0 - (row0 + 0.5) * 0.001,
+            )
+        ],
+        crs="EPSG:4326",
+    )
+
+
+def test_depth_cog_source():
+    # the depth code is swapped and the version and date suffix shared by the depths of a release kept
+    base = "https://esoil.io/TERNLandscapes/Public/Products/TERN/SLGA"
+    clay = f"{base}/CLY/CLY_000_005_EV_N_P_AU_TRN_N_20210902.tif"
+    assert depth_cog_source(clay, "0-5cm") == clay
+    assert depth_cog_source(clay, "30-60cm") == f"{base}/CLY/CLY_030_060_EV_N_P_AU_TRN_N_20210902.tif"
+    soc = f"{base}/30m/SOC/SOC_000_005_EV_N_P_AU_TRN_N_20220727_30m.tif"
+    assert depth_cog_source(soc, "100-200cm") == f"{base}/30m/SOC/SOC_100_200_EV_N_P_AU_TRN_N_20220727_30m.tif"
+    # depth of regolith has no standard depth code and is the same at every depth
+    regolith = f"{base}/DES/DES_000_200_EV_N_P_AU_TRN_C_20190901.tif"
+    assert depth_cog_source(regolith, "5-15cm") == regolith
+    with pytest.raises(ValueError, match="Unknown SLGA depth"):
+        depth_cog_source(clay, "0-30cm")
+
+
+@pytest.fixture
+def slga_cog(tmp_path, write_raster):
+    """The layer as a local deflate COG with overviews, like the SLGA COGs."""
+    path = write_raster(
+        tmp_path / "source.tif",
+        VALUES,
+        crs="EPSG:4326",
+        transform=from_origin(116.0, -29.0, 0.001, 0.001),
+    )
+    cog = str(tmp_path / "CLY_000_005_EV_N_P_AU_TRN_N_20210902.tif")
+    with rasterio.open(path) as src:
+        cog_translate(src, cog, cog_profiles.get("deflate"), overview_level=3, quiet=True)
+    return cog
+
+
+def test_process_slga_cog(tmp_path, slga_cog):
+    area = pixel_area(50, 100, 80, 150)
+    output = str(tmp_path / "out" / "clay_cog.public.tiff")
+    masked_tiff = str(tmp_path / "out" / "clay_masked.tiff")
+    result = process_slga_cog(slga_cog, area, output, masked_tiff_filename=masked_tiff)
+
+    expected = np.ma.masked_equal(VALUES[50:100, 80:150], -9999.0)
+    assert result["data"].shape == (1, 50, 70)
+    assert result["data"].count() == 50 * 70 - 25
+    np.testing.assert_array_equal(result["data"][0].filled(np.nan), expected.filled(np.nan))
+    assert result["raster_stats"] == pytest.approx(
+        {"min": expected.min(), "max": expected.max(), "mean": expected.mean(), "std_dev": expected.std()}
+    )
+
+    with rasterio.open(masked_tiff) as src:
+        assert src.transform == from_origin(116.08, -29.05, 0.001, 0.001)
+        np.testing.assert_array_equal(src.read(1), expected.filled(np.nan))
+
+    assert result["cog"] == output
+    assert cog_validate(output)[0]
+    with rasterio.open(output) as src:
+        assert src.crs.to_epsg() == 4326 and src.count == 3 and src.dtypes[0] == "uint8"
+        rgb = src.read()
+    # nodata inside the area is black, the rest of the area is coloured
+    assert (rgb[:, :5, :5] == 0).all()
+    assert (rgb.max(axis=0)[5:, 5:] > 0).all()
+
+
+def test_process_slga_cog_upscale_and_pixel_budget(tmp_path, slga_cog):
+    area = pixel_area(100, 300, 100, 300)
+    upscaled = process_slga_cog(slga_cog, area, str(tmp_path / "upscaled.tiff"), upscale_factor=2)
+    assert upscaled["data"].shape == (1, 400, 400)
+    assert upscaled["profile"]["transform"].a == pytest.approx(0.0005)
+
+    # a 4x smaller budget is read from the 2x overview
+    budget = process_slga_cog(slga_cog, area, str(tmp_path / "budget.tiff"), max_pixels=100 * 100)
+    assert budget["data"].shape == (1, 100, 100)
+    assert budget["raster_stats"]["mean"] == pytest.approx(VALUES[100:300, 100:300].mean(), rel=1e-2)
+
+
+def test_process_slga_cog_without_valid_pixels(tmp_path, slga_cog):
+    with pytest.raises(ValueError, match="No valid SLGA pixels"):
+        process_slga_cog(slga_cog, pixel_area(50, 55, 80, 85), str(tmp_path / "empty.tiff"))
+
+
+def test_process_slga_layers(tmp_path, slga_cog):
+    layers = [
+        {"name": "clay", "source": slga_cog, "cog": str(tmp_path / "clay_cog.tiff")},
+        {
+            "name": "clay_masked",
+            "source": slga_cog,
+            "cog": str(tmp_path / "clay_masked_cog.tiff"),
+            "masked_tiff": str(tmp_path / "clay_masked.tiff"),
+        },
+        {"name": "missing", "source": str(tmp_path / "missing.tif"), "cog": str(tmp_path / "missing_cog.tiff")},
+    ]
+    stats_filename = str(tmp_path / "stats.json")
+    output = process_slga_layers(layers, pixel_area(50, 100, 80, 150), stats_filename=stats_filename)
+
+    assert set(output["results"]) == {"clay", "clay_masked"}
+    assert list(output["failed"]) == ["missing"] and output["failed"]["missing"].startswith("RasterioIOError")
+    assert output["stats"]["clay"] == output["stats"]["clay_masked"]
+    with open(stats_filename, encoding="utf-8") as f:
+        assert json.load(f) == output["stats"]
+    with rasterio.open(str(tmp_path / "clay_masked.tiff")) as src:
+        np.testing.assert_array_equal(src.read(1), output["results"]["clay"]["data"][0].filled(np.nan))
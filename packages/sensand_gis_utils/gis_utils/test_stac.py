@@ -0,0 +1,90 @@
+import itertools
+from types import SimpleNamespace
+
+import pystac
+import pytest
+from shapely.geometry import box, mapping
+
+from gis_utils import stac
+
+
+def make_item(item_id, bounds):
+    properties = {"start_datetime": "2020-01-01T00:00:00Z", "end_datetime": "2020-12-31T00:00:00Z"}
+    return pystac.Item(item_id, mapping(box(*bounds)), list(bounds), None, properties)
+
+
+class FakeClient:
+    def __init__(self, items):
+        self.items = items
+        self.searches = []
+        self.pages = 0
+
+    def search(self, bbox, collections, limit, max_items=None, **params):
+        self.searches.append(bbox)
+        self.params = params
+        found = [item.to_dict() for item in self.items if box(*item.bbox).intersects(box(*bbox))][:max_items]
+
+        def pages_as_dicts():
+            for start in range(0, len(found), limit):
+                self.pages += 1
+                yield {"type": "FeatureCollection", "features": found[start : start + limit]}
+
+        return SimpleNamespace(pages_as_dicts=pages_as_dicts)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    stac.clear_stac_cache()
+    fake = FakeClient(
+        [make_item("west", (116.0, -30.0, 116.5, -29.5)), make_item("east", (117.0, -30.0, 117.5, -29.5))]
+    )
+    opens = []
+    monkeypatch.setattr(stac.pystac_client.Client, "open", lambda url: opens.append(url) or fake)
+    fake.opens = opens
+    yield fake
+    stac.clear_stac_cache()
+
+
+def test_search_is_memoised_by_quantised_bbox(client):
+    url = "https://example.com/stac/"
+    items = stac.search_stac(url, [116.101, -29.9, 116.2, -29.8], ["dem"])
+    assert [item.id for item in items] == ["west"]
+    # a nearby bbox in the same grid cells reuses the search and the client
+    assert [item.id for item in stac.search_stac(url, [116.102, -29.9, 116.199, -29.8], ["dem"])] == ["west"]
+    assert len(client.opens) == 1 and len(client.searches) == 1
+    assert client.searches[0] == [116.1, -29.9, 116.2, -29.8]
+
+    stac.search_stac(url, [116.1, -29.9, 117.2, -29.8], ["dem"])
+    stac.search_stac(url, [116.1, -29.9, 116.2, -29.8], ["dem"], ttl=0, bbox_precision=1)
+    assert len(client.opens) == 1 and len(client.searches) == 3
+
+
+def test_static_items_need_no_requests(client):
+    dea = "https://explorer.sandbox.dea.ga.gov.au/stac"
+    dem = stac.search_stac(dea, [116.1, -29.9, 116.2, -29.8], ["ga_srtm_dem1sv1_0"])
+    assert [item.assets["dem"].href.rsplit("/", 1)[1] for item in dem] == ["dem1sv1_0.tif"]
+    assert stac.search_stac(dea + "/", [0, 0, 1, 1], ["ga_srtm_dem1sv1_0"]) == []
+
+    stac.register_static_items("https://example.com/stac", "fixed", client.items)
+    bbox = [117.1, -29.9, 117.2, -29.8]
+    items = stac.search_stac("https://example.com/stac/", bbox, "fixed", "2020-06-01", "2020-06-30")
+    assert [item.id for item in items] == ["east"]
+    assert stac.search_stac("https://example.com/stac/", bbox, "fixed", "2021-01-01", "2021-02-01") == []
+    assert client.opens == [] and client.searches == []
+    del stac.STATIC_ITEMS[("https://example.com/stac", "fixed")]
+
+
+def test_iter_stac_items_streams_pages():
+    client = FakeClient([make_item(f"scene{index}", (116.0, -30.0, 116.5, -29.5)) for index in range(50)])
+    bbox = [116.1, -29.9, 116.2, -29.8]
+
+    items = stac.iter_stac_items(client, bbox, ["s2"], query={"eo:cloud_cover": {"lt": 20}}, page_size=10)
+    assert [item.id for item in itertools.islice(items, 5)] == [f"scene{index}" for index in range(5)]
+    items.close()
+    # of the 5 pages only the consumed one, two prefetched and at most one waiting for the queue were requested
+    assert client.pages <= 4
+    assert client.params == {"query": {"eo:cloud_cover": {"lt": 20}}}
+
+    items = list(stac.iter_stac_items(client, bbox, ["s2"], max_items=25, page_size=10, as_dicts=True))
+    assert len(items) == 25 and items[-1]["id"] == "scene24"
+    assert len(stac.query_stac_api(client, bbox, ["s2"], limit=7)) == 50
@@ -0,0 +1,90 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import box, mapping
+
+from gis_utils.statistics import raster_statistics, zonal_statistics
+from gis_utils.visualisation import get_geotiff_statistics
+
+
+def pixel_box(row0, row1, col0, col1):
+    """Polygon covering rows row0:row1 and columns col0:col1 of the test rasters."""
+    return box(col0 * 30, -row1 * 30, col1 * 30, -row0 * 30)
+
+
+@pytest.fixture
+def raster(tmp_path, write_raster):
+    rng = np.random.default_rng(0)
+    data = np.stack([rng.gamma(2, 50, (200, 300)), rng.normal(0, 1, (200, 300))])
+    data[0, :30, :30] = -9999.0
+    data[1, -5:, :] = np.nan
+    path = str(tmp_path / "raster.tiff")
+    write_raster(path, data)
+    return path, data.astype("float32").astype("float64")
+
+
+def test_statistics_match_numpy(raster):
+    path, data = raster
+    percentiles = (5, 50, 95)
+    exact = raster_statistics(path, percentiles=percentiles, exact=True, max_pixels=4096)
+    approximate = raster_statistics(path, percentiles=percentiles, max_pixels=4096)
+
+    for band, values in zip((1, 2), data):
+        values = values[np.isfinite(values) & (values != -9999.0)]
+        stats = exact[band]
+        assert stats["count"] == len(values)
+        assert stats["min"] == values.min() and stats["max"] == values.max()
+        np.testing.assert_allclose(stats["mean"], values.mean())
+        np.testing.assert_allclose(stats["std"], values.std())
+        expected = np.percentile(values, percentiles)
+        np.testing.assert_allclose([stats[f"p{p}"] for p in percentiles], expected)
+        assert stats["median"] == stats["p50"]
+
+        bin_width = (values.max() - values.min()) / 4096
+        approximate_values = [approximate[band][f"p{p}"] for p in percentiles]
+        np.testing.assert_allclose(approximate_values, expected, atol=bin_width)
+
+
+def test_statistics_inside_geometry(raster):
+    path, data = raster
+    geometry = mapping(pixel_box(50, 100, 100, 200))
+    stats = raster_statistics(path, bands=[1], geoms=[geometry], exact=True)[1]
+    values = data[0, 50:100, 100:200]
+    assert stats["count"] == values.size
+    np.testing.assert_allclose(stats["mean"], values.mean())
+    np.testing.assert_allclose(stats["median"], np.median(values))
+
+
+def test_get_geotiff_statistics(raster):
+    path, data = raster
+    values = data[0][data[0] != -9999.0]
+    stats = get_geotiff_statistics(path)
+    assert set(stats) == {"min", "max", "mean", "median", "std"}
+    np.testing.assert_allclose(stats["median"], np.median(values))
+    np.testing.assert_allclose(stats["std"], values.std())
+
+
+def test_zonal_statistics_match_masks(raster):
+    path, data = raster
+    # the north paddock covers part of the nodata corner, the last one is off the raster
+    windows = {"north": (0, 50, 0, 100), "south": (120, 200, 150, 300)}
+    gdf = gpd.GeoDataFrame(
+        {"paddock": ["north", "south", "outside"]},
+        geometry=[pixel_box(*windows["north"]), pixel_box(*windows["south"]), pixel_box(-50, -10, 0, 10)],
+        crs="EPSG:3857",
+    )
+    edges = [0, 100, 200, 1000]
+    table = zonal_statistics(path, gdf, id_field="paddock", histogram_bins=edges, max_pixels=4096)
+
+    assert list(table["paddock"]) == ["north", "south", "outside"]
+    for paddock, (row0, row1, col0, col1) in windows.items():
+        values = data[0, row0:row1, col0:col1]
+        values = values[values != -9999.0]
+        row = table.set_index("paddock").loc[paddock]
+        assert row["count"] == len(values)
+        assert row["min"] == values.min() and row["max"] == values.max()
+        np.testing.assert_allclose(row["mean"], values.mean())
+        np.testing.assert_allclose(row["std"], values.std())
+        assert row["histogram"] == np.histogram(values, edges)[0].tolist()
+    outside = table.iloc[2]
+    assert outside["count"] == 0 and np.isnan(outside["mean"])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import rasterio
+
+from gis_utils.stratification import (
+    LABEL_NODATA,
+    MiniBatchKMeans,
+    StreamingStats,
+    compute_band_stats,
+    stratify_raster,
+)
+
+
+@pytest.fixture
+def two_zone_raster(tmp_path, write_raster):
+    """Left half around (0, 100), right half around (10, 300), with a nodata corner."""
+    rng = np.random.default_rng(1)
+    data = np.empty((2, 200, 256))
+    data[0, :, :128] = rng.normal(0, 0.5, (200, 128))
+    data[1, :, :128] = rng.normal(100, 5, (200, 128))
+    data[0, :, 128:] = rng.normal(10, 0.5, (200, 128))
+    data[1, :, 128:] = rng.normal(300, 5, (200, 128))
+    data[0, :20, :20] = -9999.0
+    path = write_raster(tmp_path / "cube.tiff", data)
+    return path, data
+
+
+def test_streaming_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.normal(5, 3, (10_000, 3))
+    stats = StreamingStats(3)
+    for block in np.array_split(values, 7):
+        stats.update(block)
+    assert stats.count == 10_000
+    np.testing.assert_allclose(stats.mean, values.mean(axis=0))
+    np.testing.assert_allclose(stats.std, values.std(axis=0))
+
+
+def test_band_stats_exclude_nodata(two_zone_raster):
+    path, data = two_zone_raster
+    stats = compute_band_stats(path, max_pixels=4096)
+    valid = data[0] != -9999.0
+    assert stats.count == valid.sum()
+    np.testing.assert_allclose(stats.mean, data[:, valid].mean(axis=1), rtol=1e-5)
+
+
+def test_minibatch_kmeans_separates_blobs():
+    rng = np.random.default_rng(0)
+    X = np.concatenate([rng.normal(-5, 0.3, (500, 2)), rng.normal(5, 0.3, (500, 2))])
+    model = MiniBatchKMeans(2, batch_size=128, seed=0).fit(X)
+    labels = model.predict(X, chunk_size=100)
+    assert len(set(labels[:500])) == 1
+    assert len(set(labels[500:])) == 1
+    assert labels[0] != labels[-1]
+
+
+def test_stratify_raster(tmp_path, two_zone_raster):
+    path, _ = two_zone_raster
+    output_path = str(tmp_path / "labels.tiff")
+    result = stratify_raster(path, output_path, n_clusters=2, n_samples=2000, seed=0)
+
+    assert 1500 < result["n_samples"] < 2500
+    with rasterio.open(output_path) as src:
+        labels = src.read(1)
+        assert src.nodata == LABEL_NODATA
+    assert (labels[:20, :20] == LABEL_NODATA).all()
+    assert set(np.unique(labels[20:, :128])) == {labels[100, 0]}
+    assert set(np.unique(labels[:, 128:])) == {labels[100, 255]}
+    assert labels[100, 0] != labels[100, 255]
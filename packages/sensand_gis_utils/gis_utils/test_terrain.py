@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from gis_utils.terrain import (
+    LOCAL_PRODUCTS,
+    TERRAIN_PRODUCTS,
+    flow_accumulation,
+    terrain_products,
+    terrain_tile,
+)
+
+
+def test_plane_slope_aspect_hillshade():
+    # rises 1 m per 10 m pixel to the east, so it faces (drains) west
+    dem = np.mgrid[0:7, 0:7][1] * 1.0
+    tile = terrain_tile(dem, 10.0, 10.0)
+    np.testing.assert_allclose(tile["slope"], np.degrees(np.arctan(0.1)), rtol=1e-6)
+    np.testing.assert_allclose(tile["aspect"], 270.0, rtol=1e-6)
+    np.testing.assert_allclose(tile["curvature"], 0.0, atol=1e-6)
+    # with the default north-west light, west facing slopes are brighter than flat ground, east facing darker
+    flat = terrain_tile(np.zeros((7, 7)), 10.0, 10.0)
+    east_facing = terrain_tile(-dem, 10.0, 10.0)
+    assert (flat["aspect"] == -1).all()
+    np.testing.assert_allclose(east_facing["aspect"], 90.0, rtol=1e-6)
+    assert (tile["hillshade"] > flat["hillshade"]).all()
+    assert (east_facing["hillshade"] < flat["hillshade"]).all()
+
+
+def test_curvature_sign():
+    rows, cols = np.mgrid[-3:4, -3:4]
+    hill = -(rows**2 + cols**2) * 1.0
+    assert (terrain_tile(hill, 10.0, 10.0)["curvature"] > 0).all()
+    assert (terrain_tile(-hill, 10.0, 10.0)["curvature"] < 0).all()
+
+
+def test_flow_accumulation_valley():
+    # V shaped valley along the middle column, sloping down to the south
+    rows, cols = np.mgrid[0:20, 0:9]
+    dem = np.abs(cols - 4) * 5.0 + (20 - rows) * 1.0
+    accumulation = flow_accumulation(dem, np.full((20, 1), 10.0), 10.0)
+    assert accumulation.sum() > dem.size
+    assert (np.diff(accumulation[:, 4]) > 0).all()
+    assert accumulation[-1, 4] == accumulation.max()
+    assert (accumulation[:, 0] == 1).all()
+
+
+def test_terrain_products_tiles_match_whole(tmp_path):
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[0:150, 0:130]
+    dem = 100 + 0.3 * rows + 5 * np.sin(cols / 10) + rng.normal(0, 0.2, rows.shape)
+    dem[:5, :5] = -9999
+    dem_path = str(tmp_path / "dem.tiff")
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": 130,
+        "height": 150,
+        "crs": "EPSG:4326",
+        "transform": from_origin(116.2, -29.2, 0.00027, 0.00027),
+        "nodata": -9999,
+    }
+    with rasterio.open(dem_path, "w", **profile) as dst:
+        dst.write(dem.astype("float32"), 1)
+
+    tiled = terrain_products(
+        dem_path, str(tmp_path / "tiled.tiff"), TERRAIN_PRODUCTS, tile_size=32, cog=False
+    )
+    whole = terrain_products(dem_path, str(tmp_path / "terrain_cog.tiff"), TERRAIN_PRODUCTS)
+    with rasterio.open(tiled) as a, rasterio.open(whole) as b:
+        assert a.descriptions == b.descriptions == TERRAIN_PRODUCTS
+        assert b.crs == a.crs and b.transform == a.transform
+        np.testing.assert_array_equal(a.read(), b.read())
+        slope = b.read(1)
+    assert np.isnan(slope[:5, :5]).all() and np.isnan(slope[5, 5])
+    assert np.isfinite(slope[10:, 10:]).all()
+
+
+def test_wetness_index_is_opt_in_and_bounded(tmp_path, write_raster):
+    dem_path = write_raster(tmp_path / "dem.tiff", np.add.outer(np.arange(100), np.arange(80)))
+    with rasterio.open(terrain_products(dem_path, str(tmp_path / "local.tiff"), cog=False)) as src:
+        assert src.descriptions == LOCAL_PRODUCTS
+
+    with pytest.raises(ValueError, match="twi_max_pixels"):
+        terrain_products(dem_path, str(tmp_path / "twi.tiff"), ("twi",), twi_max_pixels=100 * 79)
+    assert not (tmp_path / "twi.tiff").exists()
@@ -13,6 +13,7 @@ setup(
         "rioxarray==0.15.5",
         "rio-cogeo==5.3.0",
         "xarray==2024.5.0",
+        "dask",
         "geopandas==0.14.4",
         "pandas==2.2.2",
         "numpy",